@@ -0,0 +1,381 @@
+# Analyses a schedule of sections without the LLM, run with "python batch.py sections.csv results.csv".
+#
+# Every row of the input file (CSV, JSON or JSONL) describes one section: the name of a section
+# generator of tool_declaration.json in the "generator" column, its arguments (including the
+# optional mesh_size) in columns named like the parameters of the generator and, for a stress
+# analysis, the actions n, vx, vy, mxx, myy, m11, m22 and mzz. Actions can also be prefixed with
+# "action_", which is required if the generator has a parameter of the same name (e.g. "n" of the
+# circular hollow section). An optional "id" column names the rows, otherwise the row number is
+# used. Empty cells are treated as omitted arguments.
+#
+# The sections are analysed in a process pool and every result is appended to the output file
+# (CSV, JSONL or a Parquet dataset directory) as soon as it is available. Rows already analysed
+# successfully are skipped, so an interrupted run continues where it stopped when it is restarted.
+# Failed rows are analysed again and their new result is appended.
+
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from tool_handlers import default_registry
+from stress_analysis import ACTIONS, SHEAR_ACTIONS, STRESS_FIELDS
+from section_sweep import GEOMETRIC_PROPERTIES, PLASTIC_PROPERTIES, WARPING_PROPERTIES
+
+
+# analyses in the order they are run, the geometric analysis is always run
+BATCH_ANALYSES = ["geometric", "plastic", "warping", "stress"]
+STAGES = ["mesh"] + BATCH_ANALYSES
+OUTPUT_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+# number of results written per Parquet part file
+PARQUET_ROWS_PER_PART = 100
+
+
+def read_schedule(path: str) -> list:
+    """
+    Reads the rows of a schedule file, see the module comment for the layout.
+
+    Returns:
+        A list of (id, row) tuples, where row is a dict with the generator name and its arguments.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "r", newline="") as f:
+        if extension == ".csv":
+            rows = list(csv.DictReader(f))
+        elif extension == ".jsonl":
+            rows = [json.loads(line) for line in f if line.strip()]
+        elif extension == ".json":
+            rows = json.load(f)
+        else:
+            raise ValueError(f"Unknown schedule format '{extension}'. Valid formats are .csv, .json and .jsonl.")
+
+    schedule = []
+    for i, row in enumerate(rows, start=1):
+        # empty CSV cells are omitted arguments
+        row = {key: value for key, value in row.items() if value not in (None, "")}
+        schedule.append((str(row.pop("id", i)), row))
+    return schedule
+
+
+def prepare_row(registry, row: dict) -> tuple:
+    """
+    Splits a schedule row into the generator name, the validated generator arguments and the actions.
+    """
+    row = dict(row)
+    name = row.pop("generator", None)
+    if not name or not registry.is_generator(name):
+        raise ValueError(f"'{name}' is not one of the available section generators.")
+    parameters = registry.declaration(name)["parameters"]["properties"]
+    actions = {}
+    for key in ACTIONS:
+        if f"action_{key}" in row:
+            actions[key] = float(row.pop(f"action_{key}"))
+        elif key in row and key not in parameters:
+            actions[key] = float(row.pop(key))
+    # the arguments are checked and converted against the tool declaration, e.g. "310" to 310.0
+    args = registry.validate(name, row)
+    if args.pop("mesh_convergence", None):
+        raise ValueError("mesh_convergence is not supported in batch mode, please provide a mesh_size.")
+    # every section of a batch is meshed and analysed, the estimate option is not a generator argument
+    if args.pop("estimate", None):
+        raise ValueError("estimate is not supported in batch mode, the sections are always meshed and analysed.")
+    return name, args, actions
+
+
+def analyse_section(name: str, args: dict, actions: dict, analyses: list) -> dict:
+    """
+    Generates, meshes and analyses one section of the schedule. Runs in a worker process.
+
+    Args:
+        name: Name of the section generator in sectionproperties.pre.library.
+        args: The arguments of the generator including the optional mesh_size.
+        actions: The actions of the stress analysis, the stress analysis is skipped if empty.
+        analyses: The analyses to run, any of BATCH_ANALYSES.
+
+    Returns:
+        A dict with the mesh size and number of elements, the wall time of every stage in
+        seconds, all scalar section properties that have been calculated and the extrema of the
+        stress fields over all material groups.
+    """
+    import numpy as np
+    from sectionproperties.pre import library
+    from sectionproperties.analysis import Section
+    from mesh_sizing import characteristic_mesh_size
+    from stress_analysis import stress_extrema
+
+    result = {}
+    start = time.perf_counter()
+    args = dict(args)
+    mesh_size = args.pop("mesh_size", None)
+    geom = getattr(library, name)(**args)
+    if mesh_size is None:
+        mesh_size = characteristic_mesh_size(args, geom.calculate_area())
+    geom.create_mesh(mesh_sizes=mesh_size)
+    sec = Section(geometry=geom)
+    result.update({"mesh_size": float(mesh_size), "n_elements": len(sec.elements), "time_mesh": time.perf_counter() - start})
+
+    start = time.perf_counter()
+    sec.calculate_geometric_properties()
+    result["time_geometric"] = time.perf_counter() - start
+    if "plastic" in analyses:
+        start = time.perf_counter()
+        sec.calculate_plastic_properties()
+        result["time_plastic"] = time.perf_counter() - start
+    # a stress analysis with shear forces or torsion needs the warping analysis
+    if "warping" in analyses or ("stress" in analyses and any(actions.get(action) for action in SHEAR_ACTIONS)):
+        start = time.perf_counter()
+        sec.calculate_warping_properties()
+        result["time_warping"] = time.perf_counter() - start
+
+    for key in GEOMETRIC_PROPERTIES + PLASTIC_PROPERTIES + WARPING_PROPERTIES:
+        value = getattr(sec.section_props, key, None)
+        if isinstance(value, (int, float, np.floating)):
+            result[key] = float(value)
+
+    if "stress" in analyses and actions:
+        start = time.perf_counter()
+        groups = stress_extrema(sec, sec.calculate_stress(**actions))
+        for i, field in enumerate(STRESS_FIELDS.values()):
+            result[f"max_{field}"] = float(max(group["max"][i] for group in groups))
+            result[f"min_{field}"] = float(min(group["min"][i] for group in groups))
+        result["time_stress"] = time.perf_counter() - start
+    return result
+
+
+def result_columns(analyses: list) -> list:
+    columns = ["id", "generator", "args", "actions", "status", "error", "mesh_size", "n_elements"]
+    # the warping analysis also runs for stress analyses with shear forces or torsion
+    timed = ["mesh", "geometric", *analyses] + (["warping"] if "stress" in analyses else [])
+    columns += [f"time_{stage}" for stage in STAGES if stage in timed]
+    columns += GEOMETRIC_PROPERTIES
+    if "plastic" in analyses:
+        columns += PLASTIC_PROPERTIES
+    if "warping" in analyses or "stress" in analyses:
+        columns += WARPING_PROPERTIES
+    if "stress" in analyses:
+        columns += [f"{extremum}_{field}" for field in STRESS_FIELDS.values() for extremum in ["max", "min"]]
+    return columns
+
+
+def output_format(path: str) -> str:
+    extension = os.path.splitext(path.rstrip("/"))[1].lower()
+    if extension not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{extension}'. Valid formats are {list(OUTPUT_FORMATS)}.")
+    return OUTPUT_FORMATS[extension]
+
+
+def completed_ids(path: str) -> set:
+    """
+    Returns the ids of the rows analysed successfully according to the output file.
+
+    Failed rows are not included, so they are retried, e.g. after a crash of a worker. A line
+    that was only partly written when the previous run was interrupted is removed.
+    """
+    if not os.path.exists(path):
+        return set()
+    if output_format(path) == "parquet":
+        import pyarrow.parquet as pq
+        parts = [os.path.join(path, part) for part in os.listdir(path) if part.endswith(".parquet")]
+        rows = [pq.read_table(part, columns=["id", "status"]).to_pylist() for part in parts]
+        return {str(row["id"]) for part_rows in rows for row in part_rows if row["status"] == "success"}
+
+    with open(path, "rb+") as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+    with open(path, "r", newline="") as f:
+        if output_format(path) == "csv":
+            return {row["id"] for row in csv.DictReader(f) if row["status"] == "success"}
+        rows = [json.loads(line) for line in f if line.strip()]
+        return {str(row["id"]) for row in rows if row.get("status") == "success"}
+
+
+class ResultWriter:
+    """
+    Appends results to a CSV or JSONL file or to a directory of Parquet part files.
+
+    CSV and JSONL lines are flushed one by one, Parquet results are written in parts of
+    PARQUET_ROWS_PER_PART rows, so at most one part is lost if the run is interrupted.
+    """
+
+    def __init__(self, path: str, columns: list):
+        self.path = path
+        self.columns = columns
+        self.format = output_format(path)
+        self._rows = []
+        if self.format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise RuntimeError("Parquet output requires pyarrow, please install it or write CSV or JSONL.")
+            os.makedirs(path, exist_ok=True)
+            self._part = len([part for part in os.listdir(path) if part.endswith(".parquet")])
+            return
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="")
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=columns, extrasaction="ignore")
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, row: dict):
+        if self.format == "parquet":
+            self._rows.append(row)
+            if len(self._rows) >= PARQUET_ROWS_PER_PART:
+                self.flush_parquet()
+            return
+        if self.format == "csv":
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps({key: row.get(key) for key in self.columns if key in row}) + "\n")
+        self._file.flush()
+
+    def flush_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if not self._rows:
+            return
+        table = pa.table({column: [row.get(column) for row in self._rows] for column in self.columns})
+        pq.write_table(table, os.path.join(self.path, f"part-{self._part:05d}.parquet"))
+        self._part += 1
+        self._rows = []
+
+    def close(self):
+        if self.format == "parquet":
+            self.flush_parquet()
+        else:
+            self._file.close()
+
+
+def run_batch(schedule_path: str, output_path: str, analyses: list = None, workers: int = None, on_progress=None) -> dict:
+    """
+    Analyses all sections of a schedule and appends the results to the output file.
+
+    Args:
+        schedule_path: The schedule file, see the module comment.
+        output_path: The output file, its extension selects the format (.csv, .jsonl or .parquet).
+        analyses: The analyses to run, any of BATCH_ANALYSES (default: all).
+        workers: Number of worker processes (default: BATCH_WORKERS environment variable or number of CPUs).
+        on_progress: (Optional) Callback on_progress(statistics) called after every finished section.
+
+    Returns:
+        A dict with the number of analysed, failed and skipped sections, the throughput in
+        sections per second and the total and mean wall time of every stage.
+    """
+    analyses = analyses or BATCH_ANALYSES
+    unknown = [analysis for analysis in analyses if analysis not in BATCH_ANALYSES]
+    if unknown:
+        raise ValueError(f"Unknown analyses {unknown}. Valid analyses are {BATCH_ANALYSES}.")
+    workers = workers or int(os.getenv("BATCH_WORKERS", str(os.cpu_count() or 1)))
+    registry = default_registry()
+
+    done = completed_ids(output_path)
+    pending = [(row_id, row) for row_id, row in read_schedule(schedule_path) if row_id not in done]
+    writer = ResultWriter(output_path, result_columns(analyses))
+    statistics = {
+        "n_sections": len(pending), "n_analysed": 0, "n_failed": 0, "n_skipped": len(done),
+        "stage_time": {stage: 0.0 for stage in STAGES}, "stage_count": {stage: 0 for stage in STAGES},
+    }
+    start = time.perf_counter()
+
+    def finish(record: dict):
+        writer.write(record)
+        if record["status"] == "success":
+            statistics["n_analysed"] += 1
+        else:
+            statistics["n_failed"] += 1
+        for stage in STAGES:
+            if record.get(f"time_{stage}") is not None:
+                statistics["stage_time"][stage] += record[f"time_{stage}"]
+                statistics["stage_count"][stage] += 1
+        statistics["elapsed"] = time.perf_counter() - start
+        if on_progress:
+            on_progress(statistics)
+
+    try:
+        # workers are spawned rather than forked, see section_sweep.get_pool
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            rows = iter(pending)
+            futures = {}
+            while True:
+                # only a few rows per worker are in flight, so that results are written steadily
+                while len(futures) < 2 * workers and (item := next(rows, None)) is not None:
+                    row_id, row = item
+                    record = {"id": row_id, "generator": row.get("generator")}
+                    try:
+                        name, args, actions = prepare_row(registry, row)
+                    except Exception as e:
+                        finish({**record, "status": "error", "error": str(e)})
+                        continue
+                    record.update({"args": json.dumps(args), "actions": json.dumps(actions)})
+                    try:
+                        futures[pool.submit(analyse_section, name, args, actions, analyses)] = record
+                    except Exception as e:
+                        # e.g. BrokenProcessPool after a worker crashed, the row is retried by the next run
+                        finish({**record, "status": "error", "error": str(e)})
+                if not futures:
+                    break
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = futures.pop(future)
+                    try:
+                        finish({**record, "status": "success", **future.result()})
+                    except Exception as e:
+                        finish({**record, "status": "error", "error": str(e)})
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    processed = statistics["n_analysed"] + statistics["n_failed"]
+    return {
+        "n_sections": statistics["n_sections"],
+        "n_analysed": statistics["n_analysed"],
+        "n_failed": statistics["n_failed"],
+        "n_skipped": statistics["n_skipped"],
+        "elapsed": elapsed,
+        "sections_per_second": processed / elapsed if elapsed > 0 else 0.0,
+        "stages": {
+            stage: {
+                "count": statistics["stage_count"][stage],
+                "total_time": statistics["stage_time"][stage],
+                "mean_time": statistics["stage_time"][stage] / statistics["stage_count"][stage],
+            }
+            for stage in STAGES if statistics["stage_count"][stage]
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyses a schedule of sections without the LLM.")
+    parser.add_argument("schedule", help="Schedule file (.csv, .json or .jsonl) with a 'generator' column and the generator arguments.")
+    parser.add_argument("output", help="Output file (.csv, .jsonl or .parquet), rows already analysed successfully are skipped.")
+    parser.add_argument("--analyses", default=",".join(BATCH_ANALYSES), help=f"Comma separated analyses to run (default: {','.join(BATCH_ANALYSES)}).")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (default: BATCH_WORKERS or number of CPUs).")
+    parser.add_argument("--stats", help="Write the throughput and stage timing as JSON to this file.")
+    args = parser.parse_args()
+
+    last_report = [0.0]
+
+    def on_progress(statistics):
+        processed = statistics["n_analysed"] + statistics["n_failed"]
+        if statistics["elapsed"] - last_report[0] >= 5 or processed == statistics["n_sections"]:
+            last_report[0] = statistics["elapsed"]
+            print(f"{processed}/{statistics['n_sections']} sections ({statistics['n_failed']} failed), {processed / statistics['elapsed']:.2f} sections/s", file=sys.stderr)
+
+    result = run_batch(args.schedule, args.output, [analysis.strip() for analysis in args.analyses.split(",")], args.workers, on_progress)
+
+    print(f"{result['n_analysed']} sections analysed, {result['n_failed']} failed, {result['n_skipped']} skipped (already analysed in {args.output})")
+    print(f"{result['elapsed']:.2f} s, {result['sections_per_second']:.2f} sections/s")
+    for stage, timing in result["stages"].items():
+        print(f"{stage:<10} {timing['count']:6d} runs   total {timing['total_time']:9.2f} s   mean {timing['mean_time']:7.3f} s")
+    if args.stats:
+        with open(args.stats, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
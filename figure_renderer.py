@@ -0,0 +1,166 @@
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+FIGURE_FORMATS = ["png", "svg"]
+# fields of the stress results a stress plot can show
+STRESS_PLOT_FIELDS = ["sig_zz", "sig_zxy", "sig_vm", "sig_11", "sig_33"]
+
+
+def figure_format() -> str:
+    figure_format = os.getenv("FIGURE_FORMAT", "png").lower()
+    if figure_format not in FIGURE_FORMATS:
+        raise ValueError(f"Unknown FIGURE_FORMAT '{figure_format}'. Valid formats are {FIGURE_FORMATS}.")
+    return figure_format
+
+
+def stress_digest(stresses) -> str:
+    """
+    Creates a content hash of the stress results of all material groups.
+
+    Two StressPost objects with the same digest were calculated for the same section and actions,
+    so their plots are identical.
+    """
+    import numpy as np
+
+    digest = hashlib.sha256()
+    for group in stresses.material_groups:
+        digest.update(group.material.name.encode())
+        for field in STRESS_PLOT_FIELDS:
+            digest.update(np.ascontiguousarray(getattr(group.stress_result, field)).tobytes())
+    return digest.hexdigest()
+
+
+def render_figure(fig, figure_format: str = "png", dpi: int = 100, rasterize: bool = False) -> dict:
+    """
+    Renders a matplotlib figure to compressed image bytes.
+
+    Args:
+        fig: The matplotlib Figure.
+        figure_format: One of FIGURE_FORMATS.
+        dpi: The resolution of PNG images and of the rasterized artists of SVG images.
+        rasterize: If True, the plotted data (mesh lines, contours) is embedded as a raster image,
+            so that the size of SVG images does not grow with the number of elements.
+
+    Returns:
+        A dict with the "format" and the image "data" bytes.
+    """
+    if rasterize:
+        for ax in fig.axes:
+            for artist in [*ax.collections, *ax.lines]:
+                artist.set_rasterized(True)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=figure_format, dpi=dpi, bbox_inches="tight")
+    return {"format": figure_format, "data": buffer.getvalue()}
+
+
+class RenderCache:
+    """
+    Thread-safe LRU cache of rendered figures, bounded by the total size of the image bytes.
+
+    Every figure is drawn and rendered once in the tool worker thread that requests it. Later
+    requests of the same plot, e.g. from another session analysing the same section, get the
+    cached bytes without drawing anything.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20, figure_format: str = "png", dpi: int = 100, raster_elements: int = 5000):
+        self.max_bytes = max_bytes
+        self.figure_format = figure_format
+        self.dpi = dpi
+        self.raster_elements = raster_elements
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            figure = self._entries.get(key)
+            if figure is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return figure
+
+    def put(self, key, figure: dict):
+        size = len(figure["data"])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key)["data"])
+            self._entries[key] = figure
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted["data"])
+
+    def render(self, key, draw, n_elements: int = 0) -> dict:
+        """
+        Returns the rendered figure of a plot, drawing it on a cache miss.
+
+        Args:
+            key: The cache key identifying the plot, e.g. the section hash and the plot options.
+            draw: Callable draw(ax) drawing the plot on the given axes.
+            n_elements: The number of elements of the plotted mesh. Meshes with more than
+                raster_elements elements are rasterized.
+
+        Returns:
+            A dict with the "format" and the image "data" bytes, see render_figure.
+        """
+        from profiling import span
+
+        figure = self.get(key)
+        if figure is None:
+            # figures that are not attached to pyplot can be drawn in any thread
+            from matplotlib.figure import Figure
+            with span("plot", elements=n_elements):
+                ax = Figure(figsize=(4.8, 3.6)).subplots()
+                draw(ax)
+            with span("render", format=self.figure_format) as render_span:
+                figure = render_figure(ax.get_figure(), self.figure_format, self.dpi, n_elements > self.raster_elements)
+                render_span.set(bytes=len(figure["data"]))
+            self.put(key, figure)
+        return figure
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def render_cache_from_env() -> RenderCache:
+    """
+    Creates a RenderCache configured through the RENDER_CACHE_MB, FIGURE_FORMAT, FIGURE_DPI and FIGURE_RASTER_ELEMENTS environment variables.
+    """
+    return RenderCache(
+        max_bytes=int(float(os.getenv("RENDER_CACHE_MB", "64")) * 2**20),
+        figure_format=figure_format(),
+        dpi=int(os.getenv("FIGURE_DPI", "100")),
+        raster_elements=int(os.getenv("FIGURE_RASTER_ELEMENTS", "5000")),
+    )
+
+
+_default_render_cache = None
+_default_render_cache_lock = threading.Lock()
+
+
+def default_render_cache() -> RenderCache:
+    """
+    Returns the process-wide RenderCache shared by all sessions and tool worker threads.
+    """
+    global _default_render_cache
+    with _default_render_cache_lock:
+        if _default_render_cache is None:
+            _default_render_cache = render_cache_from_env()
+        return _default_render_cache
@@ -0,0 +1,145 @@
+import os
+import json
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # google.genai is only imported where history entries are created, see collapse_response
+    from google.genai import types
+
+
+# rough number of characters per token for the token estimates, Gemini averages about four
+CHARS_PER_TOKEN = 4
+# keys of tool results carrying large section property payloads, only the latest one is kept
+PAYLOAD_KEYS = ["section_properties"]
+# keys of tool results that are kept when an old tool response is collapsed
+SUMMARY_KEYS = ["status", "message"]
+# first line of the text entry that replaces dropped turns and the number of lines it keeps
+SUMMARY_HEADER = "Summary of the earlier conversation that was removed to save tokens:"
+MAX_SUMMARY_LINES = 40
+
+
+def content_tokens(content: "types.Content") -> int:
+    """
+    Estimates the number of tokens of one history entry.
+    """
+    return len(content.model_dump_json(exclude_none=True)) // CHARS_PER_TOKEN + 1
+
+
+def history_tokens(history: list) -> int:
+    return sum(content_tokens(content) for content in history)
+
+
+def is_user_prompt(content: "types.Content") -> bool:
+    # a turn starts with a user content holding text, tool results are user contents as well
+    return content.role == "user" and any(part.text for part in content.parts or [])
+
+
+def turn_starts(history: list) -> list:
+    return [i for i, content in enumerate(history) if is_user_prompt(content)]
+
+
+def collapse_response(part: "types.Part", reason: str) -> "types.Part":
+    """
+    Replaces a tool response by a compact summary keeping only its status and message.
+    """
+    from google.genai import types
+
+    response = part.function_response.response or {}
+    summary = {key: response[key] for key in SUMMARY_KEYS if key in response}
+    summary["note"] = reason
+    return types.Part.from_function_response(name=part.function_response.name, response=summary)
+
+
+def is_summary(content: "types.Content") -> bool:
+    return content.role == "user" and bool(content.parts) and (content.parts[0].text or "").startswith(SUMMARY_HEADER)
+
+
+def summarise_turns(contents: list) -> list:
+    """
+    Creates short summary lines of dropped turns from the user prompts and the tools called.
+    """
+    lines = []
+    for content in contents:
+        for part in content.parts or []:
+            if content.role == "user" and part.text:
+                lines.append(f"- User: {part.text[:200]}")
+            elif part.function_call:
+                lines.append(f"  - Tool called: {part.function_call.name}({json.dumps(part.function_call.args or {}, default=str)[:200]})")
+    return lines
+
+
+def compact_history(history: list, token_budget: int = None, keep_recent_turns: int = None) -> dict:
+    """
+    Bounds the conversation history in place.
+
+    Three steps are applied until the history fits into the token budget:
+
+    1. Only the latest tool response with a section property payload keeps the payload,
+       older payloads are superseded by it.
+    2. Tool responses of turns before the keep_recent_turns latest turns are collapsed to
+       their status and message.
+    3. The oldest turns are dropped and replaced by a short text summary.
+
+    Function calls and their responses always stay together, so the history remains valid.
+
+    Args:
+        history: The conversation history, a list of google.genai Content objects.
+        token_budget: (Optional) Maximum estimated number of tokens, defaults to the
+                      HISTORY_TOKEN_BUDGET environment variable or 30000.
+        keep_recent_turns: (Optional) Number of latest turns that are never collapsed, defaults
+                           to the HISTORY_KEEP_TURNS environment variable or 2.
+
+    Returns:
+        A dict with the estimated tokens before and after compaction and the number of
+        collapsed responses and dropped turns.
+    """
+    from google.genai import types
+
+    token_budget = token_budget or int(os.getenv("HISTORY_TOKEN_BUDGET", "30000"))
+    keep_recent_turns = keep_recent_turns or int(os.getenv("HISTORY_KEEP_TURNS", "2"))
+    tokens_before = history_tokens(history)
+    stats = {"tokens_before": tokens_before, "tokens_after": tokens_before, "collapsed_responses": 0, "dropped_turns": 0}
+
+    # 1. keep only the latest section property payload
+    latest_payload = None
+    for i, content in enumerate(history):
+        for j, part in enumerate(content.parts or []):
+            if part.function_response and any(key in (part.function_response.response or {}) for key in PAYLOAD_KEYS):
+                latest_payload = (i, j)
+    for i, content in enumerate(history):
+        for j, part in enumerate(content.parts or []):
+            if part.function_response and (i, j) != latest_payload and any(key in (part.function_response.response or {}) for key in PAYLOAD_KEYS):
+                content.parts[j] = collapse_response(part, "Section properties superseded by a later result.")
+                stats["collapsed_responses"] += 1
+
+    # 2. collapse the tool responses of old turns
+    starts = turn_starts(history)
+    if history_tokens(history) > token_budget and len(starts) > keep_recent_turns:
+        recent_start = starts[-keep_recent_turns]
+        for content in history[:recent_start]:
+            for j, part in enumerate(content.parts or []):
+                response = part.function_response.response if part.function_response else None
+                if response is not None and set(response) - set(SUMMARY_KEYS) - {"note"}:
+                    content.parts[j] = collapse_response(part, "Details removed from the history to save tokens.")
+                    stats["collapsed_responses"] += 1
+
+    # 3. drop the oldest turns and replace them by a summary, extending the summary of earlier compactions
+    summary_lines = []
+    if history and is_summary(history[0]):
+        summary_lines = history[0].parts[0].text.splitlines()[1:]
+    while history_tokens(history) > token_budget:
+        # the summary is a user prompt as well but is not counted as a turn
+        first = 2 if history and is_summary(history[0]) else 0
+        starts = [start for start in turn_starts(history) if start >= first]
+        if len(starts) <= keep_recent_turns:
+            break
+        summary_lines = (summary_lines + summarise_turns(history[first:starts[1]]))[-MAX_SUMMARY_LINES:]
+        del history[:starts[1]]
+        history[:0] = [
+            types.Content(role="user", parts=[types.Part(text="\n".join([SUMMARY_HEADER] + summary_lines))]),
+            types.Content(role="model", parts=[types.Part(text="Understood.")]),
+        ]
+        stats["dropped_turns"] += 1
+
+    stats["tokens_after"] = history_tokens(history)
+    return stats
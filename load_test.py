@@ -0,0 +1,189 @@
+# Load test of concurrent sessions, run with "python load_test.py --sessions 1,2,4,8".
+#
+# Every simulated session runs its own conversation through call_LLM of the Streamlit app in its
+# own thread, like the script threads of a Streamlit server: it keeps its own history and section
+# state and waits --think-time seconds between its turns. The model is replaced by an offline
+# backend (see model_backend.py), either the rule based stand-in answering DEFAULT_PROMPTS or the
+# replay of a transcript recorded with TRANSCRIPT_DIR. All sessions share the tool registry, the
+# tool worker threads, the solver pool and the caches of the process, so the test shows how many
+# concurrent sessions one container handles and whether the solver becomes the bottleneck.
+#
+# For every number of sessions the throughput, the turn latencies, the time spent in the solver
+# (meshing and analyses) and the time solver jobs waited in the queue of the solver pool are
+# reported. If the queue wait grows with the sessions, the solver workers are the bottleneck; if
+# the solver time per turn grows, the sessions compete for the CPU.
+
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+# the app is run without a Streamlit server
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+# the turns of every session, {d} is replaced by a depth that differs per session so that the
+# sessions analyse different sections unless --same-section is given
+DEFAULT_PROMPTS = [
+    "Generate an i section with d={d} and calculate all properties.",
+    "Calculate the stresses for Mxx = 50 kNm, Vy = 100 kN and N = -200 kN.",
+    "Plot the von mises stresses.",
+]
+# spans whose time is spent in the finite element solver
+SOLVER_STAGES = ["mesh", "geometric analysis", "warping analysis", "stress analysis"]
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def session_prompts(index: int, transcript: str = None, same_section: bool = False) -> list:
+    if transcript:
+        from scripted_client import load_transcript
+        return [turn["prompt"] for turn in load_transcript(transcript)]
+    return [prompt.format(d=310 if same_section else 300 + index) for prompt in DEFAULT_PROMPTS]
+
+
+def run_session(index: int, prompts: list, transcript: str = None, think_time: float = 0.0, start: threading.Barrier = None) -> list:
+    """
+    Runs the turns of one simulated session and returns the latency and stage times of every turn.
+    """
+    import main_streamlit
+    from profiling import span
+    from model_backend import create_client
+    from solver_pool import solver_session
+
+    client = create_client(backend="replay" if transcript else "rules", transcript=transcript)
+    config = main_streamlit.get_config()
+    history, tool_calls_log, token_log = [], [], []
+    sec = geom = stresses = None
+    turns = []
+    if start:
+        start.wait()
+    for turn, prompt in enumerate(prompts, start=1):
+        offset = len(history)
+        with span("turn", session=index, turn=turn) as turn_span, solver_session(f"load-{index}"):
+            history, sec, geom, stresses, figures = asyncio.run(main_streamlit.call_LLM(
+                client, "offline", config, prompt, history, tool_calls_log, None, sec, geom, stresses, None, token_log
+            ))
+        times = {"model": 0.0, "tools": 0.0, "solver": 0.0, "solver_cpu": 0.0, "queue_wait": 0.0}
+        for _, item in turn_span.walk():
+            if item.name == "model call":
+                times["model"] += item.wall_time
+            elif item.name.startswith("tool "):
+                times["tools"] += item.wall_time
+            elif item.name in SOLVER_STAGES:
+                times["solver"] += item.wall_time
+                times["solver_cpu"] += item.cpu_time
+                times["queue_wait"] += item.attributes.get("queue_wait", 0.0)
+        errors = [
+            part.function_response.response.get("message")
+            for content in history[offset:] for part in content.parts or []
+            if part.function_response and part.function_response.response.get("status") != "success"
+        ]
+        turns.append({"session": index, "turn": turn, "latency": turn_span.wall_time, "errors": errors, **times})
+        if think_time:
+            time.sleep(think_time)
+    return turns
+
+
+def run_load(sessions: int, transcript: str = None, think_time: float = 0.0, same_section: bool = False) -> dict:
+    """
+    Runs the given number of sessions concurrently and summarises their turns.
+    """
+    start = threading.Barrier(sessions)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        futures = [
+            executor.submit(run_session, index, session_prompts(index, transcript, same_section), transcript, think_time, start)
+            for index in range(sessions)
+        ]
+        turns = [turn for future in futures for turn in future.result()]
+    elapsed = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+
+    latencies = [turn["latency"] for turn in turns]
+    return {
+        "sessions": sessions,
+        "turns": len(turns),
+        "failed_turns": sum(1 for turn in turns if turn["errors"]),
+        "errors": sorted({error for turn in turns for error in turn["errors"]}),
+        "elapsed": elapsed,
+        "throughput": len(turns) / elapsed,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_max": max(latencies),
+        "model_per_turn": sum(turn["model"] for turn in turns) / len(turns),
+        "solver_per_turn": sum(turn["solver"] for turn in turns) / len(turns),
+        "solver_share": sum(turn["solver"] for turn in turns) / sum(latencies),
+        "queue_wait_per_turn": sum(turn["queue_wait"] for turn in turns) / len(turns),
+        # share of all CPUs used by the process and by the solver during the run
+        "cpu_utilisation": cpu_time / (elapsed * (os.cpu_count() or 1)),
+        "solver_cpu_utilisation": sum(turn["solver_cpu"] for turn in turns) / (elapsed * (os.cpu_count() or 1)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drives concurrent simulated sessions through the app with an offline model backend.")
+    parser.add_argument("--sessions", default="1,2,4,8", help="Comma separated numbers of concurrent sessions (default: 1,2,4,8).")
+    parser.add_argument("--transcript", help="Replay this transcript (recorded with TRANSCRIPT_DIR) instead of the rule based prompts.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds every session waits between its turns (default: 0).")
+    parser.add_argument("--same-section", action="store_true", help="All sessions analyse the same section, so they share cached results.")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the section and render caches and the background analyses, every turn solves and renders.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        # background analyses would be solved twice without the cache holding their results
+        os.environ.update({"SECTION_CACHE_SIZE": "0", "SECTION_CACHE_DIR": "", "RENDER_CACHE_MB": "0", "SPECULATIVE_ANALYSES": ""})
+    sessions = [int(value) for value in args.sessions.split(",")]
+
+    from tool_handlers import default_registry
+    from section_cache import default_cache
+    from solver_pool import default_solver_pool
+
+    # the first session imports the analysis stack, it is not measured
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_session(-1, session_prompts(-1, args.transcript, args.same_section), args.transcript)
+
+    results = []
+    print(f"{'sessions':>8} {'turns':>6} {'failed':>6} {'turns/s':>8} {'p50 [s]':>8} {'p95 [s]':>8} {'max [s]':>8} {'solver/turn [s]':>16} {'solver share':>13} {'queue/turn [s]':>15} {'cpu':>6}")
+    for count in sessions:
+        # the log lines of the app are not part of the load test output
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_load(count, args.transcript, args.think_time, args.same_section)
+        results.append(result)
+        print(
+            f"{result['sessions']:>8} {result['turns']:>6} {result['failed_turns']:>6} {result['throughput']:>8.2f} {result['latency_p50']:>8.2f} "
+            f"{result['latency_p95']:>8.2f} {result['latency_max']:>8.2f} {result['solver_per_turn']:>16.2f} {result['solver_share']:>13.0%} {result['queue_wait_per_turn']:>15.2f} {result['cpu_utilisation']:>6.0%}"
+        )
+        for error in result["errors"]:
+            print(f"  error: {error}", file=sys.stderr)
+
+    print(f"Section cache: {default_cache().stats()}")
+    print(f"Tool statistics: {default_registry().stats()}")
+    print(f"Solver statistics: {default_solver_pool().stats()}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "cpus": os.cpu_count(),
+                "tool_workers": os.getenv("TOOL_WORKERS"),
+                "solver_workers": default_solver_pool().workers,
+                "backend": "replay" if args.transcript else "rules",
+                "think_time": args.think_time,
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,86 @@
 import os
-import json
-import numpy as np
+import uuid
 from dotenv import load_dotenv
 
-from google import genai
 from google.genai import types
 from google.genai.types import GenerateContentConfig
 
-from sectionproperties.pre.library import circular_hollow_section, elliptical_hollow_section, rectangular_hollow_section, polygon_hollow_section, i_section, mono_i_section, tapered_flange_i_section, channel_section, tapered_flange_channel, tee_section, angle_section, cee_section, zed_section, box_girder_section, bulb_section
-from sectionproperties.analysis import Section
-
-
-with open("tool_declaration.json", 'r') as f:
-    tools = json.load(f)
-
-# If you want to skip non-serializable objects (not just ndarrays)
-class SelectiveEncoder(json.JSONEncoder):
-    def default(self, obj):
-        try:
-            # Try to serialize the object normally
-            return json.JSONEncoder.default(self, obj)
-        except TypeError:
-            # If it's not serializable, skip it
-            return None 
-      
-# If you want to skip non-serializable objects (not just ndarrays)
-class ConversionEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        try:
-            # Try to serialize the object normally
-            return json.JSONEncoder.default(self, obj)
-        except TypeError:
-            # If it's not serializable and not an ndarray, skip it
-            return None
-
-def call_function(function_name: str, object_name: str = None, **kwargs) -> str:
-    """
-    Creates a string representation of a function or method call with keyword arguments.
+from section_cache import default_cache
+from tool_handlers import default_registry
+from history_manager import compact_history
+from profiling import span, timing_rows
+from model_backend import create_client, model_backend, save_turn
+from model_client import default_client_pool
+from solver_pool import default_solver_pool
+from tool_selector import MALFORMED_FUNCTION_CALL, default_tool_selector, is_selection_error
+
+
+section_cache = default_cache()
+# the tool registry binds the declared tools to their handlers
+registry = default_registry()
+# selects the tool declarations sent with every model request, see TOOL_SELECTION
+tool_selector = default_tool_selector()
+
+
+def new_pyplot_axes():
+    # pyplot is only imported once the first plot is drawn
+    import matplotlib.pyplot as plt
+    return plt.subplots()[1]
+
 
-    Args:
-        function_name: The name of the function or method as a string.
-        object_name: (Optional) The name of the object if calling a method.
-                     If provided, the call will be formatted as "object_name.function_name(...)".
-        **kwargs: Arbitrary keyword arguments to be included in the function/method call.
+def show_pyplot_figures():
+    import matplotlib.pyplot as plt
+    plt.draw()
+    plt.pause(0.001)
 
-    Returns:
-        A string representing the function or method call,
-        e.g., "my_function(arg1=10, name='test')" or "my_object.my_method(param=True)".
+
+def generate(client, model_id, config, history, token_log, selection):
+    """
+    Bounds the history to the token budget and requests the next model response.
+
+    The request carries the selected tools, see ToolSelector.select. A request with a pruned set
+    of tools whose response tries to call a tool that was not sent, or that is rejected as
+    invalid, is sent again with all tools. The prompt tokens reported by the model (or the estimated history tokens)
+    are appended to token_log.
     """
-    # Format the keyword arguments into a string
-    kwargs_str = []
-    for key, value in kwargs.items():
-        if isinstance(value, str):
-            # Enclose string values in single quotes
-            kwargs_str.append(f"{key}='{value}'")
-        else:
-            # For non-string values, use their direct string representation
-            kwargs_str.append(f"{key}={value}")
-
-    # Join the formatted keyword arguments with commas
-    params_string = ", ".join(kwargs_str)
-
-    # Prepend the object name if it's provided
-    if object_name:
-        full_function_call = f"{object_name}.{function_name}({params_string})"
-    else:
-        full_function_call = f"{function_name}({params_string})"
-    return full_function_call
+    with span("model call", model=model_id) as model_span:
+        compaction = compact_history(history)
+        while True:
+            try:
+                response = client.models.generate_content(
+                    model=model_id,
+                    config=tool_selector.config(config, selection),
+                    contents=history
+                )
+                if not selection["pruned"] or not response.candidates or response.candidates[0].finish_reason != MALFORMED_FUNCTION_CALL:
+                    break
+                reason = "the model called a tool that was not sent"
+            except Exception as e:
+                if not selection["pruned"] or not is_selection_error(e):
+                    raise
+                reason = f"the request was rejected ({e})"
+            print(f"{"\033[90m"}logger: Sending the request again with all tools, {reason}{"\033[0m"}\n")
+            selection = tool_selector.fallback("fallback")
+        prompt_tokens = response.usage_metadata.prompt_token_count if response.usage_metadata else None
+        model_span.set(
+            prompt_tokens=prompt_tokens,
+            output_tokens=response.usage_metadata.candidates_token_count if response.usage_metadata else None,
+            history_tokens=compaction["tokens_after"],
+            tools=len(selection["names"]),
+            tool_selection=selection["reason"],
+            tool_tokens_saved=selection["saved_tokens"],
+        )
+    token_log.append(prompt_tokens or compaction["tokens_after"])
+    print(f"{"\033[90m"}logger: Prompt tokens: {prompt_tokens}, history tokens (estimated): {compaction['tokens_before']} -> {compaction['tokens_after']} ({compaction['collapsed_responses']} tool responses collapsed, {compaction['dropped_turns']} turns summarised), tools: {len(selection['names'])} ({selection['reason']}, {selection['saved_tokens']} tokens saved){"\033[0m"}\n")
+    return response
 
 
 def call_LLM(client, model_id, config, user_prompt, history, sec=None, geom=None, stresses=None):
 
     history.append(types.Content(role="user", parts=[types.Part(text=user_prompt)]))
+    token_log = []
 
-    response = client.models.generate_content(
-        model=model_id,
-        config=config,
-        contents=history
-    )
+    response = generate(client, model_id, config, history, token_log, tool_selector.select(user_prompt, history, sec is not None or geom is not None))
 
     # Collect all function calls in this turn
     while response:
@@ -97,104 +98,15 @@ def call_LLM(client, model_id, config, user_prompt, history, sec=None, geom=None
             # Call the tool with arguments
             print(f"{"\033[90m"}logger: Calling tool {function_call.name} with args: {function_call.args}{"\033[0m"}\n")
 
-            # For functions in the current global scope:
-            if function_call.name in globals():
-                func_obj = globals()[function_call.name]    
-                srcmodule = func_obj.__module__ #module where the function is defined
-            else:    
-                srcmodule = None
-
-            if srcmodule == "sectionproperties.pre.library.steel_sections":
-                try:
-                    ele_size = 10
-                    geom = eval(call_function(function_call.name, **function_call.args))
-                    geom.create_mesh(mesh_sizes=ele_size)
-                    sec = Section(geometry=geom)
-                    sec.plot_mesh(materials=False, pause = False)
-                    tool_result = {
-                        "status": "success",
-                        "message": f"Geometry of the section generated and meshed successfully. A default element size of {ele_size} mm was used.",
-                        "next_steps_suggestion": "Would you like to evaluate the section properties or perform a stress analysis?"
-                    }
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-            elif function_call.name == "calculate_geometric_properties":
-                try:
-                    eval(call_function(function_call.name, "sec", **function_call.args))
-                    tool_result = {
-                        "status": "success",
-                        "message": f"Geometric section properties have been calculated successfully.",
-                        "section_properties": json.dumps(sec.section_props.__dict__, indent=4, cls=SelectiveEncoder),
-                        "next_steps_suggestion": "Would you like to calculate warping properties or perform a stress analysis?"
-                    }            
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-            elif function_call.name == "calculate_warping_properties":
-                try:
-                    eval(call_function(function_call.name, "sec", **function_call.args))
-                    tool_result = {
-                        "status": "success",
-                        "message": f"Warping properties of the section have been calculated successfully.",
-                        "warping_properties": json.dumps(sec.section_props.__dict__, indent=4, cls=SelectiveEncoder),
-                        "next_steps_suggestion": "Would you like to continue with a stress analysis?"
-                    }
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-            elif function_call.name == "calculate_stress":
-                try:
-                    stresses = eval(call_function(function_call.name, "sec", **function_call.args))
-                    tool_result = {
-                        "status": "success",
-                        "message": f"Section stresses have been calculated successfully.",
-                        "max_axial_stress": stresses.material_groups[0].stress_result.sig_zz.max(),
-                        "max_shear_stress": stresses.material_groups[0].stress_result.sig_zxy.max(),
-                        "max_von_mises_stress": stresses.material_groups[0].stress_result.sig_vm.max(),
-                        "min_axial_stress": stresses.material_groups[0].stress_result.sig_zz.min(),
-                        "min_shear_stress": stresses.material_groups[0].stress_result.sig_zxy.min(),
-                        "min_von_mises_stress": stresses.material_groups[0].stress_result.sig_vm.min(),
-#                        "axial_stresses": json.dumps(stresses.material_groups[0].stress_result.sig_zz, indent=4, cls=ConversionEncoder),
-#                        "shear_stresses": json.dumps(stresses.material_groups[0].stress_result.sig_zxy, indent=4, cls=ConversionEncoder),
-#                        "von_mises_stresses": json.dumps(stresses.material_groups[0].stress_result.sig_vm, indent=4, cls=ConversionEncoder),
-                        "next_steps_suggestion": "Would you like to view the stress results? I could plot the Axial, Shear or von Mises stresses for you.",
-                    }
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-            elif function_call.name == "plot_stress":
-                try:
-                    eval(call_function(function_call.name, "stresses", **function_call.args, normalize=False, pause = False))
-                    tool_result = {
-                        "status": "success",
-                        "message": f"Plot of {function_call.args.get('plot_type')} stresses generated.",
-                        "plot_description": "A plot of the stresses over the section.",
-                        "caption_suggestion": "Here's the section stress plot.",
-                    }
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-            # elif function_call.name == "GoogleSearch":
-            #     search_response = client.models.generate_content(
-            #         model=model_id,
-            #         config = GenerateContentConfig(
-            #             system_instruction="Perform an online search on basic section dimensions for standard steel sections in the web and output them in a structured way.",
-            #             tools=[types.Tool(google_search=types.GoogleSearch())],                               
-            #             ),
-            #         contents=history
-            #         )
-            #     tool_result = search_response.candidates[0].content.parts[0].text
+            tool_result, outputs = registry.dispatch(function_call.name, function_call.args, {
+                "sec": sec, "geom": geom, "stresses": stresses,
+                # plots are shown in non-blocking pyplot windows
+                "new_axes": new_pyplot_axes,
+                "report_progress": lambda message: print(f"{"\033[90m"}logger: {function_call.name}: {message}{"\033[0m"}"),
+            })
+            sec, geom, stresses = outputs.get("sec", sec), outputs.get("geom", geom), outputs.get("stresses", stresses)
+            if outputs.get("figures"):
+                show_pyplot_figures()
 
             function_response_part = types.Part.from_function_response(
                 name=function_call.name,
@@ -206,10 +118,10 @@ def call_LLM(client, model_id, config, user_prompt, history, sec=None, geom=None
 
         if function_response_parts:
             history.append(types.Content(role="user", parts=function_response_parts))
-            response = client.models.generate_content(
-                model=model_id, config=config, contents=history
-            )
+            # the tools are selected again for the new section and stresses
+            response = generate(client, model_id, config, history, token_log, tool_selector.select(user_prompt, history, sec is not None or geom is not None))
 
+    print(f"{"\033[90m"}logger: Prompt tokens sent this turn: {sum(token_log)} in {len(token_log)} model calls{"\033[0m"}\n")
     return history, sec if 'sec' in locals() else None, geom if 'geom' in locals() else None, stresses if 'stresses' in locals() else None
 
 
@@ -217,7 +129,9 @@ def main():
     # create client
     load_dotenv()  # take environment variables from .env.
     api_key = os.getenv("GEMINI_API_KEY","xxx")    
-    client = genai.Client(api_key=api_key)
+    # MODEL_BACKEND selects the Gemini API or an offline stand-in, see model_backend.py
+    client = create_client(api_key)
+    session_id = uuid.uuid4().hex
 
     # Define the model you are going to use
     model_id =  "gemini-2.0-flash"
@@ -226,7 +140,7 @@ def main():
     # Generation Config
     config = GenerateContentConfig(
         system_instruction="You are a helpful assistant that uses specific functions to analyse sections. If a suitable function is found but not all required parameters are provided, ask the user for the missing parameters or propose defaults. Also describe the function you are going to use. If a function call was detected, always provide text output to the user based on the function response.",
-        tools=[{"function_declarations": tools}],
+        tools=[{"function_declarations": registry.declarations}],
     )
 
     # example prompts 
@@ -252,9 +166,18 @@ def main():
         user_prompt = input(f"{"\033[92m"}user: ")
         print(f"{"\033[0m"}{"\033[0m"}")
         if user_prompt == "q" or user_prompt == "quit" or user_prompt == "exit":
+            print(f"{"\033[90m"}logger: Section cache statistics: {section_cache.stats()}{"\033[0m"}\n")
+            print(f"{"\033[90m"}logger: Tool statistics: {registry.stats()}{"\033[0m"}\n")
+            print(f"{"\033[90m"}logger: Solver statistics: {default_solver_pool().stats()}{"\033[0m"}\n")
+            if model_backend() == "gemini":
+                print(f"{"\033[90m"}logger: Model API statistics: {default_client_pool().stats()}{"\033[0m"}\n")
             print(f"{"\033[94m"}model: Exiting the app. Goodbye!{"\033[0m"}\n")
             break
-        history, sec, geom, stresses = call_LLM(client, model_id, config, user_prompt, history, sec, geom, stresses)
+        with span("turn") as turn_span:
+            history, sec, geom, stresses = call_LLM(client, model_id, config, user_prompt, history, sec, geom, stresses)
+        save_turn(session_id, history)
+        for row in timing_rows(turn_span):
+            print(f"{"\033[90m"}logger: {row['stage']:<36} {row['wall [s]']:8.3f} s  cpu {row['cpu [s]']:8.3f} s  {row['details']}{"\033[0m"}")
         print(f"{"\033[94m"}model: {history[-1].parts[0].text}{"\033[0m"}")  # Print the latest response from the model
 
 if __name__ == "__main__":
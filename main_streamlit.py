@@ -1,283 +1,435 @@
 # to run this script properly, enter "streamlit run main_streamlit.py" in the command line
 
-import time, json
-from xmlrpc import client
-import numpy as np
+import os, time, uuid, asyncio
 import streamlit as st
-from matplotlib.figure import Figure
-
-from google import genai
-from google.genai import types
-from google.genai.types import GenerateContentConfig
-
-from sectionproperties.pre.library import circular_hollow_section, elliptical_hollow_section, rectangular_hollow_section, polygon_hollow_section, i_section, mono_i_section, tapered_flange_i_section, channel_section, tapered_flange_channel, tee_section, angle_section, cee_section, zed_section, box_girder_section, bulb_section
-from sectionproperties.analysis import Section
-
-
-with open("tool_declaration.json", 'r') as f:
-    tools = json.load(f)
-
-# If you want to skip non-serializable objects (not just ndarrays)
-class SelectiveEncoder(json.JSONEncoder):
-    def default(self, obj):
-        try:
-            # Try to serialize the object normally
-            return json.JSONEncoder.default(self, obj)
-        except TypeError:
-            # If it's not serializable, skip it
-            return None 
-      
-# If you want to skip non-serializable objects (not just ndarrays)
-class ConversionEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.ndarray):
-            return obj.tolist()
-        try:
-            # Try to serialize the object normally
-            return json.JSONEncoder.default(self, obj)
-        except TypeError:
-            # If it's not serializable and not an ndarray, skip it
-            return None
-
-def call_function(function_name: str, object_name: str = None, **kwargs) -> str:
+
+from section_cache import default_cache
+from figure_renderer import default_render_cache
+from tool_executor import execute_tool_calls_async
+from tool_handlers import default_registry
+from history_manager import compact_history
+from profiling import span, timing_rows
+from model_backend import create_client, model_backend, save_turn
+from solver_pool import default_solver_pool, solver_session
+from section_store import SHORT_ID_LENGTH, SectionNotFound, default_section_store, stored_session
+
+# google.genai and the analysis stack are imported on first use, so that the first page is
+# rendered without waiting for them. Streamlit re-executes this script on every interaction,
+# the resources below are created once per server process.
+
+# maximum size of the rendered figures kept in the messages of one session
+SESSION_FIGURE_BYTES = int(float(os.getenv("SESSION_FIGURE_MB", "16")) * 2**20)
+REMOVED_FIGURE_MESSAGE = "_An older plot was removed from this session to save memory. Ask me to plot it again._"
+# "adaptive" spreads streamed text over its words for a typing effect, "off" shows every chunk as it arrives
+STREAM_PACING = os.getenv("STREAM_PACING", "off")
+STREAM_WORD_DELAY = float(os.getenv("STREAM_WORD_DELAY", "0.02"))
+STREAM_MAX_DELAY = float(os.getenv("STREAM_MAX_DELAY", "1.0"))
+# number of turns whose timing is kept for the timing panel
+MAX_TRACES = 10
+
+
+@st.cache_resource
+def get_registry():
+    # the tool registry binds the declared tools to their handlers
+    return default_registry()
+
+
+@st.cache_resource
+def get_tool_selector():
+    # selects the tool declarations sent with every model request, see TOOL_SELECTION
+    from tool_selector import default_tool_selector
+    return default_tool_selector()
+
+
+@st.cache_resource
+def get_solver_pool():
+    # the finite element solves of all sessions are queued in one pool of solver workers
+    return default_solver_pool()
+
+
+@st.cache_resource
+def get_speculator():
+    # runs the likely next analyses of a new section in the background while the model replies
+    from speculation import default_speculator
+    return default_speculator()
+
+
+@st.cache_resource
+def get_section_store():
+    # analysed sections are saved to disk if SECTION_STORE_DIR is set, None otherwise
+    return default_section_store()
+
+
+@st.cache_resource
+def get_client_pool():
+    # the synchronous client is thread-safe and not bound to an event loop, so one client per
+    # API key and its HTTP connections are shared by all sessions, turns and reruns
+    from model_client import default_client_pool
+    return default_client_pool()
+
+
+def get_client(api_key):
+    return get_client_pool().get(api_key)
+
+
+@st.cache_resource
+def get_config():
+    from google.genai.types import GenerateContentConfig
+    return GenerateContentConfig(
+        system_instruction="You are a helpful assistant that uses specific functions to analyse sections. If a suitable function is found but not all required parameters are provided, ask the user for the missing parameters or propose defaults. Never blindly guess parameters and move forward without confirmation. Also describe the function you are going to use. If a function call was detected, always provide text output to the user based on the function response.",
+        tools=[{"function_declarations": get_registry().declarations}],
+    )
+
+
+def render_cache_stats(cache_stats_placeholder):
+    stats = default_cache().stats()
+    render_stats = default_render_cache().stats()
+    cache_stats_placeholder.caption(
+        f"Section cache: {stats['hits'] + stats['disk_hits']} hits ({stats['disk_hits']} from disk), {stats['misses']} misses, {stats['entries']}/{stats['max_entries']} entries. "
+        f"Figure cache: {render_stats['hits']} hits, {render_stats['misses']} renders, {render_stats['bytes'] / 2**20:.1f}/{render_stats['max_bytes'] / 2**20:.0f} MB. "
+        f"{solver_stats_text(get_solver_pool().stats())}"
+        f"{speculation_stats_text(get_speculator().stats())}"
+        f"{store_stats_text(get_section_store())}"
+        f"{model_stats_text(get_client_pool()) if model_backend() == 'gemini' else ''}"
+    )
+
+
+def store_stats_text(store):
+    if store is None:
+        return ""
+    stats = store.stats()
+    return f". Section store: {stats['saved']} saves, {stats['loaded']} reopened, sections of {stats['in_memory']}/{stats['sessions']} sessions in memory"
+
+
+def model_stats_text(pool):
+    stats = pool.stats()
+    return (
+        f". Model API: {stats['requests']} requests, {stats['retries']} retries, {stats['failed']} failed, "
+        f"{stats['queue_wait']:.1f} s rate limited, clients: {stats['hits']} reused, {stats['misses']} created"
+        + (f", {stats['hedge_wins']}/{stats['hedged']} hedges won" if stats["hedged"] else "")
+    )
+
+
+def solver_stats_text(stats):
+    waits = ", ".join(f"{kind} {wait['mean_wait']:.2f} s" for kind, wait in stats["wait"].items())
+    return (
+        f"Solver: {stats['running']}/{stats['workers']} workers busy, {stats['queued']} jobs queued, {stats['utilisation']:.0%} utilisation"
+        + (f", mean queue wait: {waits}" if waits else "")
+        + (f", {stats['rejected']} jobs rejected" if stats["rejected"] else "")
+    )
+
+
+def speculation_stats_text(stats):
+    if not stats["started"]:
+        return ""
+    return (
+        f". Background analyses: {stats['completed']} completed in {stats['solver_time']:.1f} s, "
+        f"{stats['cancelled']} cancelled, {stats['skipped']} skipped"
+    )
+
+
+def show_figure(figure):
+    # figures are rendered to image bytes by the tools, nothing is re-rasterised on a rerun
+    if figure["format"] == "svg":
+        st.image(figure["data"].decode())
+    else:
+        st.image(figure["data"])
+
+
+def store_figures(messages, figures, max_bytes=SESSION_FIGURE_BYTES):
+    """
+    Appends figure messages and replaces the oldest figures of the session by a note once their
+    total size exceeds max_bytes.
+    """
+    for figure in figures:
+        messages.append({"role": "assistant", "type": "figure", "content": figure})
+    total_bytes = sum(len(message["content"]["data"]) for message in messages if message["type"] == "figure")
+    for message in messages:
+        if total_bytes <= max_bytes:
+            break
+        if message["type"] == "figure":
+            total_bytes -= len(message["content"]["data"])
+            message.update({"type": "text", "content": REMOVED_FIGURE_MESSAGE})
+
+
+def render_token_stats(token_stats_placeholder):
+    token_log = st.session_state.get("token_log", [])
+    if not token_log:
+        return
+    last_turn = [entry for entry in token_log if entry["turn"] == token_log[-1]["turn"]]
+    prompt_tokens = sum(entry["prompt_tokens"] or entry["history_tokens"] for entry in last_turn)
+    total_tokens = sum(entry["prompt_tokens"] or entry["history_tokens"] for entry in token_log)
+    token_stats_placeholder.caption(
+        f"Prompt tokens: {prompt_tokens} in the last turn ({len(last_turn)} model calls), {total_tokens} this session. "
+        f"History: {last_turn[-1]['history_tokens']} tokens (estimated), {sum(e['collapsed_responses'] for e in token_log)} tool responses collapsed, {sum(e['dropped_turns'] for e in token_log)} turns summarised. "
+        f"{tool_selection_text(last_turn, token_log)}"
+    )
+
+
+def tool_selection_text(last_turn, token_log):
+    sent = "/".join(str(entry["tools"]) for entry in last_turn)
+    text = (
+        f"Tools: {sent} of {len(get_registry().declarations)} declarations sent, {sum(entry['tool_tokens_saved'] for entry in last_turn)} tokens saved "
+        f"in the last turn (estimated), {sum(entry['tool_tokens_saved'] for entry in token_log)} this session"
+    )
+    # the mean model time of the requests with pruned and with all tools shows the latency change
+    pruned = [entry["model_time"] for entry in token_log if entry["tool_tokens_saved"]]
+    full = [entry["model_time"] for entry in token_log if not entry["tool_tokens_saved"]]
+    if pruned and full:
+        text += f", model time per call {sum(pruned) / len(pruned):.2f} s pruned vs. {sum(full) / len(full):.2f} s with all tools"
+    return text
+
+
+def render_tool_log(tool_calls_log, tool_history_placeholder):
+    if tool_history_placeholder:
+        with tool_history_placeholder.container():
+            history_html = "".join([f"<div style='font-size: small; color: #808080; margin-bottom: 2px;'>{call}</div>" for call in tool_calls_log])
+            st.markdown(history_html, unsafe_allow_html=True)
+
+
+async def stream_response(client, model_id, config, history, on_text=None):
     """
-    Creates a string representation of a function or method call with keyword arguments.
+    Streams one model response and returns its parts.
+
+    Text is passed to on_text as soon as it arrives. Consecutive text chunks are merged into a
+    single part so that the history contains the same parts as a non-streamed response.
 
     Args:
-        function_name: The name of the function or method as a string.
-        object_name: (Optional) The name of the object if calling a method.
-                     If provided, the call will be formatted as "object_name.function_name(...)".
-        **kwargs: Arbitrary keyword arguments to be included in the function/method call.
+        client: The Gemini client.
+        model_id: The model to use.
+        config: The GenerateContentConfig.
+        history: The conversation history sent to the model.
+        on_text: (Optional) Callback on_text(text) called with every new text chunk.
 
     Returns:
-        A string representing the function or method call,
-        e.g., "my_function(arg1=10, name='test')" or "my_object.my_method(param=True)".
+        The list of parts of the model response, the usage metadata of the response (None if not
+        reported) and the finish reason of the response.
     """
-    # Format the keyword arguments into a string
-    kwargs_str = []
-    for key, value in kwargs.items():
-        if isinstance(value, str):
-            # Enclose string values in single quotes
-            kwargs_str.append(f"{key}='{value}'")
-        else:
-            # For non-string values, use their direct string representation
-            kwargs_str.append(f"{key}={value}")
+    parts = []
+    usage_metadata = None
+    finish_reason = None
+    # The synchronous stream is consumed in worker threads. The asynchronous client keeps its
+    # connections bound to the event loop of the first turn, so it cannot be shared across turns.
+    stream = await asyncio.to_thread(client.models.generate_content_stream, model=model_id, config=config, contents=history)
+    end_of_stream = object()
+    while (chunk := await asyncio.to_thread(next, stream, end_of_stream)) is not end_of_stream:
+        # the token counts are reported with the last chunks of the stream
+        usage_metadata = chunk.usage_metadata or usage_metadata
+        if chunk.candidates and chunk.candidates[0].finish_reason:
+            finish_reason = chunk.candidates[0].finish_reason
+        if not chunk.candidates or not chunk.candidates[0].content or not chunk.candidates[0].content.parts:
+            continue
+        for part in chunk.candidates[0].content.parts:
+            if part.text and not part.thought and parts and parts[-1].text and not parts[-1].thought:
+                parts[-1] = parts[-1].model_copy(update={
+                    "text": parts[-1].text + part.text,
+                    "thought_signature": parts[-1].thought_signature or part.thought_signature,
+                })
+            else:
+                parts.append(part)
+            if part.text and not part.thought and on_text:
+                on_text(part.text)
+    return parts, usage_metadata, finish_reason
 
-    # Join the formatted keyword arguments with commas
-    params_string = ", ".join(kwargs_str)
 
-    # Prepend the object name if it's provided
-    if object_name:
-        full_function_call = f"{object_name}.{function_name}({params_string})"
-    else:
-        full_function_call = f"{function_name}({params_string})"
-    return full_function_call
+async def request_response(client, model_id, config, history, on_text=None, token_log=None, turn=None, selection=None):
+    """
+    Bounds the history to the token budget and streams the next model response.
+
+    The request carries the tools of the selection (see ToolSelector.select), or all tools if no
+    selection is given. A request with a pruned set of tools whose response tries to call a tool
+    that was not sent, or that is rejected as invalid, is sent again with all tools if none of
+    its text has been passed to on_text yet.
+
+    One entry per model call is appended to token_log with the turn, the prompt tokens reported
+    by the model, the estimated history tokens, the compaction of the history, the number of
+    tools sent, the estimated prompt tokens saved by the selection and the model time.
+    """
+    from tool_selector import MALFORMED_FUNCTION_CALL, is_selection_error
 
+    selection = selection or get_tool_selector().fallback("all tools")
+    shown = []
 
-def call_LLM(client, model_id, config, user_prompt, history, tool_calls_log, tool_history_placeholder=None, sec=None, geom=None, stresses=None):
+    def show_text(text):
+        shown.append(text)
+        if on_text:
+            on_text(text)
+
+    with span("model call", model=model_id) as model_span:
+        compaction = compact_history(history)
+        start = time.perf_counter()
+        while True:
+            try:
+                parts, usage_metadata, finish_reason = await stream_response(client, model_id, get_tool_selector().config(config, selection), history, show_text)
+                # text that has been shown is not shown twice, the response is kept
+                if not selection["pruned"] or finish_reason != MALFORMED_FUNCTION_CALL or shown:
+                    break
+                reason = "the model called a tool that was not sent"
+            except Exception as e:
+                if not selection["pruned"] or shown or not is_selection_error(e):
+                    raise
+                reason = f"the request was rejected ({e})"
+            print(f"{"\033[90m"}logger: Sending the request again with all tools, {reason}{"\033[0m"}\n")
+            selection = get_tool_selector().fallback("fallback")
+        model_time = time.perf_counter() - start
+        prompt_tokens = usage_metadata.prompt_token_count if usage_metadata else None
+        model_span.set(
+            prompt_tokens=prompt_tokens,
+            output_tokens=usage_metadata.candidates_token_count if usage_metadata else None,
+            history_tokens=compaction["tokens_after"],
+            function_calls=sum(1 for part in parts if part.function_call),
+            tools=len(selection["names"]),
+            tool_selection=selection["reason"],
+            tool_tokens_saved=selection["saved_tokens"],
+        )
+    if token_log is not None:
+        token_log.append({
+            "turn": turn,
+            "prompt_tokens": prompt_tokens,
+            "history_tokens": compaction["tokens_after"],
+            "collapsed_responses": compaction["collapsed_responses"],
+            "dropped_turns": compaction["dropped_turns"],
+            "tools": len(selection["names"]),
+            "tool_tokens_saved": selection["saved_tokens"],
+            "model_time": model_time,
+        })
+    print(f"{"\033[90m"}logger: Prompt tokens: {prompt_tokens}, history tokens (estimated): {compaction['tokens_before']} -> {compaction['tokens_after']}, tools: {len(selection['names'])} ({selection['reason']}, {selection['saved_tokens']} tokens saved){"\033[0m"}\n")
+    return parts
+
+
+async def call_LLM(client, model_id, config, user_prompt, history, tool_calls_log, tool_history_placeholder=None, sec=None, geom=None, stresses=None, on_text=None, token_log=None):
+    from google.genai import types
+
+    registry = get_registry()
+    selector = get_tool_selector()
     figures = []
+    turn = token_log[-1]["turn"] + 1 if token_log else 1
     history.append(types.Content(role="user", parts=[types.Part(text=user_prompt)]))
 
     try:
-        response = client.models.generate_content(
-            model=model_id,
-            config=config,
-            contents=history
-        )
+        selection = selector.select(user_prompt, history, sec is not None or geom is not None)
+        parts = await request_response(client, model_id, config, history, on_text, token_log, turn, selection)
     except Exception as e:
         history.append(types.Content(role="model", parts=[types.Part(text=f"An error occurred: {str(e)}")]))
+        if on_text:
+            on_text(f"An error occurred: {str(e)}")
         return history, sec, geom, stresses, figures
 
     # Collect all function calls in this turn
-    while response:
+    while parts:
         function_calls = []
-        # Check if we have valid candidates
-        if not response.candidates:
-             break
-
-        candidate = response.candidates[0]
-        
-        # Check if content and parts exist
-        if candidate.content and candidate.content.parts:
-            for part in candidate.content.parts:
-                history.append(types.Content(role="model", parts=[part]))
-                # check if the response is a function call
-                if part.function_call:
-                    function_calls.append(part.function_call)
-        else:
-             # If content is empty or blocked, stop the loop to avoid infinite loops or errors
-             break
+        for part in parts:
+            history.append(types.Content(role="model", parts=[part]))
+            # check if the response is a function call
+            if part.function_call:
+                function_calls.append(part.function_call)
+
+        # Log all function calls of this response before executing them
+        log_entries = []
+        for function_call in function_calls:
+            print(f"{"\033[90m"}logger: Calling tool {function_call.name} with args: {function_call.args}{"\033[0m"}\n")
+            log_entries.append(f"🛠️ {function_call.name} with args: {function_call.args}")
+        log_offset = len(tool_calls_log)
+        tool_calls_log.extend(log_entries)
+        render_tool_log(tool_calls_log, tool_history_placeholder)
+
+        def on_progress(i, message):
+            tool_calls_log[log_offset + i] = f"{log_entries[i]} ⏳ {message}"
+            render_tool_log(tool_calls_log, tool_history_placeholder)
+
+        def on_complete(i, tool_result, elapsed):
+            # report the wall time of every call in the tool log as soon as it has finished
+            tool_calls_log[log_offset + i] = f"{log_entries[i]} ({elapsed:.2f} s)"
+            print(f"{"\033[90m"}logger: Tool {function_calls[i].name} finished with status '{tool_result.get('status')}' in {elapsed:.2f} s{"\033[0m"}\n")
+            render_tool_log(tool_calls_log, tool_history_placeholder)
+
+        # Independent calls are executed concurrently in worker threads, dependent calls wait for
+        # their prerequisites. The event loop keeps updating the UI in the meantime.
+        results, state = await execute_tool_calls_async(
+            function_calls, registry.dispatch, {"sec": sec, "geom": geom, "stresses": stresses}, registry.is_generator, on_complete, on_progress
+        )
+        sec, geom, stresses = state["sec"], state["geom"], state["stresses"]
+        figures.extend(state["figures"])
 
         # Prepare all function response parts
         function_response_parts = []
-        for function_call in function_calls:            
-            # Call the tool with arguments
-            print(f"{"\033[90m"}logger: Calling tool {function_call.name} with args: {function_call.args}{"\033[0m"}\n")
-            tool_calls_log.append(f"🛠️ {function_call.name} with args: {function_call.args}")
-
-            if tool_history_placeholder:
-                with tool_history_placeholder.container():
-                    history_html = "".join([f"<div style='font-size: small; color: #808080; margin-bottom: 2px;'>{call}</div>" for call in tool_calls_log])
-                    st.markdown(history_html, unsafe_allow_html=True)
-
-            # Default tool result in case no handler matches
-            tool_result = {
-                "status": "error",
-                "message": f"Tool '{function_call.name}' is not implemented or not available."
-            }
-
-            # For functions in the current global scope:
-            if function_call.name in globals():
-                func_obj = globals()[function_call.name]    
-                srcmodule = func_obj.__module__ #module where the function is defined
-            else:    
-                srcmodule = None
-
-            if srcmodule == "sectionproperties.pre.library.steel_sections":
-                try:
-                    ele_size = 10
-                    geom = globals()[function_call.name](**function_call.args)
-                    geom.create_mesh(mesh_sizes=ele_size)
-                    sec = Section(geometry=geom)
-                    
-                    fig = Figure(figsize=(4.8, 3.6))
-                    ax = fig.subplots()
-                    sec.plot_mesh(materials=False, pause=False, ax=ax)
-                    figures.append(fig)
-
-                    tool_result = {
-                        "status": "success",
-                        "message": f"Geometry of the section generated and meshed successfully. A default element size of {ele_size} mm was used. A plot was generated showing the section mesh.",
-                        "next_steps_suggestion": "Would you like to evaluate the section properties or perform a stress analysis?",
-                    }
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-            elif function_call.name == "calculate_geometric_properties":
-                try:
-                    sec.calculate_geometric_properties(**function_call.args)
-                    
-                    tool_result = {
-                        "status": "success",
-                        "message": f"Geometric section properties have been calculated successfully.",
-                        "section_properties": json.dumps(sec.section_props.__dict__, indent=4, cls=SelectiveEncoder),
-                        "next_steps_suggestion": "Would you like to calculate warping properties or perform a stress analysis?"
-                    }            
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-            elif function_call.name == "calculate_warping_properties":
-                try:
-                    sec.calculate_warping_properties(**function_call.args)
-                    
-                    tool_result = {
-                        "status": "success",
-                        "message": f"Warping properties of the section have been calculated successfully.",
-                        "warping_properties": json.dumps(sec.section_props.__dict__, indent=4, cls=SelectiveEncoder),
-                        "next_steps_suggestion": "Would you like to continue with a stress analysis?"
-                    }
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-            elif function_call.name == "calculate_stress":
-                try:
-                    stresses = sec.calculate_stress(**function_call.args)
-                    
-                    tool_result = {
-                        "status": "success",
-                        "message": f"Section stresses have been calculated successfully.",
-                        "max_axial_stress": stresses.material_groups[0].stress_result.sig_zz.max(),
-                        "max_shear_stress": stresses.material_groups[0].stress_result.sig_zxy.max(),
-                        "max_von_mises_stress": stresses.material_groups[0].stress_result.sig_vm.max(),
-                        "min_axial_stress": stresses.material_groups[0].stress_result.sig_zz.min(),
-                        "min_shear_stress": stresses.material_groups[0].stress_result.sig_zxy.min(),
-                        "min_von_mises_stress": stresses.material_groups[0].stress_result.sig_vm.min(),
-                        "next_steps_suggestion": "Would you like to view the stress results? I could plot the Axial, Shear or von Mises stresses for you.",
-                    }
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-            elif function_call.name == "plot_stress":
-                try:
-                    if stresses:
-                        # Create a new Figure object explicitly
-                        fig = Figure(figsize=(4.8, 3.6))
-                        ax = fig.subplots()
-                        stresses.plot_stress(**function_call.args, normalize=False, pause=False, ax=ax)
-                        figures.append(fig)
-                        
-                        tool_result = {
-                            "status": "success",
-                            "message": f"Plot of {function_call.args.get('plot_type')} stresses generated.",
-                            "plot_description": "A plot of the stresses over the section.",
-                            "caption_suggestion": "Here's the section stress plot.",
-                        }
-                    else:
-                        tool_result = {
-                            "status": "error",
-                            "message": "Stresses have not been calculated yet. Please calculate stresses before plotting."
-                        }
-                except Exception as e:
-                    tool_result = {
-                        "status": "error",
-                        "message": f"Error calling {function_call.name}: {str(e)}"
-                    }
-
-            # elif function_call.name == "GoogleSearch":
-            #     try:
-            #         search_response = client.models.generate_content(
-            #             model=model_id,
-            #             config=GenerateContentConfig(
-            #                 system_instruction="Perform an online search on basic section dimensions for standard steel sections in the web and output them in a structured way.",
-            #                 tools=[types.Tool(google_search=types.GoogleSearch())],
-            #             ),
-            #             contents=history
-            #         )
-
-            #         if search_response.candidates and search_response.candidates[0].content and search_response.candidates[0].content.parts:
-            #             search_text = search_response.candidates[0].content.parts[0].text
-            #             tool_result = {"result": search_text}
-            #         else:
-            #             tool_result = {"status": "error", "message": "Google Search returned no content."}
-                        
-            #     except Exception as e:
-            #         tool_result = {
-            #             "status": "error",
-            #             "message": f"Error performing Google Search: {str(e)}"
-            #         }
-
+        for function_call, (tool_result, elapsed) in zip(function_calls, results):
             function_response_part = types.Part.from_function_response(
                 name=function_call.name,
                 response=tool_result,
             )
             function_response_parts.append(function_response_part)
 
-        response = None
+        parts = None
 
         if function_response_parts:
             history.append(types.Content(role="user", parts=function_response_parts))
+            if on_text:
+                # separate the text of the follow-up response from the text before the tool calls
+                on_text("\n\n")
             try:
-                response = client.models.generate_content(
-                    model=model_id, config=config, contents=history
-                )
+                # the tools are selected again for the new section and stresses
+                selection = selector.select(user_prompt, history, sec is not None or geom is not None)
+                parts = await request_response(client, model_id, config, history, on_text, token_log, turn, selection)
             except Exception as e:
                 history.append(types.Content(role="model", parts=[types.Part(text=f"An error occurred: {str(e)}")]))
-                response = None
+                if on_text:
+                    on_text(f"An error occurred: {str(e)}")
+                parts = None
+
+    return history, sec, geom, stresses, figures
+
+class StreamPacer:
+    """
+    Spreads text over its words for a typing effect with a bounded total delay.
+
+    The delay per word shrinks when a lot of text arrives at once, and once max_delay has been
+    spent in a turn the remaining text is shown without any delay.
+    """
+
+    def __init__(self, word_delay: float = STREAM_WORD_DELAY, max_delay: float = STREAM_MAX_DELAY):
+        self.word_delay = word_delay
+        self.remaining_delay = max_delay
+        self.total_delay = 0.0
+
+    def pace(self, text):
+        words = text.split(" ")
+        delay = min(self.word_delay, self.remaining_delay / len(words))
+        if delay < 0.001:
+            yield text
+            return
+        for i, word in enumerate(words):
+            yield word if i == len(words) - 1 else word + " "
+            time.sleep(delay)
+            self.remaining_delay -= delay
+            self.total_delay += delay
+
+
+def render_timing(timing_placeholder):
+    traces = st.session_state.get("traces", [])
+    if not traces:
+        return
+    with timing_placeholder.container():
+        with st.expander(f"Timing of the last turn ({traces[-1].wall_time:.2f} s)"):
+            st.dataframe(timing_rows(traces[-1]), hide_index=True)
+
+
+def stream_data(text, pacer=None):
+    if pacer:
+        yield from pacer.pace(text)
+    else:
+        yield text
 
-    return history, sec if 'sec' in locals() else None, geom if 'geom' in locals() else None, stresses if 'stresses' in locals() else None, figures if 'figures' in locals() else None
 
-def stream_data(text):
-    for word in text.split(" "):
-        yield word + " "
-        time.sleep(0.02)
+def render_latency_stats(latency_stats_placeholder):
+    latency_log = st.session_state.get("latency_log", [])
+    if not latency_log:
+        return
+    last_turn = latency_log[-1]
+    first_token = f"{last_turn['first_token']:.2f} s" if last_turn["first_token"] is not None else "-"
+    latency_stats_placeholder.caption(
+        f"Last turn: first text after {first_token}, rendered after {last_turn['total']:.2f} s ({last_turn['paced_delay']:.2f} s pacing)"
+    )
 
 def main():
     # Setup page configuration
@@ -290,19 +442,28 @@ def main():
         user_api_key = st.text_input("Google API Key", type="password", help="Get your free key at https://aistudio.google.com/")
         
         st.subheader("🔒 Data Privacy (DSGVO/GDPR)")
+        # the statements on stored data follow the recording and section store settings of the server
+        if os.getenv("TRANSCRIPT_DIR"):
+            history_text = "3. Your prompts and the responses of the model are recorded in a transcript of your session on my server (VPS).\n"
+            stored_text = "4. No other personal information is persistently stored on my server."
+        else:
+            history_text = "3. History is maintained only in your temporary session memory.\n"
+            stored_text = "4. No chat data or other personal information is persistently stored on my server (VPS)."
+        if get_section_store():
+            stored_text += " The geometry, mesh and analysis results of your sections are stored under the section id (a hash of the section), and only the sections of your session are listed to you."
         st.info(
             "This application acts as a user interface. By using it:\n"
             "1. Your inputs are sent to Google's Generative AI servers for processing. More info regarding the use of gemini: https://support.google.com/gemini/answer/13594961\n"
             "2. You strictly control access via your own API Key.\n"
-            "3. History is maintained only in your temporary session memory.\n"
-            "4. No chat data or other personal information is persistently stored on my server (VPS). My data privacy declaration can be checked under: https://bautomate.dev/#legal" 
+            + history_text + stored_text +
+            " My data privacy declaration can be checked under: https://bautomate.dev/#legal"
             )
         
         st.subheader("2) Sectionproperties", help="Check capabilites and assumptions under: https://sectionproperties.readthedocs.io/en/stable/")
         st.info("sectionproperties is an awesome and open-source python package for the analysis of arbitrary cross-sections using 2D finite elements. sectionproperties can be used to determine section properties to be used in structural design and visualise cross-sectional stresses resulting from arbitrary loading."
         )
     
-        st.subheader("Tools used this session:", help="The LLM can only use specific tools that are declared in the tool_declaration.json file:\n - steel_sections: Different standard steel section generators from sectionproperties.\n - calculate_geometric_properties: Calculate geometric properties of the section.\n - calculate_warping_properties: Calculate warping properties of the section.\n - calculate_stress: Calculate stresses for given loading conditions.\n - plot_stress: Plot the calculated stresses over the section.")
+        st.subheader("Tools used this session:", help="The LLM can only use specific tools that are declared in the tool_declaration.json file:\n - steel_sections: Different standard steel section generators from sectionproperties.\n - sweep_section_parameters: Find the best section of a generator over a grid of parameters.\n - find_standard_section: Look up standard sections (IPE, HEA, HEB, UPE, CHS, SHS, RHS) with precomputed properties.\n - calculate_geometric_properties: Calculate geometric properties of the section.\n - calculate_warping_properties: Calculate warping properties of the section.\n - calculate_stress: Calculate stresses for given loading conditions.\n - calculate_stress_envelope: Calculate the stress extrema for several load cases at once.\n - plot_stress: Plot the calculated stresses over the section.\n - open_section: Reopen a saved section by its id.")
         tool_history_placeholder = st.empty()
         with tool_history_placeholder.container():
             if 'tool_calls' in st.session_state and st.session_state.tool_calls:
@@ -310,24 +471,35 @@ def main():
                 st.markdown(history_html, unsafe_allow_html=True)
             else:
                 st.caption("No tools called yet.")
+        cache_stats_placeholder = st.empty()
+        render_cache_stats(cache_stats_placeholder)
+        token_stats_placeholder = st.empty()
+        render_token_stats(token_stats_placeholder)
+        latency_stats_placeholder = st.empty()
+        render_latency_stats(latency_stats_placeholder)
+        timing_placeholder = st.empty()
+        render_timing(timing_placeholder)
 
     api_key = user_api_key 
+    backend = model_backend()
 
-    if not api_key or api_key == "xxx":
-        st.warning("⚠️ To use this application, please enter your Google API Key in the sidebar.")
-        st.stop()
-
-    client = genai.Client(api_key=api_key)
+    if backend == "gemini":
+        if not api_key or api_key == "xxx":
+            st.warning("⚠️ To use this application, please enter your Google API Key in the sidebar.")
+            st.stop()
+        client = get_client(api_key)
+    else:
+        # the offline stand-ins keep their position in the script, every session gets its own
+        if 'client' not in st.session_state:
+            st.session_state.client = create_client(backend=backend)
+        client = st.session_state.client
 
     # Define the model you are going to use
     model_id =  "gemini-2.5-flash"
     #model_id =  "gemini-2.5-flash-lite"   
 
     # Generation Config
-    config = GenerateContentConfig(
-        system_instruction="You are a helpful assistant that uses specific functions to analyse sections. If a suitable function is found but not all required parameters are provided, ask the user for the missing parameters or propose defaults. Never blindly guess parameters and move forward without confirmation. Also describe the function you are going to use. If a function call was detected, always provide text output to the user based on the function response.",
-        tools=[{"function_declarations": tools}],
-    )
+    config = get_config()
 
     # example prompts 
     # Generate a channel section with a depth of 250 mm, a width of 90 mm, a flange thickness of 15 mm, a web thickness of 8 mm, a corner radius of 12 mm and 8 elements over the radius. Calculate the section properties and print them.
@@ -360,8 +532,31 @@ def main():
     if 'stresses' not in st.session_state:
         st.session_state.stresses = None
 
+    store = get_section_store()
+    if store and 'stored_section' not in st.session_state:
+        # the section is kept by the store, which drops it from memory while the session is idle.
+        # After a browser refresh the section of the URL is reopened.
+        st.session_state.stored_section = store.session()
+        if section_id := st.query_params.get("section"):
+            try:
+                st.session_state.stored_section.open(section_id)
+            except SectionNotFound:
+                pass
+
     if 'tool_calls' not in st.session_state:
             st.session_state.tool_calls = []
+
+    if 'token_log' not in st.session_state:
+        st.session_state.token_log = []
+
+    if 'latency_log' not in st.session_state:
+        st.session_state.latency_log = []
+
+    if 'traces' not in st.session_state:
+        st.session_state.traces = []
+
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
     
     # Display chat messages
     for message in st.session_state.messages:
@@ -370,12 +565,12 @@ def main():
             if message["type"] == "text":
                 st.markdown(message["content"])
             else:
-                st.pyplot(message["content"], use_container_width=False)
+                show_figure(message["content"])
 
     if not st.session_state.messages:
         introduction = "This is an app build around sectionproperties to analyse sections. How can I help you?"
         with st.chat_message("assistant", avatar=BOT_AVATAR):
-            st.write_stream(stream_data(introduction))
+            st.write_stream(stream_data(introduction, StreamPacer() if STREAM_PACING == "adaptive" else None))
             st.session_state.messages.append({"role": "assistant", "type": "text", "content": introduction})
 
 
@@ -404,22 +599,52 @@ def main():
             st.markdown(user_prompt)
 
         with st.chat_message("assistant", avatar=BOT_AVATAR):
-            with st.spinner("Thinking..."):
-                st.session_state.history, st.session_state.sec, st.session_state.geom, st.session_state.stresses, figures = call_LLM(
-                    client, model_id, config, user_prompt, st.session_state.history, st.session_state.tool_calls, tool_history_placeholder, st.session_state.sec, st.session_state.geom, st.session_state.stresses
-                )
-            
+            # the model text is shown as it arrives, tool progress is pushed into the sidebar meanwhile
             message_placeholder = st.empty()
-            full_response = f"{st.session_state.history[-1].parts[0].text}"
-            message_placeholder.write_stream(stream_data(full_response))
-            if figures:
-                for fig in figures:
-                    st.pyplot(fig, use_container_width = False)
-                    print(fig.get_size_inches())
+            streamed_text = []
+            pacer = StreamPacer() if STREAM_PACING == "adaptive" else None
+            start = time.perf_counter()
+            latency = {"turn": len(st.session_state.latency_log) + 1, "first_token": None}
+
+            def on_text(text):
+                if latency["first_token"] is None and text.strip():
+                    latency["first_token"] = time.perf_counter() - start
+                for piece in stream_data(text, pacer):
+                    streamed_text.append(piece)
+                    message_placeholder.markdown("".join(streamed_text) + " ▌")
+
+            # the model calls, tool calls and their stages are recorded as children of the turn span
+            if store:
+                st.session_state.sec, st.session_state.geom, st.session_state.stresses = st.session_state.stored_section.restore()
+            # the solver jobs of the turn are queued fairly against the jobs of other sessions,
+            # open_section only lists the sections of the stored session
+            with st.spinner("Thinking..."), span("turn", turn=latency["turn"]) as turn_span, solver_session(st.session_state.session_id), stored_session(st.session_state.get("stored_section")):
+                st.session_state.history, st.session_state.sec, st.session_state.geom, st.session_state.stresses, figures = asyncio.run(call_LLM(
+                    client, model_id, config, user_prompt, st.session_state.history, st.session_state.tool_calls, tool_history_placeholder, st.session_state.sec, st.session_state.geom, st.session_state.stresses, on_text, st.session_state.token_log
+                ))
+            st.session_state.traces = (st.session_state.traces + [turn_span])[-MAX_TRACES:]
+            save_turn(st.session_state.session_id, st.session_state.history)
+            if store:
+                stored_section = st.session_state.stored_section
+                stored_section.update(st.session_state.sec, st.session_state.stresses, st.session_state.geom)
+                st.session_state.sec = st.session_state.geom = st.session_state.stresses = None
+                if stored_section.section_id:
+                    st.query_params["section"] = stored_section.section_id[:SHORT_ID_LENGTH]
+
+            full_response = "".join(streamed_text).strip()
+            message_placeholder.markdown(full_response)
+            for figure in figures:
+                show_figure(figure)
+            latency.update({"total": time.perf_counter() - start, "paced_delay": pacer.total_delay if pacer else 0.0})
+            st.session_state.latency_log.append(latency)
+            first_token = f"{latency['first_token']:.2f} s" if latency["first_token"] is not None else "-"
+            print(f"{"\033[90m"}logger: Time to first text: {first_token}, total render time: {latency['total']:.2f} s, pacing: {latency['paced_delay']:.2f} s{"\033[0m"}\n")
+        render_cache_stats(cache_stats_placeholder)
+        render_token_stats(token_stats_placeholder)
+        render_latency_stats(latency_stats_placeholder)
+        render_timing(timing_placeholder)
         st.session_state.messages.append({"role": "assistant", "type": "text", "content": full_response})
-        if figures:
-            for fig in figures:
-                st.session_state.messages.append({"role": "assistant", "type": "figure", "content": fig})
+        store_figures(st.session_state.messages, figures)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,130 @@
+import math
+
+
+# mesh options accepted by the section generator tools in addition to the generator arguments,
+# "estimate" skips the mesh until a finite element analysis is needed
+MESH_OPTIONS = ["mesh_size", "mesh_convergence", "estimate"]
+# default number of element edge lengths through the thinnest plate of a section
+ELEMENTS_THROUGH_THICKNESS = 1
+# bounds for the number of elements of an adaptively meshed section
+MIN_ELEMENTS = 200
+MAX_ELEMENTS = 5000
+# properties checked by the convergence loop and its defaults. Geometric properties of sections
+# with straight edges are integrated exactly on any mesh, so the torsion constant is the
+# property that is actually sensitive to the mesh density.
+CONVERGENCE_TARGETS = ["ixx_c", "iyy_c", "j"]
+WARPING_TARGETS = ["j", "gamma", "x_se", "y_se", "a_sx", "a_sy"]
+CONVERGENCE_TOLERANCE = 0.01
+MAX_REFINEMENTS = 4
+
+
+def is_thickness(name: str) -> bool:
+    return name == "t" or name.startswith("t_")
+
+
+def is_radius(name: str) -> bool:
+    return name == "r" or (name.startswith("r_") and name != "rot")
+
+
+def characteristic_mesh_size(args: dict, area: float) -> float:
+    """
+    Derives the mesh size of a library section from its characteristic dimensions.
+
+    The element edge length is chosen so that the thinnest plate is spanned by
+    ELEMENTS_THROUGH_THICKNESS (quadratic) elements and no element is larger than the smallest
+    root radius. The resulting number of elements is kept between MIN_ELEMENTS and MAX_ELEMENTS,
+    so that large sections are not over-meshed and small sections are not under-meshed.
+
+    Args:
+        args: The arguments of the section generator, thicknesses start with "t" and radii with "r".
+        area: The cross-sectional area of the section in mm².
+
+    Returns:
+        The maximum element area in mm² as used by sectionproperties' create_mesh.
+    """
+    thicknesses = [float(v) for k, v in args.items() if is_thickness(k) and v and float(v) > 0]
+    radii = [float(v) for k, v in args.items() if is_radius(k) and v and float(v) > 0]
+
+    if thicknesses:
+        edge_length = min(thicknesses) / ELEMENTS_THROUGH_THICKNESS
+        if radii:
+            edge_length = min(edge_length, min(radii))
+    else:
+        edge_length = math.sqrt(area) / 20
+
+    # area of an equilateral triangle with the chosen edge length
+    mesh_size = math.sqrt(3) / 4 * edge_length**2
+    return min(max(mesh_size, area / MAX_ELEMENTS), area / MIN_ELEMENTS)
+
+
+def mesh_info(sec, mesh_size: float, mode: str) -> dict:
+    return {
+        "mode": mode,
+        "mesh_size": float(f"{mesh_size:.4g}"),
+        "n_elements": len(sec.elements),
+        "n_nodes": sec.num_nodes,
+        # the warping analysis solves for one unknown per node plus a Lagrangian multiplier
+        "n_dofs": sec.num_nodes + 1,
+    }
+
+
+def relative_change(old: float, new: float) -> float:
+    if old == new:
+        return 0.0
+    return abs(new - old) / max(abs(old), abs(new))
+
+
+def mesh_section(name: str, generator, args: dict, cache, mesh_size: float = None, convergence: bool = False,
+                 targets: list = None, tolerance: float = CONVERGENCE_TOLERANCE, max_refinements: int = MAX_REFINEMENTS) -> tuple:
+    """
+    Generates and meshes a library section with a fixed, adaptive or converged mesh size.
+
+    Args:
+        name: Name of the section generator, e.g. "i_section".
+        generator: The section generator function from sectionproperties.pre.library.
+        args: The arguments of the generator call.
+        cache: The SectionCache used to build the meshed and analysed sections.
+        mesh_size: (Optional) Maximum element area in mm². If omitted, it is derived from the section dimensions.
+        convergence: If True, the mesh is refined until the target properties change by less than the tolerance.
+        targets: (Optional) Section properties checked for convergence, defaults to CONVERGENCE_TARGETS.
+        tolerance: Relative change of the target properties below which the mesh is converged.
+        max_refinements: Maximum number of refinements of the convergence loop.
+
+    Returns:
+        The meshed Section object and a dict describing the mesh (mode, mesh size, number of
+        elements, nodes and degrees of freedom and, for the convergence loop, the history).
+    """
+    if mesh_size is not None:
+        mode = "fixed"
+    else:
+        mode = "adaptive"
+        mesh_size = characteristic_mesh_size(args, generator(**args).calculate_area())
+
+    sec = cache.get_section(name, generator, args, mesh_size)
+    if not convergence:
+        return sec, mesh_info(sec, mesh_size, mode)
+
+    targets = targets or CONVERGENCE_TARGETS
+    analysis = "warping" if any(target in WARPING_TARGETS for target in targets) else "geometric"
+    sec = cache.analyse(sec, "geometric")
+    if analysis == "warping":
+        sec = cache.analyse(sec, "warping")
+    history = [{"mesh_size": float(f"{mesh_size:.4g}"), "n_elements": len(sec.elements), **{t: float(getattr(sec.section_props, t)) for t in targets}}]
+
+    converged = False
+    for _ in range(max_refinements):
+        refined_size = mesh_size / 2
+        refined = cache.analyse(cache.get_section(name, generator, args, refined_size), "geometric")
+        if analysis == "warping":
+            refined = cache.analyse(refined, "warping")
+        history.append({"mesh_size": float(f"{refined_size:.4g}"), "n_elements": len(refined.elements), **{t: float(getattr(refined.section_props, t)) for t in targets}})
+
+        change = max(relative_change(getattr(sec.section_props, t), getattr(refined.section_props, t)) for t in targets)
+        sec, mesh_size = refined, refined_size
+        if change < tolerance:
+            converged = True
+            break
+
+    info = mesh_info(sec, mesh_size, "converged" if converged else "not converged")
+    info["convergence_history"] = history
+    return sec, info
@@ -0,0 +1,144 @@
+# Local stand-in of the Gemini API, run with "python mock_model_server.py --port 8765 --error-rate 0.3".
+#
+# The server answers generateContent and streamGenerateContent requests like the Gemini API with
+# the rule based model of scripted_client.py, so the app runs against it with MODEL_BACKEND=gemini,
+# GEMINI_BASE_URL=http://localhost:8765 and any API key. The real genai client, its HTTP
+# connections and the retries, rate limiting, timeouts and hedging of model_client.py are used.
+#
+# A share of the requests can be answered with transient errors (--error-rate, 429 with a
+# Retry-After header or 503) or stalled before the first chunk (--stall-rate, for timeouts and
+# hedging), and every response can be delayed (--latency). The requests served are counted per
+# outcome and printed when the server is stopped.
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scripted_client import RuleBasedModels
+
+
+class MockModelServer(ThreadingHTTPServer):
+    """
+    HTTP server answering Gemini API requests with the rule based model.
+
+    Args:
+        address: The (host, port) to listen on, port 0 picks a free port.
+        error_rate: Share of requests answered with a 429 or 503 error.
+        stall_rate: Share of requests that stall for `stall` seconds before answering.
+        latency: Delay of every response in seconds.
+        retry_after: Retry-After of the 429 responses in seconds.
+        seed: (Optional) Seed of the random failures, for reproducible runs.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, error_rate: float = 0.0, stall_rate: float = 0.0, stall: float = 30.0,
+                 latency: float = 0.0, retry_after: float = 1.0, seed: int = None):
+        super().__init__(address, MockModelHandler)
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.latency = latency
+        self.retry_after = retry_after
+        self.models = RuleBasedModels()
+        self.random = random.Random(seed)
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def count(self, outcome: str):
+        with self.lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+
+    def outcome(self) -> str:
+        with self.lock:
+            value = self.random.random()
+        if value < self.error_rate:
+            return "429" if value < self.error_rate / 2 else "503"
+        if value < self.error_rate + self.stall_rate:
+            return "stalled"
+        return "ok"
+
+
+class MockModelHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        from google.genai import types
+
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if ":generateContent" not in self.path and ":streamGenerateContent" not in self.path:
+            self.send_json(404, {"error": {"code": 404, "message": f"Unknown method {self.path}", "status": "NOT_FOUND"}})
+            return
+
+        outcome = server.outcome()
+        server.count(outcome)
+        time.sleep(server.latency + (server.stall if outcome == "stalled" else 0.0))
+        if outcome == "429":
+            self.send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted (mock).", "status": "RESOURCE_EXHAUSTED"}},
+                           {"Retry-After": f"{server.retry_after:g}"})
+            return
+        if outcome == "503":
+            self.send_json(503, {"error": {"code": 503, "message": "The model is overloaded (mock).", "status": "UNAVAILABLE"}})
+            return
+
+        contents = [types.Content.model_validate(content) for content in body.get("contents", [])]
+        if ":generateContent" in self.path:
+            response = server.models.generate_content(model=None, contents=contents)
+            self.send_json(200, response.model_dump(mode="json", by_alias=True, exclude_none=True))
+            return
+
+        # server-sent events, one chunk per event
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in server.models.generate_content_stream(model=None, contents=contents):
+            event = f"data: {json.dumps(chunk.model_dump(mode='json', by_alias=True, exclude_none=True))}\r\n\r\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves a local stand-in of the Gemini API answering with the rule based model.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 429 or 503 error (default: 0).")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Share of requests stalled before answering (default: 0).")
+    parser.add_argument("--stall", type=float, default=30.0, help="Seconds a stalled request waits (default: 30).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay of every response in seconds (default: 0).")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of the 429 responses in seconds (default: 1).")
+    parser.add_argument("--seed", type=int, help="Seed of the random failures.")
+    args = parser.parse_args()
+
+    server = MockModelServer(
+        (args.host, args.port), args.error_rate, args.stall_rate, args.stall, args.latency, args.retry_after, args.seed
+    )
+    print(f"Mock Gemini API listening on http://{args.host}:{server.server_port}, set GEMINI_BASE_URL to this address.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Requests served: {server.counts}")
+
+
+if __name__ == "__main__":
+    main()
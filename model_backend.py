@@ -0,0 +1,60 @@
+import os
+
+from scripted_client import RuleBasedClient, ScriptedClient, load_transcript, record_turn
+
+
+# "gemini" calls the Gemini API, "replay" replays the model responses of a recorded transcript,
+# "rules" translates common prompts into tool calls without a model
+MODEL_BACKENDS = ["gemini", "replay", "rules"]
+
+
+def model_backend() -> str:
+    backend = os.getenv("MODEL_BACKEND", "gemini")
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown MODEL_BACKEND '{backend}'. Valid backends are {MODEL_BACKENDS}.")
+    return backend
+
+
+def create_client(api_key: str = None, backend: str = None, transcript: str = None):
+    """
+    Creates the client of a model backend, all clients provide client.models.generate_content(_stream).
+
+    Args:
+        api_key: The API key of the "gemini" backend.
+        backend: One of MODEL_BACKENDS, defaults to the MODEL_BACKEND environment variable.
+        transcript: The transcript file of the "replay" backend, defaults to REPLAY_TRANSCRIPT.
+
+    Returns:
+        The pooled ModelClient of the API key or a stand-in. The stand-ins keep the position in
+        their script, so every session needs its own client.
+    """
+    backend = backend or model_backend()
+    if backend == "gemini":
+        from model_client import default_client_pool
+        return default_client_pool().get(api_key)
+    if backend == "replay":
+        transcript = transcript or os.getenv("REPLAY_TRANSCRIPT")
+        if not transcript:
+            raise ValueError("The replay backend needs a transcript, set REPLAY_TRANSCRIPT.")
+        return ScriptedClient([response for turn in load_transcript(transcript) for response in turn["responses"]])
+    return RuleBasedClient()
+
+
+def transcript_path(session_id: str) -> str:
+    """
+    Returns the transcript file of a session in TRANSCRIPT_DIR, or None if recording is disabled.
+    """
+    directory = os.getenv("TRANSCRIPT_DIR")
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{session_id}.jsonl")
+
+
+def save_turn(session_id: str, history: list):
+    """
+    Appends the latest turn of a session to its transcript if TRANSCRIPT_DIR is set.
+    """
+    path = transcript_path(session_id)
+    if path:
+        record_turn(path, history)
@@ -0,0 +1,347 @@
+import os
+import time
+import random
+import itertools
+import threading
+from collections import OrderedDict
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from profiling import current_span
+
+
+# HTTP status codes of transient errors, requests failing with these are retried
+RETRY_STATUS_CODES = [408, 429, 500, 502, 503, 504]
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def get_hedge_pool() -> ThreadPoolExecutor:
+    """
+    Returns the thread pool running the requests of hedged model calls.
+    """
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="model_hedge")
+        return _hedge_pool
+
+
+def discard_result(discard, future):
+    if not future.cancelled() and future.exception() is None:
+        discard(future.result())
+
+
+def is_transient(error: Exception) -> bool:
+    import httpx
+    from google.genai import errors
+
+    if isinstance(error, errors.APIError):
+        return error.code in RETRY_STATUS_CODES
+    # connection errors, timeouts and connections closed by the server
+    return isinstance(error, httpx.TransportError)
+
+
+def retry_after(error: Exception) -> float:
+    """
+    Returns the delay requested by the server with a rate limit error in seconds, or 0.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        if headers and headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    # the Gemini API reports the delay as RetryInfo detail, e.g. {"retryDelay": "12s"}
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in (details.get("error") or {}).get("details") or []:
+            delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+            if isinstance(delay, str) and delay.endswith("s"):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    pass
+    return 0.0
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the requests of one API key to `rate` per second with bursts of up to `burst`.
+
+    A request that finds the bucket empty reserves the next token and waits for it, so waiting
+    requests are served in order.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """
+        Takes a token, waiting until one is available, and returns the time waited in seconds.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            delay = max(0.0, -self._tokens / self.rate)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a token if one is available without waiting.
+        """
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class ModelStats:
+    """
+    Counters of the model requests of all clients of a ClientPool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failed = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.errors = {}
+
+    def add(self, **counts):
+        with self._lock:
+            for key, value in counts.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def add_queue_wait(self, wait: float):
+        with self._lock:
+            self.queue_wait += wait
+            self.max_queue_wait = max(self.max_queue_wait, wait)
+
+    def add_error(self, error: Exception):
+        key = str(getattr(error, "code", None) or type(error).__name__)
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failed": self.failed,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "queue_wait": self.queue_wait,
+                "max_queue_wait": self.max_queue_wait,
+                "errors": dict(self.errors),
+            }
+
+
+class ResilientModels:
+    """
+    Wraps client.models of a Gemini client with rate limiting, retries and hedging.
+
+    Every request first takes a token of the rate limiter of its API key. Requests failing with
+    a transient error (see is_transient) are retried up to max_attempts times after a jittered
+    exponential backoff ("full jitter": a random delay up to base_delay * 2^attempt, at most
+    max_delay) or the delay requested by the server, whichever is longer. If hedge_delay is set
+    and a request has not answered within it, a second identical request is started if the rate
+    limit allows and the first answer is used. Streams are retried and hedged until their first
+    chunk has arrived; once text has been passed on, errors end the turn as before.
+    """
+
+    def __init__(self, models, limiter: RateLimiter, stats: ModelStats, max_attempts: int = 5, base_delay: float = 1.0,
+                 max_delay: float = 30.0, hedge_delay: float = 0.0):
+        self.models = models
+        self.limiter = limiter
+        self.stats = stats
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_delay = hedge_delay
+
+    def _hedged(self, request, discard=None):
+        if self.hedge_delay <= 0:
+            return request()
+        first = get_hedge_pool().submit(request)
+        try:
+            return first.result(timeout=self.hedge_delay)
+        except TimeoutError:
+            pass
+        # a hedge is only sent if it does not have to wait for the rate limit
+        if not self.limiter.try_acquire():
+            return first.result()
+        self.stats.add(requests=1, hedged=1)
+        second = get_hedge_pool().submit(request)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self.stats.add(hedge_wins=1)
+                    if discard:
+                        # the slower request cannot be interrupted, its result is dropped once it arrives
+                        other = second if future is first else first
+                        other.add_done_callback(partial(discard_result, discard))
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _with_retries(self, request, discard=None):
+        queue_wait, attempt = 0.0, 0
+        try:
+            while True:
+                wait_time = self.limiter.acquire()
+                queue_wait += wait_time
+                self.stats.add_queue_wait(wait_time)
+                self.stats.add(requests=1)
+                try:
+                    return self._hedged(request, discard)
+                except Exception as e:
+                    self.stats.add_error(e)
+                    attempt += 1
+                    if not is_transient(e) or attempt >= self.max_attempts:
+                        self.stats.add(failed=1)
+                        raise
+                    delay = max(retry_after(e), random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))))
+                    self.stats.add(retries=1)
+                    print(f"{"\033[90m"}logger: Model request failed ({getattr(e, 'code', None) or type(e).__name__}), retry {attempt} of {self.max_attempts - 1} in {delay:.1f} s{"\033[0m"}\n")
+                    time.sleep(delay)
+        finally:
+            # recorded on the "model call" span of the turn
+            model_span = current_span()
+            if model_span is not None:
+                model_span.set(retries=attempt, queue_wait=round(queue_wait, 4))
+
+    def generate_content(self, **kwargs):
+        return self._with_retries(lambda: self.models.generate_content(**kwargs))
+
+    def generate_content_stream(self, **kwargs):
+        end_of_stream = object()
+
+        def request():
+            # the request is only sent when the first chunk is read
+            stream = self.models.generate_content_stream(**kwargs)
+            return stream, next(stream, end_of_stream)
+
+        stream, first = self._with_retries(request, discard=lambda result: result[0].close())
+        return stream if first is end_of_stream else itertools.chain([first], stream)
+
+
+class ModelClient:
+    """
+    Gemini client of one API key whose models retry, rate limit and hedge their requests.
+
+    The underlying genai.Client keeps its HTTP connections open, so all sessions and turns using
+    the same API key reuse them.
+    """
+
+    def __init__(self, api_key: str, limiter: RateLimiter, stats: ModelStats, timeout: float = None, base_url: str = None, **retry_options):
+        from google import genai
+        from google.genai import types
+
+        http_options = types.HttpOptions(timeout=int(timeout * 1000) if timeout else None, base_url=base_url)
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        self.models = ResilientModels(self.client.models, limiter, stats, **retry_options)
+
+
+class ClientPool:
+    """
+    Process-wide pool of ModelClients, one per API key, shared by all sessions and Streamlit reruns.
+
+    Args:
+        max_clients: Maximum number of API keys with a client, the least recently used client is dropped.
+        requests_per_minute: Rate limit of every API key, 0 disables it.
+        burst: Number of requests an API key can send at once after being idle.
+        timeout: Timeout of a request in seconds (connect and every read of a stream), None waits indefinitely.
+        base_url: (Optional) Base URL of the API, e.g. of a local mock server.
+        retry_options: max_attempts, base_delay, max_delay and hedge_delay of ResilientModels.
+    """
+
+    def __init__(self, max_clients: int = 64, requests_per_minute: float = 60.0, burst: int = 10, timeout: float = 60.0,
+                 base_url: str = None, **retry_options):
+        self.max_clients = max_clients
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.timeout = timeout
+        self.base_url = base_url
+        self.retry_options = retry_options
+        self.model_stats = ModelStats()
+        self.hits = 0
+        self.misses = 0
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, api_key: str) -> ModelClient:
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is not None:
+                self.hits += 1
+                self._clients.move_to_end(api_key)
+                return client
+            self.misses += 1
+            limiter = RateLimiter(self.requests_per_minute / 60, self.burst)
+            client = ModelClient(api_key, limiter, self.model_stats, self.timeout, self.base_url, **self.retry_options)
+            self._clients[api_key] = client
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+            return client
+
+    def stats(self) -> dict:
+        with self._lock:
+            pool = {"clients": len(self._clients), "hits": self.hits, "misses": self.misses}
+        return {**pool, **self.model_stats.as_dict()}
+
+
+def client_pool_from_env() -> ClientPool:
+    """
+    Creates a ClientPool configured through the MODEL_* and GEMINI_BASE_URL environment variables.
+    """
+    return ClientPool(
+        requests_per_minute=float(os.getenv("MODEL_REQUESTS_PER_MINUTE", "60")),
+        burst=int(os.getenv("MODEL_BURST", "10")),
+        timeout=float(os.getenv("MODEL_TIMEOUT", "60")) or None,
+        base_url=os.getenv("GEMINI_BASE_URL") or None,
+        max_attempts=int(os.getenv("MODEL_MAX_ATTEMPTS", "5")),
+        base_delay=float(os.getenv("MODEL_BACKOFF", "1.0")),
+        max_delay=float(os.getenv("MODEL_MAX_BACKOFF", "30")),
+        hedge_delay=float(os.getenv("MODEL_HEDGE_DELAY", "0")),
+    )
+
+
+_default_client_pool = None
+_default_client_pool_lock = threading.Lock()
+
+
+def default_client_pool() -> ClientPool:
+    """
+    Returns the process-wide ClientPool.
+    """
+    global _default_client_pool
+    with _default_client_pool_lock:
+        if _default_client_pool is None:
+            _default_client_pool = client_pool_from_env()
+        return _default_client_pool
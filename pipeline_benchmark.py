@@ -0,0 +1,173 @@
+# Benchmarks the analysis pipeline, run with "python pipeline_benchmark.py --output benchmark.json".
+#
+# Every section generator of tool_declaration.json is run at a small, medium and large mesh
+# through the tool calls of a typical turn: generate the section, calculate the geometric and
+# warping properties, calculate the stresses and plot them. The model is replaced by a
+# ScriptedClient replaying these calls through call_LLM, so the turn takes the same path as in
+# the app without network latency. The time of every stage is taken from the profiling spans of
+# the turn. The section and render caches are disabled, so every run solves and renders again.
+#
+# With --baseline the results are compared to an earlier result file and stages that got slower
+# than the tolerance are reported. The exit code is 1 if there is a regression.
+
+import os
+import io
+import sys
+import json
+import asyncio
+import argparse
+import platform
+import statistics
+import contextlib
+
+# every run must solve and render, nothing may be served from a cache or solved in the background
+os.environ.update({"SECTION_CACHE_SIZE": "0", "SECTION_CACHE_DIR": "", "RENDER_CACHE_MB": "0", "SPECULATIVE_ANALYSES": "", "TRACE_FILE": ""})
+os.environ.setdefault("MPLBACKEND", "Agg")
+# the app is run without a Streamlit server
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+from profiling import span
+from scripted_client import EXAMPLE_SECTIONS, ScriptedClient
+
+
+# the mesh size of every size is the section area divided by this number. The resulting meshes
+# have about three times as many elements, more for small sections with finely discretised radii.
+SIZES = {"small": 250, "medium": 1000, "large": 2500}
+ACTIONS = {"n": -1e5, "vy": 1e4, "mxx": 5e6, "mzz": 1e6}
+# stages reported per case, named like the profiling spans
+STAGES = ["mesh", "geometric analysis", "warping analysis", "stress analysis", "plot", "render", "model call", "turn"]
+# stages faster than this in both runs are not compared, their differences are noise
+MIN_COMPARED_TIME = 0.01
+
+
+def benchmark_script(generator: str, args: dict) -> list:
+    return [
+        [{"function_call": {"name": generator, "args": args}}],
+        [{"function_call": {"name": "calculate_geometric_properties", "args": {}}}],
+        [{"function_call": {"name": "calculate_warping_properties", "args": {}}}],
+        [{"function_call": {"name": "calculate_stress", "args": ACTIONS}}],
+        [{"function_call": {"name": "plot_stress", "args": {"stress": "vm"}}}],
+        [{"text": "The section has been analysed and the von Mises stresses have been plotted."}],
+    ]
+
+
+def run_case(generator: str, args: dict) -> dict:
+    """
+    Runs one scripted turn and returns the number of elements and the wall time of every stage.
+    """
+    import main_streamlit
+
+    client = ScriptedClient(benchmark_script(generator, args))
+    history = []
+    # the log lines of the app are not part of the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()), span("turn") as turn_span:
+        asyncio.run(main_streamlit.call_LLM(client, "scripted", main_streamlit.get_config(), "Analyse the section.", history, []))
+
+    errors = [
+        part.function_response.response.get("message")
+        for content in history for part in content.parts
+        if part.function_response and part.function_response.response.get("status") != "success"
+    ]
+    if errors:
+        raise RuntimeError(f"{generator} failed: {errors}")
+
+    times = {stage: 0.0 for stage in STAGES}
+    elements = None
+    for _, item in turn_span.walk():
+        if item.name in times:
+            times[item.name] += item.wall_time
+        if item.name == "mesh":
+            elements = item.attributes.get("elements")
+    return {"elements": elements, "stages": times}
+
+
+def run_benchmark(generators: list, sizes: list, repeat: int) -> dict:
+    from sectionproperties.pre import library
+
+    results = {}
+    for generator in generators:
+        args = EXAMPLE_SECTIONS[generator]
+        area = getattr(library, generator)(**args).calculate_area()
+        for size in sizes:
+            case_args = {**args, "mesh_size": area / SIZES[size]}
+            runs = [run_case(generator, case_args) for _ in range(repeat)]
+            results[f"{generator}/{size}"] = {
+                "elements": runs[0]["elements"],
+                "stages": {stage: statistics.median(run["stages"][stage] for run in runs) for stage in STAGES},
+            }
+            timing = results[f"{generator}/{size}"]
+            print(f"{generator + '/' + size:<36} {timing['elements']:6d} elements   " + "   ".join(
+                f"{stage} {timing['stages'][stage]:.3f}" for stage in ["mesh", "geometric analysis", "warping analysis", "stress analysis", "render", "turn"]
+            ))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns the stages that are slower than in the baseline by more than the relative tolerance.
+    """
+    regressions = []
+    for case, timing in results.items():
+        if case not in baseline:
+            continue
+        for stage, value in timing["stages"].items():
+            old = baseline[case]["stages"].get(stage)
+            if old is None or max(old, value) < MIN_COMPARED_TIME:
+                continue
+            if value > old * (1 + tolerance):
+                regressions.append({"case": case, "stage": stage, "baseline": old, "time": value, "change": value / old - 1 if old else float("inf")})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks every section generator through mesh, geometric, warping and stress analysis and plotting.")
+    parser.add_argument("--generators", help="Comma separated generators (default: all declared generators).")
+    parser.add_argument("--sizes", default=",".join(SIZES), help=f"Comma separated mesh sizes (default: {','.join(SIZES)}).")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs per case, the median is reported (default: 1).")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare the results to this earlier result file.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative slowdown reported as regression (default: 0.2).")
+    args = parser.parse_args()
+
+    from importlib.metadata import version
+    from tool_handlers import default_registry
+
+    registry = default_registry()
+    declared = [declaration["name"] for declaration in registry.declarations if registry.is_generator(declaration["name"])]
+    missing = [generator for generator in declared if generator not in EXAMPLE_SECTIONS]
+    if missing:
+        print(f"No benchmark arguments for {missing}, please add them to EXAMPLE_SECTIONS.", file=sys.stderr)
+    generators = args.generators.split(",") if args.generators else [generator for generator in declared if generator in EXAMPLE_SECTIONS]
+    sizes = args.sizes.split(",")
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"Unknown sizes {unknown}. Valid sizes are {list(SIZES)}.")
+
+    # the first turn imports the analysis stack, it is not measured
+    run_case("i_section", EXAMPLE_SECTIONS["i_section"])
+    results = run_benchmark(generators, sizes, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": sys.version.split()[0],
+                "sectionproperties": version("sectionproperties"),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "sizes": {size: SIZES[size] for size in sizes},
+                "results": results,
+            }, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression {regression['case']:<36} {regression['stage']:<20} {regression['baseline']:.3f} s -> {regression['time']:.3f} s ({regression['change']:+.0%})")
+        print(f"{len(regressions)} regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+TRACE_FORMATS = ["jsonl", "otlp"]
+
+# the innermost open span of the current thread or asyncio task. Tool calls are run with a copy
+# of the context of the model response that requested them, so their spans become its children.
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+
+
+def rss_bytes() -> int:
+    """
+    Returns the resident set size of the process in bytes, or None if it is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Span:
+    """
+    A timed stage of a turn, e.g. a model call, a tool call or the meshing of a section.
+
+    Spans form a tree: turn -> model call -> tool call -> sub-stage. Every span records its wall
+    time, the CPU time of the thread that ran it, the change of the resident memory of the
+    process and attributes such as element or token counts. Memory deltas of spans running
+    concurrently in different threads overlap.
+    """
+
+    def __init__(self, name: str, parent=None, attributes: dict = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.status = "ok"
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self.wall_time = None
+        self.cpu_time = None
+        self.memory_delta = None
+        self._lock = threading.Lock()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_child(self, child):
+        # children of one span can finish concurrently in different tool worker threads
+        with self._lock:
+            self.children.append(child)
+
+    def walk(self, depth: int = 0):
+        """
+        Yields (depth, span) for this span and all its descendants in start order.
+        """
+        yield depth, self
+        for child in sorted(self.children, key=lambda child: child.start_time):
+            yield from child.walk(depth + 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time / 1e9,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "memory_delta": self.memory_delta,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Records a span as a child of the current span, use it as "with span("mesh") as s: ...".
+
+    Spans without a parent are exported when they end, see export_trace.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent, attributes)
+    token = _current_span.set(current)
+    memory_before = rss_bytes()
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attributes["error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        current.wall_time = time.perf_counter() - wall_start
+        current.cpu_time = time.thread_time() - cpu_start
+        current.end_time = time.time_ns()
+        memory_after = rss_bytes()
+        if memory_before is not None and memory_after is not None:
+            current.memory_delta = memory_after - memory_before
+        _current_span.reset(token)
+        if parent is not None:
+            parent.add_child(current)
+        else:
+            export_trace(current)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64 bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_trace(root: Span) -> dict:
+    """
+    Converts a span tree to an OTLP/JSON ExportTraceServiceRequest, as written by the file
+    exporter of the OpenTelemetry collector.
+    """
+    spans = []
+    for _, item in root.walk():
+        attributes = {**item.attributes, "cpu_time_s": item.cpu_time}
+        if item.memory_delta is not None:
+            attributes["memory_delta_bytes"] = item.memory_delta
+        spans.append({
+            "traceId": item.trace_id,
+            "spanId": item.span_id,
+            "parentSpanId": item.parent_id or "",
+            "name": item.name,
+            "kind": 1,
+            "startTimeUnixNano": str(item.start_time),
+            "endTimeUnixNano": str(item.end_time),
+            "attributes": [{"key": key, "value": otlp_value(value)} for key, value in attributes.items() if value is not None],
+            "status": {"code": 2 if item.status == "error" else 1},
+        })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "sectionproperties-assistant"}}]},
+        "scopeSpans": [{"scope": {"name": "profiling"}, "spans": spans}],
+    }]}
+
+
+def export_trace(root: Span, path: str = None, trace_format: str = None):
+    """
+    Appends a finished span tree to the trace file.
+
+    The file and its format are set with the TRACE_FILE and TRACE_FORMAT environment variables,
+    nothing is written if TRACE_FILE is not set. The "jsonl" format writes one line per span,
+    the "otlp" format one OTLP/JSON line per trace.
+    """
+    path = path or os.getenv("TRACE_FILE")
+    if not path:
+        return
+    trace_format = trace_format or os.getenv("TRACE_FORMAT", "jsonl")
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f"Unknown TRACE_FORMAT '{trace_format}'. Valid formats are {TRACE_FORMATS}.")
+    if trace_format == "otlp":
+        lines = [json.dumps(otlp_trace(root))]
+    else:
+        lines = [json.dumps({**item.to_dict(), "depth": depth}) for depth, item in root.walk()]
+    with _export_lock, open(path, "a") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def timing_rows(root: Span) -> list:
+    """
+    Flattens a span tree into table rows for display, the names are indented by their depth.
+    """
+    rows = []
+    for depth, item in root.walk():
+        rows.append({
+            "stage": "  " * depth + item.name,
+            "wall [s]": round(item.wall_time, 3),
+            "cpu [s]": round(item.cpu_time, 3),
+            "memory [MB]": round(item.memory_delta / 2**20, 1) if item.memory_delta is not None else None,
+            "details": ", ".join(f"{key}={value}" for key, value in item.attributes.items()),
+        })
+    return rows
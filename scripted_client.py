@@ -0,0 +1,276 @@
+import re
+import json
+
+from history_manager import content_tokens, history_tokens, turn_starts
+from tool_selector import GENERATOR_ALIASES
+
+
+# words per streamed text chunk
+CHUNK_WORDS = 8
+FINAL_TEXT = "All scripted responses have been replayed."
+
+# representative arguments of every section generator, used by the benchmarks and the rule based model
+EXAMPLE_SECTIONS = {
+    "circular_hollow_section": {"d": 168.3, "t": 7.1, "n": 64},
+    "elliptical_hollow_section": {"d_x": 200, "d_y": 100, "t": 8, "n": 64},
+    "rectangular_hollow_section": {"d": 200, "b": 100, "t": 6, "r_out": 15, "n_r": 8},
+    "polygon_hollow_section": {"d": 200, "t": 6, "n_sides": 6, "r_in": 10, "n_r": 8},
+    "i_section": {"d": 310, "b": 165, "t_f": 9.7, "t_w": 6.1, "r": 11.4, "n_r": 8},
+    "mono_i_section": {"d": 300, "b_t": 150, "b_b": 200, "t_ft": 10, "t_fb": 15, "t_w": 8, "r": 12, "n_r": 8},
+    "tapered_flange_i_section": {"d": 588, "b": 191, "t_f": 27.2, "t_w": 15.2, "r_r": 17.8, "r_f": 8.9, "alpha": 8, "n_r": 8},
+    "channel_section": {"d": 250, "b": 90, "t_f": 15, "t_w": 8, "r": 12, "n_r": 8},
+    "tapered_flange_channel": {"d": 254, "b": 76, "t_f": 12, "t_w": 6, "r_r": 12, "r_f": 6, "alpha": 8, "n_r": 8},
+    "tee_section": {"d": 200, "b": 100, "t_f": 12, "t_w": 6, "r": 8, "n_r": 8},
+    "angle_section": {"d": 150, "b": 90, "t": 12, "r_r": 10, "r_t": 5, "n_r": 8},
+    "cee_section": {"d": 125, "b": 30, "l": 12, "t": 1.5, "r_out": 3, "n_r": 8},
+    "zed_section": {"d": 100, "b_l": 40, "b_r": 50, "l": 10, "t": 2, "r_out": 5, "n_r": 8},
+    "box_girder_section": {"d": 1200, "b_t": 1200, "b_b": 700, "t_ft": 16, "t_fb": 20, "t_w": 12},
+    "bulb_section": {"d": 160, "b": 40, "t": 8, "r": 5, "n_r": 8},
+}
+
+
+class ScriptedModels:
+    """
+    Stand-in for client.models of the Gemini client that replays a fixed list of responses.
+    """
+
+    def __init__(self, responses: list):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def response_spec(self, contents) -> list:
+        """
+        Returns the parts of the next response.
+
+        Every response is a list of parts given as {"text": ...} or {"function_call": {"name": ..., "args": ...}}.
+        Once the script is exhausted, a short text response is returned.
+        """
+        spec = self.responses[self.calls] if self.calls < len(self.responses) else [{"text": FINAL_TEXT}]
+        self.calls += 1
+        return spec
+
+    def next_response(self, contents):
+        """
+        Builds the next response as content with its estimated token usage.
+        """
+        from google.genai import types
+
+        spec = self.response_spec(contents)
+        parts = []
+        for part in spec:
+            if "function_call" in part:
+                parts.append(types.Part(function_call=types.FunctionCall(name=part["function_call"]["name"], args=part["function_call"].get("args", {}))))
+            else:
+                parts.append(types.Part(text=part["text"]))
+        content = types.Content(role="model", parts=parts)
+        # the token counts are estimated like the history of the app
+        usage_metadata = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=history_tokens(contents), candidates_token_count=content_tokens(content)
+        )
+        return content, usage_metadata
+
+    def generate_content(self, model, contents, config=None):
+        from google.genai import types
+
+        content, usage_metadata = self.next_response(contents)
+        return types.GenerateContentResponse(candidates=[types.Candidate(content=content)], usage_metadata=usage_metadata)
+
+    def generate_content_stream(self, model, contents, config=None):
+        from google.genai import types
+
+        content, usage_metadata = self.next_response(contents)
+        chunks = []
+        for part in content.parts:
+            if part.text:
+                words = part.text.split(" ")
+                for start in range(0, len(words), CHUNK_WORDS):
+                    text = " ".join(words[start:start + CHUNK_WORDS]) + (" " if start + CHUNK_WORDS < len(words) else "")
+                    chunks.append([types.Part(text=text)])
+            else:
+                chunks.append([part])
+        chunks = chunks or [[]]
+
+        def stream():
+            for i, parts in enumerate(chunks):
+                yield types.GenerateContentResponse(
+                    candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+                    # the usage is reported with the last chunk like by the Gemini API
+                    usage_metadata=usage_metadata if i == len(chunks) - 1 else None,
+                )
+        return stream()
+
+
+class ScriptedClient:
+    """
+    Stand-in for the Gemini client that replays fixed model responses, e.g. for benchmarks.
+
+    It can be passed to call_LLM of both entry points instead of genai.Client, so a turn runs
+    through the same tool dispatching, history handling and rendering as with the real model.
+
+    Args:
+        responses: The model responses in call order, see ScriptedModels.next_response.
+    """
+
+    def __init__(self, responses: list):
+        self.models = ScriptedModels(responses)
+
+
+STRESS_ACTIONS = ["n", "vx", "vy", "mxx", "myy", "m11", "m22", "mzz"]
+# actions whose stresses need the warping properties
+WARPING_ACTIONS = ["vx", "vy", "mzz"]
+# unit factors to the N and mm units of the tools
+UNIT_FACTORS = {"kn": 1e3, "knm": 1e6, "n": 1.0, "nmm": 1.0}
+PLOT_STRESSES = [("von mises", "vm"), ("vm", "vm"), ("axial", "zz"), ("normal", "zz"), ("zz", "zz"), ("shear", "zxy"), ("zxy", "zxy")]
+HELP_TEXT = (
+    "I can generate standard sections (e.g. 'i section d=310 b=165'), calculate their geometric and warping "
+    "properties, calculate stresses (e.g. 'stresses for Mxx = 5 kNm') and plot them (e.g. 'plot the von mises stresses')."
+)
+
+
+def parse_number(text: str):
+    value = float(text)
+    return int(value) if value.is_integer() and "." not in text and "e" not in text else value
+
+
+def called_tools(contents) -> list:
+    """
+    Returns the names of the tools called since the latest section generator, the generator included.
+    """
+    names = []
+    for content in contents:
+        for part in content.parts or []:
+            if part.function_call:
+                if part.function_call.name in EXAMPLE_SECTIONS:
+                    names = []
+                names.append(part.function_call.name)
+    return names
+
+
+def rule_based_spec(prompt: str, contents=()) -> list:
+    """
+    Translates a common prompt into tool calls without a model, e.g. "i section d=300 and its properties".
+
+    Generators are recognised by their name (or CHS, RHS, SHS, EHS) and use the example
+    arguments of EXAMPLE_SECTIONS, overridden by "name=value" pairs of the prompt. Actions are
+    given as "Mxx = 5 kNm" or "Vy = 10 kN", stresses are plotted if the prompt asks for a plot.
+    Prompts asking for an estimate use the estimate mode of the generators.
+    Geometric and warping analyses that the requested analyses need and that are missing in the
+    conversation are added.
+    """
+    text = prompt.lower()
+    generator = None
+    for name in sorted(EXAMPLE_SECTIONS, key=len, reverse=True):
+        phrase = name.replace("_", " ")
+        short = phrase.removesuffix(" section")
+        if re.search(rf"\b{re.escape(phrase)}\b", text) or (len(short) > 2 and re.search(rf"\b{re.escape(short)}\b", text)):
+            generator = name
+            break
+    if generator is None:
+        generator = next((name for alias, name in GENERATOR_ALIASES.items() if re.search(rf"\b{alias}\b", text)), None)
+
+    calls = []
+    pairs = re.findall(r"\b([a-z][a-z0-9_]*)\s*=\s*(-?\d+(?:\.\d+)?(?:e-?\d+)?)(?:\s*(knm|kn|nmm|n)\b(?!\s*=))?", text)
+    if generator:
+        args = dict(EXAMPLE_SECTIONS[generator])
+        # parameters of the generator take precedence over actions of the same name, e.g. n of a CHS
+        args.update({key: parse_number(value) for key, value, _ in pairs if key in args or key == "mesh_size"})
+        if "estimate" in text:
+            args["estimate"] = True
+        calls.append({"name": generator, "args": args})
+    actions = {
+        key: parse_number(value) * UNIT_FACTORS.get(unit, 1.0)
+        for key, value, unit in pairs
+        if key in STRESS_ACTIONS and not (generator and key in EXAMPLE_SECTIONS[generator])
+    }
+
+    done = [] if generator else called_tools(contents)
+    wants_warping = "warping" in text or "torsion" in text or "all properties" in text or any(key in WARPING_ACTIONS for key in actions)
+    # estimated properties are only verified by the finite element analysis on request
+    wants_geometric = wants_warping or actions or "verif" in text or (("propert" in text or "geometric" in text) and "estimate" not in text)
+    if wants_geometric and "calculate_geometric_properties" not in done:
+        calls.append({"name": "calculate_geometric_properties", "args": {}})
+    if wants_warping and "calculate_warping_properties" not in done:
+        calls.append({"name": "calculate_warping_properties", "args": {}})
+    if actions:
+        calls.append({"name": "calculate_stress", "args": actions})
+    if "plot" in text and (actions or "stress" in text or any(word in text for word, _ in PLOT_STRESSES)):
+        stress = next((stress for word, stress in PLOT_STRESSES if re.search(rf"\b{word}\b", text)), "vm")
+        calls.append({"name": "plot_stress", "args": {"stress": stress}})
+
+    if not calls:
+        return [{"text": HELP_TEXT}]
+    return [{"function_call": call} for call in calls]
+
+
+class RuleBasedModels(ScriptedModels):
+    """
+    Stand-in for client.models that answers common prompts with tool calls by rule_based_spec
+    and reports the status of the tool results as text.
+    """
+
+    def __init__(self):
+        super().__init__([])
+
+    def response_spec(self, contents) -> list:
+        self.calls += 1
+        last = contents[-1]
+        results = [part.function_response for part in last.parts or [] if part.function_response]
+        if results:
+            return [{"text": " ".join(
+                f"{result.name}: {((result.response or {}).get('message') or (result.response or {}).get('status', 'done')).rstrip('.')}." for result in results
+            )}]
+        return rule_based_spec(" ".join(part.text for part in last.parts or [] if part.text), contents)
+
+
+class RuleBasedClient:
+    """
+    Stand-in for the Gemini client that translates common prompts into tool calls, e.g. for load tests.
+    """
+
+    def __init__(self):
+        self.models = RuleBasedModels()
+
+
+def part_spec(part) -> dict:
+    """
+    Converts a model part to the response format of ScriptedModels, thoughts and empty parts give None.
+    """
+    if part.function_call:
+        return {"function_call": {"name": part.function_call.name, "args": dict(part.function_call.args or {})}}
+    if part.text and not part.thought:
+        return {"text": part.text}
+    return None
+
+
+def transcript_turn(history: list) -> dict:
+    """
+    Extracts the latest turn of a conversation as {"prompt": ..., "responses": [...]}.
+
+    The model parts of every model call are stored as one response. A turn recorded like this
+    is replayed by ScriptedClient with the same tool calls.
+    """
+    start = turn_starts(history)[-1]
+    prompt = " ".join(part.text for part in history[start].parts if part.text)
+    responses = []
+    previous_role = None
+    for content in history[start + 1:]:
+        if content.role == "model":
+            specs = [spec for spec in (part_spec(part) for part in content.parts or []) if spec]
+            if previous_role != "model":
+                responses.append([])
+            responses[-1].extend(specs)
+        previous_role = content.role
+    return {"prompt": prompt, "responses": [response for response in responses if response]}
+
+
+def load_transcript(path: str) -> list:
+    """
+    Reads the turns of a transcript file written by record_turn, one JSON turn per line.
+    """
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record_turn(path: str, history: list):
+    with open(path, "a") as f:
+        f.write(json.dumps(transcript_turn(history)) + "\n")
@@ -0,0 +1,289 @@
+import os
+import copy
+import json
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from profiling import current_span, span
+from solver_pool import default_solver_pool
+
+
+# analysis stages in the order they build on each other, a cached later stage also
+# contains the results of all earlier stages
+ANALYSIS_STAGES = ["geometric", "warping"]
+
+
+def canonical_args(args: dict) -> str:
+    """
+    Creates a canonical string representation of tool call arguments.
+
+    Numbers are normalised to floats so that e.g. d=310 and d=310.0 map to the same key,
+    and the keys are sorted so that the argument order of the model does not matter.
+
+    Args:
+        args: The arguments of the tool call.
+
+    Returns:
+        A JSON string that is identical for equivalent argument sets.
+    """
+    normalised = {}
+    for key, value in dict(args or {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = float(value)
+        normalised[key] = value
+    return json.dumps(normalised, sort_keys=True)
+
+
+def section_hash(sec) -> str:
+    """
+    Creates a content hash of a meshed section.
+
+    The hash covers the mesh vertices, the element connectivity, the element attributes
+    and the materials, i.e. everything the finite element analysis depends on.
+
+    Args:
+        sec: The sectionproperties Section object.
+
+    Returns:
+        A hex digest identifying the section.
+    """
+    digest = hashlib.sha256()
+    for name in ["vertices", "triangles", "triangle_attributes"]:
+        array = np.ascontiguousarray(sec.mesh[name])
+        digest.update(name.encode())
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    for material in sec.materials:
+        digest.update(repr((material.name, material.elastic_modulus, material.poissons_ratio, material.yield_strength, material.density)).encode())
+    return digest.hexdigest()
+
+
+class SectionCache:
+    """
+    Thread-safe LRU cache for meshed sections and analysed sections with an optional on-disk tier.
+
+    Entries are stored as deep copies so that sessions can keep mutating the sections they
+    receive (e.g. by running a warping analysis) without affecting the cached state.
+    """
+
+    def __init__(self, max_entries: int = 32, disk_dir: str = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        # futures of analyses running in the background, see add_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    @classmethod
+    def analysis_key(cls, content: str, analysis: str, kwargs: dict = None) -> str:
+        return cls.make_key("analysis", content, analysis, canonical_args(kwargs))
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def get(self, key, record_miss: bool = True):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self._entries[key])
+
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    value = pickle.load(f)
+            except Exception:
+                # a corrupt or incompatible file is treated like a miss
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, value)
+                return copy.deepcopy(value)
+
+        if record_miss:
+            with self._lock:
+                self.misses += 1
+        return None
+
+    def contains(self, key) -> bool:
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.disk_dir) and os.path.exists(self._disk_path(key))
+
+    def add_pending(self, key, future) -> bool:
+        """
+        Registers the future of an analysis running in the background, e.g. a speculative analysis.
+
+        analyse() waits for the future instead of solving again. The future has to be put in
+        the running state once the analysis starts and its result stored with put() before it
+        is finished. Returns False if the key already has a pending analysis.
+        """
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending[key] = future
+        future.add_done_callback(lambda _: self._remove_pending(key, future))
+        return True
+
+    def _remove_pending(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def wait_pending(self, key):
+        """
+        Waits for the pending analysis of a key and returns its result from the cache, or None.
+
+        An analysis that has not started yet is cancelled, the caller then solves it with the
+        priority of a tool call instead of waiting behind other jobs.
+        """
+        with self._lock:
+            future = self._pending.get(key)
+        if future is None or future.cancel():
+            return None
+        with span("wait for background analysis"):
+            try:
+                future.result()
+            except Exception:
+                # cancelled or failed, the caller solves the analysis itself
+                return None
+        return self.get(key, record_miss=False)
+
+    def put(self, key, value):
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._store(key, value)
+        if self.disk_dir:
+            # write to a temporary file first so that concurrent readers never see partial files
+            tmp_path = f"{self._disk_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self._disk_path(key))
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_section(self, name: str, generator, args: dict, mesh_size: float):
+        """
+        Returns a meshed Section for a section generator call, building it only on a cache miss.
+
+        Args:
+            name: Name of the section generator, e.g. "i_section".
+            generator: The section generator function from sectionproperties.pre.library.
+            args: The arguments of the generator call.
+            mesh_size: The element size used for meshing.
+
+        Returns:
+            The meshed Section object. The generated geometry is available as sec.geometry.
+        """
+        from sectionproperties.analysis import Section
+
+        key = self.make_key("mesh", name, canonical_args(args), float(mesh_size))
+        sec = self.get(key)
+        if sec is None:
+            def build():
+                geom = generator(**args)
+                geom.create_mesh(mesh_sizes=mesh_size)
+                sec = Section(geometry=geom)
+                current_span().set(elements=len(sec.elements), nodes=sec.num_nodes)
+                return sec
+
+            # meshing and the analyses below run in the solver pool shared by all sessions
+            sec = default_solver_pool().run("mesh", build, "mesh", mesh_size=float(mesh_size))
+            self.put(key, sec)
+        return sec
+
+    def analyse(self, sec, analysis: str, **kwargs):
+        """
+        Runs a geometric or warping analysis on a section, serving the result from the cache if possible.
+
+        Args:
+            sec: The meshed Section object.
+            analysis: Type of the analysis, either "geometric" or "warping".
+            **kwargs: Arguments passed on to the analysis method of the section.
+
+        Returns:
+            The analysed Section object. On a cache hit this is a new object which replaces sec.
+        """
+        content = section_hash(sec)
+        # a cached later stage also satisfies a request for an earlier stage
+        stages = ANALYSIS_STAGES[ANALYSIS_STAGES.index(analysis):]
+        for stage in reversed(stages):
+            cached = self.get(self.analysis_key(content, stage, kwargs), record_miss=False)
+            if cached is not None:
+                return cached
+        # an analysis running in the background is waited for, the earliest stage finishes first.
+        # The cache is checked again as a background analysis may have finished in the meantime.
+        for stage in stages:
+            analysed = self.wait_pending(self.analysis_key(content, stage, kwargs))
+            if analysed is not None:
+                return analysed
+        for stage in reversed(stages):
+            cached = self.get(self.analysis_key(content, stage, kwargs), record_miss=(stage == analysis))
+            if cached is not None:
+                return cached
+
+        default_solver_pool().run(
+            analysis, lambda: getattr(sec, f"calculate_{analysis}_properties")(**kwargs), f"{analysis} analysis", elements=len(sec.elements)
+        )
+        self.put(self.analysis_key(content, analysis, kwargs), sec)
+        return sec
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+def cache_from_env() -> SectionCache:
+    """
+    Creates a SectionCache configured through the SECTION_CACHE_SIZE and SECTION_CACHE_DIR environment variables.
+    """
+    max_entries = int(os.getenv("SECTION_CACHE_SIZE", "32"))
+    disk_dir = os.getenv("SECTION_CACHE_DIR") or None
+    return SectionCache(max_entries=max_entries, disk_dir=disk_dir)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> SectionCache:
+    """
+    Returns the process-wide SectionCache shared by all sessions and tool worker threads.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = cache_from_env()
+        return _default_cache
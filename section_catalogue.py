@@ -0,0 +1,325 @@
+# Catalogue of standard steel sections, rebuilt with "python section_catalogue.py build".
+#
+# The catalogue holds the rolled I sections (IPE, HEA, HEB), parallel flange channels (UPE) and
+# hot-finished hollow sections (CHS, SHS, RHS) of the tables below with their dimensions and the
+# geometric, plastic and warping properties calculated by sectionproperties from these
+# dimensions. The properties are calculated offline with the section generators of the library
+# and stored in section_catalogue.npz: the designations, generators and arguments as string
+# arrays and all properties as one float matrix. The file is loaded once per process and
+# queried with NumPy, so the app looks up standard sections without meshing.
+#
+# The properties are calculated on the finite element mesh of the idealised section, e.g. the
+# root radii are arcs of n_r points, so they can differ slightly from the values of the
+# producers' tables.
+
+import os
+import re
+import sys
+import json
+import time
+import difflib
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from section_results import DEFAULT_PRECISION, DEFAULT_VERBOSITY, properties_result, round_value
+from section_sweep import GEOMETRIC_PROPERTIES, PLASTIC_PROPERTIES, WARPING_PROPERTIES
+
+
+CATALOGUE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "section_catalogue.npz")
+# density of steel in kg/mm³, the catalogue mass is the mass per metre in kg/m
+STEEL_DENSITY = 7.85e-6
+# the mass and the axial rigidity of sectionproperties are meaningless without a material
+CATALOGUE_PROPERTIES = [prop for prop in GEOMETRIC_PROPERTIES + PLASTIC_PROPERTIES + WARPING_PROPERTIES if prop not in ["mass", "ea"]]
+# dimensions of the generators, stored as properties so that they can be queried as well
+DIMENSIONS = ["d", "b", "t_f", "t_w", "t", "r", "r_out"]
+# units of the catalogue properties that are not section properties of sectionproperties
+CATALOGUE_UNITS = {"mass": "kg/m", **{dimension: "mm" for dimension in DIMENSIONS}}
+# properties reported for every section of a query result unless others are requested
+SUMMARY_PROPERTIES = ["mass", "area", "ixx_c", "iyy_c", "zxx_plus", "sxx", "j", "gamma"]
+
+# rolled I sections and channels (EN 10365): h, b, t_w, t_f, r in mm
+IPE = {
+    80: (80, 46, 3.8, 5.2, 5), 100: (100, 55, 4.1, 5.7, 7), 120: (120, 64, 4.4, 6.3, 7), 140: (140, 73, 4.7, 6.9, 7),
+    160: (160, 82, 5.0, 7.4, 9), 180: (180, 91, 5.3, 8.0, 9), 200: (200, 100, 5.6, 8.5, 12), 220: (220, 110, 5.9, 9.2, 12),
+    240: (240, 120, 6.2, 9.8, 15), 270: (270, 135, 6.6, 10.2, 15), 300: (300, 150, 7.1, 10.7, 15), 330: (330, 160, 7.5, 11.5, 18),
+    360: (360, 170, 8.0, 12.7, 18), 400: (400, 180, 8.6, 13.5, 21), 450: (450, 190, 9.4, 14.6, 21), 500: (500, 200, 10.2, 16.0, 21),
+    550: (550, 210, 11.1, 17.2, 24), 600: (600, 220, 12.0, 19.0, 24),
+}
+HEA = {
+    100: (96, 100, 5.0, 8.0, 12), 120: (114, 120, 5.0, 8.0, 12), 140: (133, 140, 5.5, 8.5, 12), 160: (152, 160, 6.0, 9.0, 15),
+    180: (171, 180, 6.0, 9.5, 15), 200: (190, 200, 6.5, 10.0, 18), 220: (210, 220, 7.0, 11.0, 18), 240: (230, 240, 7.5, 12.0, 21),
+    260: (250, 260, 7.5, 12.5, 24), 280: (270, 280, 8.0, 13.0, 24), 300: (290, 300, 8.5, 14.0, 27), 320: (310, 300, 9.0, 15.5, 27),
+    340: (330, 300, 9.5, 16.5, 27), 360: (350, 300, 10.0, 17.5, 27), 400: (390, 300, 11.0, 19.0, 27), 450: (440, 300, 11.5, 21.0, 27),
+    500: (490, 300, 12.0, 23.0, 27), 550: (540, 300, 12.5, 24.0, 27), 600: (590, 300, 13.0, 25.0, 27),
+}
+HEB = {
+    100: (100, 100, 6.0, 10.0, 12), 120: (120, 120, 6.5, 11.0, 12), 140: (140, 140, 7.0, 12.0, 12), 160: (160, 160, 8.0, 13.0, 15),
+    180: (180, 180, 8.5, 14.0, 15), 200: (200, 200, 9.0, 15.0, 18), 220: (220, 220, 9.5, 16.0, 18), 240: (240, 240, 10.0, 17.0, 21),
+    260: (260, 260, 10.0, 17.5, 24), 280: (280, 280, 10.5, 18.0, 24), 300: (300, 300, 11.0, 19.0, 27), 320: (320, 300, 11.5, 20.5, 27),
+    340: (340, 300, 12.0, 21.5, 27), 360: (360, 300, 12.5, 22.5, 27), 400: (400, 300, 13.5, 24.0, 27), 450: (450, 300, 14.0, 26.0, 27),
+    500: (500, 300, 14.5, 28.0, 27), 550: (550, 300, 15.0, 29.0, 27), 600: (600, 300, 15.5, 30.0, 27),
+}
+UPE = {
+    80: (80, 50, 4.0, 7.0, 10), 100: (100, 55, 4.5, 7.5, 10), 120: (120, 60, 5.0, 8.0, 12), 140: (140, 65, 5.0, 9.0, 12),
+    160: (160, 70, 5.5, 9.5, 12), 180: (180, 75, 5.5, 10.5, 12), 200: (200, 80, 6.0, 11.0, 13), 220: (220, 85, 6.5, 12.0, 13),
+    240: (240, 90, 7.0, 12.5, 15), 270: (270, 95, 7.5, 13.5, 15), 300: (300, 100, 9.5, 15.0, 15), 330: (330, 105, 11.0, 16.0, 18),
+    360: (360, 110, 12.0, 17.0, 18), 400: (400, 115, 13.5, 18.0, 18),
+}
+# hot-finished hollow sections (EN 10210): outside dimensions in mm and the wall thicknesses
+CHS = {
+    48.3: [3.2, 4.0], 60.3: [3.2, 4.0, 5.0], 76.1: [3.2, 4.0, 5.0], 88.9: [4.0, 5.0, 6.3], 114.3: [4.0, 5.0, 6.3],
+    139.7: [5.0, 6.3, 8.0], 168.3: [5.0, 6.3, 8.0, 10.0], 193.7: [6.3, 8.0, 10.0], 219.1: [6.3, 8.0, 10.0, 12.5],
+    244.5: [8.0, 10.0, 12.5], 273.0: [8.0, 10.0, 12.5], 323.9: [8.0, 10.0, 12.5], 355.6: [10.0, 12.5, 16.0], 406.4: [10.0, 12.5, 16.0],
+}
+SHS = {
+    40: [3.0, 4.0], 50: [3.0, 4.0, 5.0], 60: [4.0, 5.0], 70: [4.0, 5.0], 80: [4.0, 5.0, 6.3], 90: [5.0, 6.3], 100: [5.0, 6.3, 8.0],
+    120: [6.3, 8.0, 10.0], 140: [6.3, 8.0, 10.0], 150: [8.0, 10.0], 160: [8.0, 10.0, 12.5], 180: [8.0, 10.0, 12.5],
+    200: [8.0, 10.0, 12.5, 16.0], 250: [10.0, 12.5, 16.0], 300: [10.0, 12.5, 16.0],
+}
+RHS = {
+    (100, 50): [4.0, 5.0, 6.3], (120, 60): [5.0, 6.3], (120, 80): [5.0, 6.3], (150, 100): [6.3, 8.0, 10.0], (160, 80): [6.3, 8.0],
+    (200, 100): [6.3, 8.0, 10.0], (250, 150): [8.0, 10.0, 12.5], (300, 200): [10.0, 12.5], (400, 200): [10.0, 12.5, 16.0],
+}
+# number of points of the circles and corner radii of the generated sections
+N_CIRCLE = 64
+N_R = 8
+
+
+def number(value: float) -> str:
+    return f"{value:g}"
+
+
+def catalogue_entries() -> list:
+    """
+    Returns the (designation, family, generator, args) of every section of the catalogue tables.
+    """
+    entries = []
+    for family, table in [("IPE", IPE), ("HEA", HEA), ("HEB", HEB)]:
+        for size, (d, b, t_w, t_f, r) in table.items():
+            entries.append((f"{family} {size}", family, "i_section", {"d": d, "b": b, "t_f": t_f, "t_w": t_w, "r": r, "n_r": N_R}))
+    for size, (d, b, t_w, t_f, r) in UPE.items():
+        entries.append((f"UPE {size}", "UPE", "channel_section", {"d": d, "b": b, "t_f": t_f, "t_w": t_w, "r": r, "n_r": N_R}))
+    for d, thicknesses in CHS.items():
+        for t in thicknesses:
+            entries.append((f"CHS {number(d)}x{number(t)}", "CHS", "circular_hollow_section", {"d": d, "t": t, "n": N_CIRCLE}))
+    # the outer corner radius of hot-finished hollow sections is 1.5 t, the inner radius 1.0 t
+    for (d, b), thicknesses in [((d, d), thicknesses) for d, thicknesses in SHS.items()] + list(RHS.items()):
+        family = "SHS" if d == b else "RHS"
+        for t in thicknesses:
+            entries.append((
+                f"{family} {number(d)}x{number(b)}x{number(t)}", family, "rectangular_hollow_section",
+                {"d": d, "b": b, "t": t, "r_out": 1.5 * t, "r_in": t, "n_r": N_R},
+            ))
+    return entries
+
+
+def normalise_designation(designation: str) -> str:
+    """
+    Returns the key of a designation, e.g. "IPE300" for "ipe 300" and "HEA300" for "HE 300 A".
+    """
+    key = re.sub(r"[\s_-]+", "", designation.upper()).replace("×", "X").replace("*", "X")
+    key = re.sub(r"^HE(\d+)([ABM])$", r"HE\2\1", key)
+    # 6.30 and 6.3 are the same thickness
+    return re.sub(r"\d+(?:\.\d+)?", lambda match: number(float(match.group())), key)
+
+
+def build_catalogue(path: str = CATALOGUE_FILE, workers: int = None, mesh_size: float = None):
+    """
+    Calculates the properties of all catalogue sections in a process pool and writes the catalogue file.
+
+    Args:
+        path: The catalogue file (.npz).
+        workers: Number of worker processes, by default the number of CPUs.
+        mesh_size: (Optional) Maximum element area in mm², by default it is derived from the dimensions of every section.
+    """
+    from importlib.metadata import version
+    from section_sweep import evaluate_candidate
+
+    entries = catalogue_entries()
+    values = np.full((len(entries), len(CATALOGUE_PROPERTIES) + 1 + len(DIMENSIONS)), np.nan)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {
+            executor.submit(evaluate_candidate, generator, args, mesh_size, ["geometric", "plastic", "warping"]): i
+            for i, (_, _, generator, args) in enumerate(entries)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            properties = future.result()
+            values[i, :len(CATALOGUE_PROPERTIES)] = [properties.get(prop, np.nan) for prop in CATALOGUE_PROPERTIES]
+            print(f"{done}/{len(entries)} {entries[i][0]}")
+    values[:, len(CATALOGUE_PROPERTIES)] = values[:, CATALOGUE_PROPERTIES.index("area")] * STEEL_DENSITY * 1000
+    for j, dimension in enumerate(DIMENSIONS, start=len(CATALOGUE_PROPERTIES) + 1):
+        values[:, j] = [args.get(dimension, np.nan) for _, _, _, args in entries]
+
+    np.savez_compressed(
+        path,
+        designation=np.array([entry[0] for entry in entries]),
+        family=np.array([entry[1] for entry in entries]),
+        generator=np.array([entry[2] for entry in entries]),
+        args=np.array([json.dumps(entry[3]) for entry in entries]),
+        properties=np.array(CATALOGUE_PROPERTIES + ["mass"] + DIMENSIONS),
+        values=values,
+        sectionproperties=np.array(version("sectionproperties")),
+    )
+    print(f"{len(entries)} sections written to {path} in {time.perf_counter() - start:.1f} s")
+
+
+class SectionCatalogue:
+    """
+    The standard sections of a catalogue file, held in memory as NumPy arrays.
+
+    Sections are looked up by designation through a dict of the normalised designations and
+    filtered on property ranges with boolean masks over the property columns, neither meshes
+    or analyses a section.
+    """
+
+    def __init__(self, path: str = CATALOGUE_FILE):
+        with np.load(path) as data:
+            self.designations = data["designation"].tolist()
+            self.families = data["family"]
+            self.generators = data["generator"].tolist()
+            self.args = [json.loads(args) for args in data["args"]]
+            self.properties = data["properties"].tolist()
+            self.values = data["values"]
+            self.version = str(data["sectionproperties"])
+        self._index = {normalise_designation(designation): i for i, designation in enumerate(self.designations)}
+        self._column_index = {prop: j for j, prop in enumerate(self.properties)}
+        self._columns = {prop: self.values[:, j] for prop, j in self._column_index.items()}
+
+    def __len__(self) -> int:
+        return len(self.designations)
+
+    def section(self, i: int, properties: list = None, verbosity: str = DEFAULT_VERBOSITY) -> dict:
+        """
+        Returns a catalogue section with its properties formatted like the results of the analysis tools.
+
+        Args:
+            i: The index of the section.
+            properties: (Optional) Names of the reported properties. If given, the verbosity is ignored.
+            verbosity: One of VERBOSITY_LEVELS, selects the reported properties if none are requested.
+                The mass is reported at every level, the dimensions are part of the generator args.
+
+        Returns:
+            A dict with the designation, generator and args of the section and its properties as
+            returned by properties_result, the mass in kg/m and the dimensions in mm.
+        """
+        row = self.values[i].tolist()
+        # missing properties are NaN, which is not equal to itself
+        values = {prop: value for prop, value in zip(self.properties, row) if value == value}
+        requested = [prop for prop in properties or [] if prop not in CATALOGUE_UNITS]
+        if properties and not requested:
+            result = {"section_properties": {}}
+        else:
+            section_props = {prop: value for prop, value in values.items() if prop not in CATALOGUE_UNITS}
+            result = properties_result(section_props, properties=requested, verbosity=verbosity)
+        for prop in properties or ["mass"]:
+            if prop in CATALOGUE_UNITS and prop in values:
+                result["section_properties"].setdefault(CATALOGUE_UNITS[prop], {})[prop] = round_value(values[prop], DEFAULT_PRECISION)
+        return {"designation": self.designations[i], "generator": self.generators[i], "args": self.args[i], **result}
+
+    def lookup(self, designation: str, properties: list = None, verbosity: str = DEFAULT_VERBOSITY) -> dict:
+        """
+        Returns the section with the given designation and its properties, see section().
+
+        Raises:
+            LookupError: If the designation is not in the catalogue, the message suggests similar designations.
+        """
+        i = self._index.get(normalise_designation(designation))
+        if i is None:
+            close = difflib.get_close_matches(normalise_designation(designation), list(self._index), n=3)
+            suggestion = f" Similar sections are {[self.designations[self._index[key]] for key in close]}." if close else ""
+            raise LookupError(f"'{designation}' is not in the section catalogue.{suggestion}")
+        return self.section(i, properties, verbosity)
+
+    def query(self, families: list = None, constraints: list = None, sort_by: str = "mass", goal: str = "minimise",
+              limit: int = 10, properties: list = None) -> dict:
+        """
+        Returns the sections satisfying all constraints, ranked by a property.
+
+        Args:
+            families: (Optional) The families of sections searched, e.g. ["IPE", "HEA"], by default all.
+            constraints: List of dicts with a "property" and an optional "min" and "max" value.
+            sort_by: The property the sections are ranked by.
+            goal: Either "minimise" or "maximise" the sort_by property.
+            limit: Maximum number of returned sections.
+            properties: The properties reported for every section, by default SUMMARY_PROPERTIES.
+
+        Returns:
+            A dict with the number of matching sections and the ranked sections.
+        """
+        constraints = constraints or []
+        properties = properties or SUMMARY_PROPERTIES
+        unknown = [prop for prop in [sort_by] + properties + [c["property"] for c in constraints] if prop not in self._columns]
+        if unknown:
+            raise ValueError(f"Unknown section properties {unknown}. Valid properties are {self.properties}.")
+        if goal not in ["minimise", "maximise"]:
+            raise ValueError("The goal must be either 'minimise' or 'maximise'.")
+
+        mask = np.ones(len(self), dtype=bool)
+        if families:
+            families = [family.upper() for family in families]
+            unknown = [family for family in families if family not in self.families]
+            if unknown:
+                raise ValueError(f"Unknown section families {unknown}. Valid families are {sorted(set(self.families.tolist()))}.")
+            mask &= np.isin(self.families, families)
+        # sections without a value of a constrained property (e.g. t_f of a hollow section) never match
+        for constraint in constraints:
+            column = self._columns[constraint["property"]]
+            mask &= ~np.isnan(column)
+            if constraint.get("min") is not None:
+                mask &= column >= constraint["min"]
+            if constraint.get("max") is not None:
+                mask &= column <= constraint["max"]
+
+        matches = np.flatnonzero(mask)
+        order = self._columns[sort_by][matches]
+        matches = matches[np.argsort(order if goal == "minimise" else -order, kind="stable")]
+        return {
+            "n_matches": len(matches),
+            "sections": [self.section(i, properties) for i in matches[:limit]],
+        }
+
+
+_default_catalogue = None
+_default_catalogue_lock = threading.Lock()
+
+
+def default_catalogue() -> SectionCatalogue:
+    """
+    Returns the process-wide SectionCatalogue loaded from SECTION_CATALOGUE_FILE or the bundled catalogue.
+    """
+    global _default_catalogue
+    with _default_catalogue_lock:
+        if _default_catalogue is None:
+            _default_catalogue = SectionCatalogue(os.getenv("SECTION_CATALOGUE_FILE") or CATALOGUE_FILE)
+        return _default_catalogue
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds or queries the catalogue of standard steel sections.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Calculate the properties of all catalogue sections and write the catalogue file.")
+    build_parser.add_argument("--output", default=CATALOGUE_FILE, help="The catalogue file (default: section_catalogue.npz next to this script).")
+    build_parser.add_argument("--workers", type=int, help="Number of worker processes (default: number of CPUs).")
+    build_parser.add_argument("--mesh-size", type=float, help="Maximum element area in mm² (default: derived from the dimensions).")
+    show_parser = subparsers.add_parser("show", help="Print the properties of a catalogue section.")
+    show_parser.add_argument("designation", nargs="+", help="The designation, e.g. IPE 300.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_catalogue(args.output, args.workers, args.mesh_size)
+    else:
+        try:
+            print(json.dumps(default_catalogue().lookup(" ".join(args.designation), verbosity="full"), indent=2))
+        except LookupError as e:
+            print(e.args[0], file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import math
+
+import numpy as np
+
+
+# relative differences between an estimate and the finite element result below this are reported as agreement
+AGREEMENT_TOLERANCE = 0.01
+# difference of the principal axis angle in degrees reported as agreement
+PHI_TOLERANCE = 0.5
+
+
+def ring_integrals(coords: np.ndarray) -> np.ndarray:
+    """
+    Returns the area, the first and the second moments of area of the polygon enclosed by a ring.
+
+    The integrals follow from Green's theorem and are exact for straight edges. Rings oriented
+    clockwise, i.e. the holes of an oriented polygon, give negative values.
+    """
+    x, y = coords[:-1, 0], coords[:-1, 1]
+    x1, y1 = coords[1:, 0], coords[1:, 1]
+    a = x * y1 - x1 * y
+    return np.array([
+        a.sum() / 2,
+        ((y + y1) * a).sum() / 6,
+        ((x + x1) * a).sum() / 6,
+        ((y * y + y * y1 + y1 * y1) * a).sum() / 12,
+        ((x * x + x * x1 + x1 * x1) * a).sum() / 12,
+        ((x * y1 + 2 * x * y + 2 * x1 * y1 + x1 * y) * a).sum() / 24,
+    ])
+
+
+def polygon_properties(geom) -> dict:
+    """
+    Integrates the geometric properties of a section over the polygons of its geometry.
+
+    The outline of a library section is a polygon with the radii discretised into n_r points,
+    which is also the boundary of its finite element mesh. The area, centroid, moments of area
+    and elastic section moduli of this polygon are therefore the same as those of the geometric
+    finite element analysis, without meshing.
+
+    Args:
+        geom: The sectionproperties Geometry or CompoundGeometry.
+
+    Returns:
+        A dict with the geometric properties named as in sectionproperties.
+    """
+    from shapely.geometry.polygon import orient
+
+    geometries = getattr(geom, "geoms", [geom])
+    integrals = np.zeros(6)
+    perimeter = 0.0
+    bounds = []
+    for geometry in geometries:
+        polygon = orient(geometry.geom, 1.0)
+        for ring in [polygon.exterior, *polygon.interiors]:
+            integrals += ring_integrals(np.asarray(ring.coords))
+        perimeter += polygon.exterior.length
+        bounds.append(polygon.bounds)
+    area, qx, qy, ixx_g, iyy_g, ixy_g = integrals
+    x_min, y_min = min(b[0] for b in bounds), min(b[1] for b in bounds)
+    x_max, y_max = max(b[2] for b in bounds), max(b[3] for b in bounds)
+
+    cx, cy = qy / area, qx / area
+    ixx_c, iyy_c, ixy_c = ixx_g - qx * cy, iyy_g - qy * cx, ixy_g - qy * cy
+    # principal axes as defined by sectionproperties
+    i_avg, i_diff = (ixx_c + iyy_c) / 2, math.sqrt(((ixx_c - iyy_c) / 2) ** 2 + ixy_c**2)
+    i11_c, i22_c = i_avg + i_diff, i_avg - i_diff
+    phi = 0.0 if abs(ixx_c - i11_c) < 1e-12 * i11_c else math.degrees(math.atan2(ixx_c - i11_c, ixy_c))
+    return {
+        "area": area, "perimeter": perimeter, "cx": cx, "cy": cy, "qx": qx, "qy": qy,
+        "ixx_g": ixx_g, "iyy_g": iyy_g, "ixy_g": ixy_g, "ixx_c": ixx_c, "iyy_c": iyy_c, "ixy_c": ixy_c,
+        "zxx_plus": ixx_c / (y_max - cy), "zxx_minus": ixx_c / (cy - y_min),
+        "zyy_plus": iyy_c / (x_max - cx), "zyy_minus": iyy_c / (cx - x_min),
+        "rx_c": math.sqrt(ixx_c / area), "ry_c": math.sqrt(iyy_c / area),
+        "i11_c": i11_c, "i22_c": i22_c, "phi": phi,
+    }
+
+
+def open_torsion(plates: list) -> float:
+    # thin-walled open section, every plate (length, thickness) adds length * thickness³ / 3
+    return sum(length * thickness**3 for length, thickness in plates) / 3
+
+
+def closed_torsion(enclosed_area: float, plates: list) -> float:
+    # Bredt's formula for a single cell with the centre-line area and the plates (length, thickness)
+    # around it, plus the open section contribution of the walls
+    return 4 * enclosed_area**2 / sum(length / thickness for length, thickness in plates) + open_torsion(plates)
+
+
+def i_section_torsion(d, b, t_f, t_w, r, **_) -> float:
+    # plates with the fillet correction of El Darwish and Johnston for the web to flange junctions
+    alpha = -0.042 + 0.2204 * t_w / t_f + 0.1355 * r / t_f - 0.0865 * r * t_w / t_f**2 - 0.0725 * t_w**2 / t_f**2
+    diameter = ((t_f + r) ** 2 + t_w * (r + t_w / 4)) / (2 * r + t_f)
+    return 2 / 3 * b * t_f**3 + (d - 2 * t_f) * t_w**3 / 3 + 2 * alpha * diameter**4 - 0.42 * t_f**4
+
+
+def rectangular_hollow_torsion(d, b, t, r_out, **_) -> float:
+    r_c = max(r_out - t / 2, 0.0)
+    enclosed_area = (d - t) * (b - t) - (4 - math.pi) * r_c**2
+    length = 2 * (d - t) + 2 * (b - t) - 2 * (4 - math.pi) * r_c
+    return closed_torsion(enclosed_area, [(length, t)])
+
+
+def elliptical_hollow_torsion(d_x, d_y, t, **_) -> float:
+    a, b = (d_x - t) / 2, (d_y - t) / 2
+    # Ramanujan's approximation of the circumference of an ellipse
+    h = ((a - b) / (a + b)) ** 2
+    length = math.pi * (a + b) * (1 + 3 * h / (10 + math.sqrt(4 - 3 * h)))
+    return closed_torsion(math.pi * a * b, [(length, t)])
+
+
+def polygon_hollow_torsion(d, t, n_sides, **_) -> float:
+    # centre line of the wall, a regular polygon with the apothem reduced by t / 2
+    radius = (d / 2 * math.cos(math.pi / n_sides) - t / 2) / math.cos(math.pi / n_sides)
+    enclosed_area = n_sides / 2 * radius**2 * math.sin(2 * math.pi / n_sides)
+    return closed_torsion(enclosed_area, [(2 * n_sides * radius * math.sin(math.pi / n_sides), t)])
+
+
+def box_girder_torsion(d, b_t, b_b, t_ft, t_fb, t_w, **_) -> float:
+    height = d - (t_ft + t_fb) / 2
+    top, bottom = b_t - t_w, b_b - t_w
+    web = math.hypot(height, (top - bottom) / 2)
+    return closed_torsion((top + bottom) / 2 * height, [(top, t_ft), (bottom, t_fb), (web, t_w), (web, t_w)])
+
+
+# torsion constants of thin-walled theory from the dimensions of the generators. The torsion
+# constant of a circular hollow section is the exact polar moment of area.
+TORSION_ESTIMATES = {
+    "circular_hollow_section": lambda d, t, **_: math.pi / 32 * (d**4 - (d - 2 * t) ** 4),
+    "elliptical_hollow_section": elliptical_hollow_torsion,
+    "rectangular_hollow_section": rectangular_hollow_torsion,
+    "polygon_hollow_section": polygon_hollow_torsion,
+    "i_section": i_section_torsion,
+    "mono_i_section": lambda d, b_t, b_b, t_ft, t_fb, t_w, **_: open_torsion([(b_t, t_ft), (b_b, t_fb), (d - t_ft - t_fb, t_w)]),
+    "tapered_flange_i_section": lambda d, b, t_f, t_w, **_: open_torsion([(b, t_f), (b, t_f), (d - 2 * t_f, t_w)]),
+    "channel_section": lambda d, b, t_f, t_w, **_: open_torsion([(b, t_f), (b, t_f), (d - 2 * t_f, t_w)]),
+    "tapered_flange_channel": lambda d, b, t_f, t_w, **_: open_torsion([(b, t_f), (b, t_f), (d - 2 * t_f, t_w)]),
+    "tee_section": lambda d, b, t_f, t_w, **_: open_torsion([(b, t_f), (d - t_f, t_w)]),
+    "angle_section": lambda d, b, t, **_: open_torsion([(d + b - t, t)]),
+    "cee_section": lambda d, b, l, t, **_: open_torsion([(d - t + 2 * (b - t) + 2 * (l - t / 2), t)]),
+    "zed_section": lambda d, b_l, b_r, l, t, **_: open_torsion([(d - t + b_l + b_r - 2 * t + 2 * (l - t / 2), t)]),
+    "box_girder_section": box_girder_torsion,
+}
+
+
+def estimate_properties(name: str, args: dict, geom) -> dict:
+    """
+    Estimates the section properties of a library section without a finite element analysis.
+
+    Args:
+        name: Name of the section generator, e.g. "i_section".
+        args: The arguments of the generator call.
+        geom: The generated Geometry.
+
+    Returns:
+        A dict with the geometric properties of the outline (see polygon_properties) and, for the
+        generators of TORSION_ESTIMATES, the torsion constant j of thin-walled theory.
+    """
+    properties = polygon_properties(geom)
+    if name in TORSION_ESTIMATES:
+        properties["j"] = TORSION_ESTIMATES[name](**args)
+    return properties
+
+
+def estimate_agreement(estimate: dict, sec) -> dict:
+    """
+    Compares an estimate to the finite element results calculated so far.
+
+    Args:
+        estimate: The estimated properties, see estimate_properties.
+        sec: The analysed sectionproperties Section object.
+
+    Returns:
+        A dict with the largest relative difference, the properties that differ by more than
+        AGREEMENT_TOLERANCE with their estimated and calculated values, and the properties compared.
+    """
+    from section_results import round_value
+
+    compared, differences = [], {}
+    largest = 0.0
+    size = estimate["area"] ** 0.5
+    for name, value in estimate.items():
+        calculated = getattr(sec.section_props, name, None)
+        if calculated is None:
+            continue
+        if name == "phi":
+            # the principal axes of sections with i11_c = i22_c are arbitrary
+            if estimate["i11_c"] - estimate["i22_c"] < 1e-6 * estimate["i11_c"]:
+                continue
+            compared.append(name)
+            # the angle is compared in degrees, the axes repeat every 180°
+            difference = abs((value - calculated + 90) % 180 - 90) / PHI_TOLERANCE * AGREEMENT_TOLERANCE
+        else:
+            compared.append(name)
+            # values that are zero by symmetry, e.g. ixy_c, only differ by numerical noise
+            scale = max(abs(calculated), abs(value), 1e-5 * size ** (4 if name.startswith("i") or name == "j" else 1))
+            difference = abs(value - calculated) / scale
+        largest = max(largest, difference)
+        if difference > AGREEMENT_TOLERANCE:
+            differences[name] = {"estimate": round_value(value, 4), "finite_element": round_value(calculated, 4), "difference": f"{difference:.1%}"}
+    return {"max_difference": f"{largest:.2%}", "differences": differences, "compared": compared}
@@ -0,0 +1,197 @@
+# verbosity levels of the section property results, every level includes the previous ones
+VERBOSITY_LEVELS = ["summary", "standard", "full"]
+DEFAULT_VERBOSITY = "summary"
+# significant digits of the reported values
+DEFAULT_PRECISION = 4
+# values smaller than this fraction of the section's characteristic size in the same unit are
+# numerical noise of the finite element analysis (e.g. the shear centre of a symmetric section)
+ZERO_TOLERANCE = 1e-5
+
+# length dimension of every unit, used to scale the zero tolerance with the section size. The units
+# are plain ASCII because superscripts are escaped in the JSON sent to the model.
+UNIT_DIMENSIONS = {"mm": 1, "mm2": 2, "mm3": 3, "mm4": 4, "mm6": 6, "deg": 0, "-": 0, "N": 0, "N/mm2": 0, "Nmm": 0}
+
+# (property, unit, analysis, verbosity)
+PROPERTY_SCHEMA = [
+    ("area", "mm2", "geometric", "summary"),
+    ("perimeter", "mm", "geometric", "summary"),
+    ("cx", "mm", "geometric", "summary"),
+    ("cy", "mm", "geometric", "summary"),
+    ("ixx_c", "mm4", "geometric", "summary"),
+    ("iyy_c", "mm4", "geometric", "summary"),
+    ("ixy_c", "mm4", "geometric", "summary"),
+    ("zxx_plus", "mm3", "geometric", "summary"),
+    ("zxx_minus", "mm3", "geometric", "summary"),
+    ("zyy_plus", "mm3", "geometric", "summary"),
+    ("zyy_minus", "mm3", "geometric", "summary"),
+    ("rx_c", "mm", "geometric", "summary"),
+    ("ry_c", "mm", "geometric", "summary"),
+    ("qx", "mm3", "geometric", "standard"),
+    ("qy", "mm3", "geometric", "standard"),
+    ("i11_c", "mm4", "geometric", "standard"),
+    ("i22_c", "mm4", "geometric", "standard"),
+    ("phi", "deg", "geometric", "standard"),
+    ("z11_plus", "mm3", "geometric", "standard"),
+    ("z11_minus", "mm3", "geometric", "standard"),
+    ("z22_plus", "mm3", "geometric", "standard"),
+    ("z22_minus", "mm3", "geometric", "standard"),
+    ("r11_c", "mm", "geometric", "standard"),
+    ("r22_c", "mm", "geometric", "standard"),
+    ("ixx_g", "mm4", "geometric", "full"),
+    ("iyy_g", "mm4", "geometric", "full"),
+    ("ixy_g", "mm4", "geometric", "full"),
+    # material dependent properties, only meaningful for composite sections
+    ("mass", "-", "composite", "standard"),
+    ("ea", "N", "composite", "standard"),
+    ("ga", "N", "composite", "standard"),
+    ("e_eff", "N/mm2", "composite", "standard"),
+    ("g_eff", "N/mm2", "composite", "standard"),
+    ("nu_eff", "-", "composite", "standard"),
+    ("my_xx", "Nmm", "composite", "standard"),
+    ("my_yy", "Nmm", "composite", "standard"),
+    ("my_11", "Nmm", "composite", "full"),
+    ("my_22", "Nmm", "composite", "full"),
+    ("j", "mm4", "warping", "summary"),
+    ("gamma", "mm6", "warping", "summary"),
+    ("x_se", "mm", "warping", "summary"),
+    ("y_se", "mm", "warping", "summary"),
+    ("a_sx", "mm2", "warping", "standard"),
+    ("a_sy", "mm2", "warping", "standard"),
+    ("x_st", "mm", "warping", "standard"),
+    ("y_st", "mm", "warping", "standard"),
+    ("beta_x_plus", "mm", "warping", "standard"),
+    ("beta_x_minus", "mm", "warping", "standard"),
+    ("beta_y_plus", "mm", "warping", "standard"),
+    ("beta_y_minus", "mm", "warping", "standard"),
+    ("x11_se", "mm", "warping", "full"),
+    ("y22_se", "mm", "warping", "full"),
+    ("a_s11", "mm2", "warping", "full"),
+    ("a_s22", "mm2", "warping", "full"),
+    ("a_sxy", "mm2", "warping", "full"),
+    ("delta_s", "-", "warping", "full"),
+    ("beta_11_plus", "mm", "warping", "full"),
+    ("beta_11_minus", "mm", "warping", "full"),
+    ("beta_22_plus", "mm", "warping", "full"),
+    ("beta_22_minus", "mm", "warping", "full"),
+    ("sxx", "mm3", "plastic", "summary"),
+    ("syy", "mm3", "plastic", "summary"),
+    ("x_pc", "mm", "plastic", "standard"),
+    ("y_pc", "mm", "plastic", "standard"),
+    ("sf_xx_plus", "-", "plastic", "standard"),
+    ("sf_xx_minus", "-", "plastic", "standard"),
+    ("sf_yy_plus", "-", "plastic", "standard"),
+    ("sf_yy_minus", "-", "plastic", "standard"),
+    ("x11_pc", "mm", "plastic", "full"),
+    ("y22_pc", "mm", "plastic", "full"),
+    ("s11", "mm3", "plastic", "full"),
+    ("s22", "mm3", "plastic", "full"),
+    ("sf_11_plus", "-", "plastic", "full"),
+    ("sf_11_minus", "-", "plastic", "full"),
+    ("sf_22_plus", "-", "plastic", "full"),
+    ("sf_22_minus", "-", "plastic", "full"),
+]
+PROPERTY_NAMES = [name for name, _, _, _ in PROPERTY_SCHEMA]
+PROPERTY_UNITS = {name: unit for name, unit, _, _ in PROPERTY_SCHEMA}
+# options of the analysis tools that select the reported properties
+RESULT_OPTIONS = ["properties", "verbosity"]
+# principal axis properties and the matching x/y axis properties, equal if the principal axes are not rotated
+PRINCIPAL_PROPERTIES = {
+    "i11_c": "ixx_c", "i22_c": "iyy_c", "z11_plus": "zxx_plus", "z11_minus": "zxx_minus", "z22_plus": "zyy_plus",
+    "z22_minus": "zyy_minus", "r11_c": "rx_c", "r22_c": "ry_c", "my_11": "my_xx", "my_22": "my_yy",
+    "x11_se": "x_se", "y22_se": "y_se", "a_s11": "a_sx", "a_s22": "a_sy", "beta_11_plus": "beta_x_plus",
+    "beta_11_minus": "beta_x_minus", "beta_22_plus": "beta_y_plus", "beta_22_minus": "beta_y_minus",
+    "x11_pc": "x_pc", "y22_pc": "y_pc", "s11": "sxx", "s22": "syy", "sf_11_plus": "sf_xx_plus",
+    "sf_11_minus": "sf_xx_minus", "sf_22_plus": "sf_yy_plus", "sf_22_minus": "sf_yy_minus",
+}
+
+
+def round_value(value: float, precision: int) -> float:
+    value = float(f"{float(value):.{precision}g}")
+    # integers are shorter in the JSON sent to the model
+    return int(value) if value.is_integer() and abs(value) < 1e15 else value
+
+
+def round_property(name: str, value: float, size: float, precision: int = DEFAULT_PRECISION) -> float:
+    """
+    Rounds a section property and sets it to zero if it is numerical noise.
+
+    Args:
+        name: The name of the property, its unit scales the zero tolerance.
+        value: The value of the property.
+        size: The characteristic size of the section in mm, the square root of its area.
+        precision: Number of significant digits of the reported value.
+    """
+    if abs(value) < ZERO_TOLERANCE * size ** UNIT_DIMENSIONS[PROPERTY_UNITS.get(name, "-")]:
+        value = 0.0
+    return round_value(value, precision)
+
+
+def section_properties_result(sec, properties: list = None, verbosity: str = DEFAULT_VERBOSITY, precision: int = DEFAULT_PRECISION) -> dict:
+    """
+    Creates the compact section property payload of a tool response.
+
+    Args:
+        sec: The analysed sectionproperties Section object.
+        properties: (Optional) Names of the requested properties. If given, the verbosity is ignored.
+        verbosity: One of VERBOSITY_LEVELS, selects the reported properties if none are requested.
+        precision: Number of significant digits of the reported values.
+
+    Returns:
+        See properties_result.
+    """
+    values = {name: getattr(sec.section_props, name, None) for name in PROPERTY_NAMES}
+    return properties_result(values, sec.is_composite(), properties, verbosity, precision)
+
+
+def properties_result(section_props: dict, composite: bool = False, properties: list = None, verbosity: str = DEFAULT_VERBOSITY,
+                      precision: int = DEFAULT_PRECISION) -> dict:
+    """
+    Creates the compact section property payload of a tool response from property values.
+
+    Args:
+        section_props: The section properties by name, properties that have not been calculated are None or missing.
+        composite: Whether the section is composite, material dependent properties are only reported for composite sections.
+        properties: (Optional) Names of the requested properties. If given, the verbosity is ignored.
+        verbosity: One of VERBOSITY_LEVELS, selects the reported properties if none are requested.
+        precision: Number of significant digits of the reported values.
+
+    Returns:
+        A dict with the "section_properties" grouped by unit (unit to property name to value)
+        and, if requested properties have not been calculated yet, their names under
+        "not_calculated". Unless requested explicitly, principal axis properties are omitted
+        if the principal axes coincide with the x and y axes.
+    """
+
+    if properties:
+        unknown = [name for name in properties if name not in PROPERTY_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown section properties {unknown}. Valid properties are {PROPERTY_NAMES}.")
+        schema = [entry for entry in PROPERTY_SCHEMA if entry[0] in properties]
+    else:
+        if verbosity not in VERBOSITY_LEVELS:
+            raise ValueError(f"Unknown verbosity '{verbosity}'. Valid levels are {VERBOSITY_LEVELS}.")
+        level = VERBOSITY_LEVELS.index(verbosity)
+        schema = [entry for entry in PROPERTY_SCHEMA if VERBOSITY_LEVELS.index(entry[3]) <= level]
+
+    size = (section_props.get("area") or 0.0) ** 0.5
+    phi = section_props.get("phi")
+    unrotated = not properties and phi is not None and round_value(phi % 90, precision) in [0, 90]
+    values, not_calculated = {}, []
+    for name, unit, analysis, _ in schema:
+        value = section_props.get(name)
+        if value is None or (analysis == "composite" and not composite):
+            if properties:
+                not_calculated.append(name)
+            continue
+        if unrotated and name in PRINCIPAL_PROPERTIES:
+            continue
+        values.setdefault(unit, {})[name] = round_property(name, value, size, precision)
+
+    result = {"section_properties": values}
+    if unrotated:
+        result["note"] = "The principal axes are parallel to x and y, principal axis properties are omitted."
+    if composite:
+        result["composite_note"] = "The section is composite, areas, moments of area and section moduli are modulus weighted."
+    if not_calculated:
+        result["not_calculated"] = not_calculated
+    return result
@@ -0,0 +1,370 @@
+import os
+import copy
+import json
+import time
+import pickle
+import weakref
+import threading
+import contextvars
+import dataclasses
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# the shortest prefix of a section id accepted when reopening a section
+MIN_ID_LENGTH = 6
+# the length of the section ids shown to the user
+SHORT_ID_LENGTH = 12
+
+_stored_session = contextvars.ContextVar("stored_session", default=None)
+
+
+class SectionNotFound(LookupError):
+    pass
+
+
+def write_atomic(path: str, write):
+    # concurrent readers never see partial files
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class SectionStore:
+    """
+    Stores meshed and analysed sections on disk, indexed by their section hash.
+
+    Every section is a directory with the arrays of the mesh, the array section properties
+    (e.g. the warping function) and the unit stress fields as .npy files, which are opened
+    memory-mapped, and a meta.json with the scalar section properties and a description of the
+    section. The geometry is pickled without the mesh arrays. Reopening a section rebuilds the
+    Section object from these files without meshing or solving again.
+
+    The store also keeps the current section of every session (see StoredSession) and drops
+    the sections of sessions that have been idle for longer than max_idle seconds from memory.
+    """
+
+    def __init__(self, directory: str, max_idle: float = 900.0):
+        self.directory = directory
+        self.max_idle = max_idle
+        self.saved = 0
+        self.loaded = 0
+        self.evicted = 0
+        self._sessions = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._evictor = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, section_id: str, name: str = "") -> str:
+        return os.path.join(self.directory, section_id, name)
+
+    def meta(self, section_id: str) -> dict:
+        try:
+            with open(self._path(section_id, "meta.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, sec, source: dict = None) -> str:
+        """
+        Saves a section with its analysis results and unit stress fields and returns its id.
+
+        Files that are already stored are not written again, so saving a section after every
+        analysis only adds the new results.
+
+        Args:
+            sec: The sectionproperties Section object.
+            source: (Optional) Description of the section, e.g. {"generator": ..., "args": ...}.
+
+        Returns:
+            The section id, i.e. the section hash.
+        """
+        from section_cache import section_hash
+        from stress_analysis import unit_stress_results_if_available
+
+        section_id = section_hash(sec)
+        with self._save_lock:
+            self._save(sec, section_id, source, unit_stress_results_if_available(sec))
+        return section_id
+
+    def _save(self, sec, section_id: str, source: dict, unit: dict):
+        os.makedirs(self._path(section_id), exist_ok=True)
+        meta = self.meta(section_id) or {"section_id": section_id, "created": time.time()}
+        if source:
+            meta["source"] = source
+
+        def save_array(name, array):
+            if not os.path.exists(self._path(section_id, f"{name}.npy")):
+                write_atomic(self._path(section_id, f"{name}.npy"), lambda f: np.save(f, np.asarray(array)))
+
+        mesh_arrays = [key for key, value in sec.mesh.items() if isinstance(value, np.ndarray)]
+        if not os.path.exists(self._path(section_id, "geometry.pkl")):
+            # the small mesh entries (segments, regions) stay with the geometry
+            geometry = copy.copy(sec.geometry)
+            geometry.mesh = {key: value for key, value in sec.mesh.items() if key not in mesh_arrays}
+            write_atomic(self._path(section_id, "geometry.pkl"), lambda f: pickle.dump(geometry, f, protocol=pickle.HIGHEST_PROTOCOL))
+        for key in mesh_arrays:
+            save_array(f"mesh_{key}", sec.mesh[key])
+
+        props = {}
+        for field in dataclasses.fields(sec.section_props):
+            value = getattr(sec.section_props, field.name)
+            if isinstance(value, np.ndarray) and value.ndim > 0:
+                save_array(f"props_{field.name}", value)
+                props[field.name] = "array"
+            elif value is not None:
+                props[field.name] = float(value)
+        # a copy of the section with fewer analyses keeps the results saved before
+        meta["props"] = props = {**meta.get("props", {}), **props}
+        meta["mesh_arrays"] = mesh_arrays
+        meta["elements"] = len(sec.elements)
+        meta["nodes"] = sec.num_nodes
+        meta["analyses"] = [analysis for analysis, prop in [("geometric", "cx"), ("warping", "omega")] if prop in props]
+
+        saved_unit = meta.get("unit_stress")
+        # fields saved before a warping analysis are replaced by the fields including shear and torsion
+        if unit and (saved_unit is None or (unit["warping"] and not saved_unit["warping"])):
+            for group, fields in enumerate(unit["groups"]):
+                for name, array in fields.items():
+                    write_atomic(self._path(section_id, f"unit_{group}_{name}.npy"), lambda f, array=array: np.save(f, array))
+            meta["unit_stress"] = {"warping": unit["warping"], "groups": len(unit["groups"]), "fields": list(unit["groups"][0])}
+
+        meta["saved"] = time.time()
+        write_atomic(self._path(section_id, "meta.json"), lambda f: f.write(json.dumps(meta).encode()))
+        with self._lock:
+            self.saved += 1
+
+    def resolve(self, section_id: str) -> str:
+        """
+        Returns the full id of a stored section from the full id or a unique prefix of it.
+        """
+        section_id = (section_id or "").strip().lower()
+        if len(section_id) < MIN_ID_LENGTH:
+            raise SectionNotFound(f"Section ids have at least {MIN_ID_LENGTH} characters, got '{section_id}'.")
+        matches = [name for name in os.listdir(self.directory) if name.startswith(section_id) and self.meta(name)]
+        if len(matches) != 1:
+            raise SectionNotFound(f"{'No' if not matches else 'More than one'} saved section with the id '{section_id}'.")
+        return matches[0]
+
+    def load(self, section_id: str):
+        """
+        Reopens a stored section with its analysis results.
+
+        The arrays are memory-mapped, the unit stress fields are registered so that stress
+        analyses of the reopened section are superposed without running the element loop.
+
+        Args:
+            section_id: The id of the section or a unique prefix of it.
+
+        Returns:
+            The Section object.
+        """
+        from sectionproperties.analysis import Section
+        from stress_analysis import set_unit_stress_results
+
+        section_id = self.resolve(section_id)
+        meta = self.meta(section_id)
+
+        def load_array(name):
+            return np.load(self._path(section_id, f"{name}.npy"), mmap_mode="r")
+
+        with open(self._path(section_id, "geometry.pkl"), "rb") as f:
+            geometry = pickle.load(f)
+        geometry.mesh.update({key: load_array(f"mesh_{key}") for key in meta["mesh_arrays"]})
+        sec = Section(geometry=geometry)
+        for name, value in meta["props"].items():
+            setattr(sec.section_props, name, load_array(f"props_{name}") if value == "array" else value)
+
+        unit = meta.get("unit_stress")
+        if unit:
+            set_unit_stress_results(sec, {
+                "warping": unit["warping"],
+                "groups": [{name: load_array(f"unit_{group}_{name}") for name in unit["fields"]} for group in range(unit["groups"])],
+            })
+        with self._lock:
+            self.loaded += 1
+        return sec
+
+    def recent(self, limit: int = 10, section_ids: list = None) -> list:
+        """
+        Returns the descriptions of the most recently saved sections.
+
+        Args:
+            limit: The maximum number of sections.
+            section_ids: (Optional) The ids the listing is limited to, e.g. those of one session, by default all sections.
+        """
+        names = os.listdir(self.directory) if section_ids is None else set(section_ids)
+        metas = [meta for meta in (self.meta(name) for name in names) if meta]
+        metas.sort(key=lambda meta: meta.get("saved", 0), reverse=True)
+        return [
+            {"section_id": meta["section_id"][:SHORT_ID_LENGTH], **meta.get("source", {}), "elements": meta["elements"], "analyses": meta["analyses"]}
+            for meta in metas[:limit]
+        ]
+
+    def session(self):
+        """
+        Creates the StoredSession of a new session and starts the eviction of idle sessions.
+        """
+        session = StoredSession(self)
+        with self._lock:
+            self._sessions.add(session)
+            if self._evictor is None and self.max_idle > 0:
+                self._evictor = threading.Thread(target=self._evict_loop, name="section_store_evictor", daemon=True)
+                self._evictor.start()
+        return session
+
+    def evict_idle(self) -> int:
+        """
+        Drops the sections of sessions idle for longer than max_idle from memory, returns their number.
+        """
+        now = time.monotonic()
+        with self._lock:
+            sessions = list(self._sessions)
+        evicted = sum(session.evict() for session in sessions if now - session.last_used > self.max_idle)
+        with self._lock:
+            self.evicted += evicted
+        return evicted
+
+    def _evict_loop(self):
+        while True:
+            time.sleep(min(60.0, self.max_idle))
+            self.evict_idle()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "saved": self.saved,
+                "loaded": self.loaded,
+                "evicted": self.evicted,
+                "sessions": len(self._sessions),
+                "in_memory": sum(session.sec is not None for session in self._sessions),
+            }
+
+
+class StoredSession:
+    """
+    The current section and stresses of a session, kept in memory while the session is active.
+
+    Sessions store their state with update() after every turn and get it back with restore().
+    Once the session has been idle for longer than the max_idle of the store, the section and
+    stresses are dropped and only their ids and load case are kept. restore() then reopens
+    the section from the store and superposes the stresses again.
+    """
+
+    def __init__(self, store: SectionStore):
+        self.store = store
+        self.sec = None
+        self.stresses = None
+        # the unmeshed geometry of a section generated in estimate mode
+        self.geom = None
+        self.section_id = None
+        # the ids of the sections saved or opened by the session, the most recent last
+        self.section_ids = []
+        self.actions = None
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update(self, sec, stresses, geom=None):
+        with self._lock:
+            self.last_used = time.monotonic()
+            self.geom = geom if sec is None else None
+            if sec is not self.sec:
+                self.section_id = self.store.save(sec) if sec is not None else None
+                self._add_id(self.section_id)
+            elif sec is not None:
+                # the section may have been analysed further in place
+                self.store.save(sec)
+            self.sec, self.stresses = sec, stresses
+            self.actions = getattr(stresses, "actions", None)
+
+    def restore(self) -> tuple:
+        """
+        Returns the section, its geometry and the stresses of the session, reopening them if they were evicted.
+        """
+        from stress_analysis import superpose_stresses
+
+        with self._lock:
+            self.last_used = time.monotonic()
+            if self.sec is None and self.section_id:
+                self.sec = self.store.load(self.section_id)
+                self.stresses = superpose_stresses(self.sec, **self.actions) if self.actions else None
+            return self.sec, self.sec.geometry if self.sec is not None else self.geom, self.stresses
+
+    def open(self, section_id: str):
+        """
+        Makes a stored section the current section of the session.
+        """
+        sec = self.store.load(section_id)
+        with self._lock:
+            self.last_used = time.monotonic()
+            self.sec, self.stresses, self.actions, self.geom = sec, None, None, None
+            self.section_id = self.store.resolve(section_id)
+            self._add_id(self.section_id)
+        return sec
+
+    def _add_id(self, section_id: str):
+        if section_id:
+            if section_id in self.section_ids:
+                self.section_ids.remove(section_id)
+            self.section_ids.append(section_id)
+
+    def evict(self) -> bool:
+        with self._lock:
+            if self.sec is None or self.section_id is None:
+                return False
+            self.sec, self.stresses = None, None
+            return True
+
+
+@contextmanager
+def stored_session(session: StoredSession):
+    """
+    Runs the tool calls started in this context on behalf of the given StoredSession.
+    """
+    token = _stored_session.set(session)
+    try:
+        yield
+    finally:
+        _stored_session.reset(token)
+
+
+def current_stored_session() -> StoredSession:
+    """
+    Returns the StoredSession of the current context, or None outside of a session (e.g. the command line).
+    """
+    return _stored_session.get()
+
+
+def section_store_from_env() -> SectionStore:
+    """
+    Creates a SectionStore configured through the SECTION_STORE_DIR and SESSION_IDLE_MINUTES
+    environment variables, or None if SECTION_STORE_DIR is not set.
+    """
+    directory = os.getenv("SECTION_STORE_DIR")
+    if not directory:
+        return None
+    return SectionStore(directory, max_idle=float(os.getenv("SESSION_IDLE_MINUTES", "15")) * 60)
+
+
+_default_store = None
+_default_store_created = False
+_default_store_lock = threading.Lock()
+
+
+def default_section_store() -> SectionStore:
+    """
+    Returns the process-wide SectionStore, or None if sections are not persisted.
+    """
+    global _default_store, _default_store_created
+    with _default_store_lock:
+        if not _default_store_created:
+            _default_store = section_store_from_env()
+            _default_store_created = True
+        return _default_store
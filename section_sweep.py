@@ -0,0 +1,290 @@
+import os
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from mesh_sizing import MESH_OPTIONS, characteristic_mesh_size
+from section_results import round_property
+
+
+# section properties that are only available after a warping or plastic analysis, all other
+# scalar properties of sectionproperties' SectionProperties are geometric properties
+WARPING_PROPERTIES = [
+    "j", "delta_s", "x_se", "y_se", "x11_se", "y22_se", "x_st", "y_st", "gamma", "a_sx", "a_sy", "a_sxy", "a_s11", "a_s22",
+    "beta_x_plus", "beta_x_minus", "beta_y_plus", "beta_y_minus", "beta_11_plus", "beta_11_minus", "beta_22_plus", "beta_22_minus",
+]
+PLASTIC_PROPERTIES = [
+    "x_pc", "y_pc", "x11_pc", "y22_pc", "sxx", "syy", "s11", "s22",
+    "sf_xx_plus", "sf_xx_minus", "sf_yy_plus", "sf_yy_minus", "sf_11_plus", "sf_11_minus", "sf_22_plus", "sf_22_minus",
+]
+GEOMETRIC_PROPERTIES = [
+    "area", "perimeter", "mass", "ea", "qx", "qy", "ixx_g", "iyy_g", "ixy_g", "cx", "cy", "ixx_c", "iyy_c", "ixy_c",
+    "zxx_plus", "zxx_minus", "zyy_plus", "zyy_minus", "rx_c", "ry_c", "i11_c", "i22_c", "phi",
+    "z11_plus", "z11_minus", "z22_plus", "z22_minus", "r11_c", "r22_c",
+]
+# properties always reported in the ranked table
+SUMMARY_PROPERTIES = ["area", "ixx_c", "iyy_c", "zxx_plus", "zyy_plus"]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_count() -> int:
+    return int(os.getenv("SWEEP_WORKERS", str(os.cpu_count() or 1)))
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    Returns the process pool used to evaluate sweep candidates.
+
+    The number of worker processes can be set with the SWEEP_WORKERS environment variable.
+    Workers are spawned rather than forked because the Streamlit server is multi-threaded.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=get_worker_count(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def required_analyses(properties) -> list:
+    analyses = ["geometric"]
+    if any(prop in PLASTIC_PROPERTIES for prop in properties):
+        analyses.append("plastic")
+    if any(prop in WARPING_PROPERTIES for prop in properties):
+        analyses.append("warping")
+    return analyses
+
+
+def evaluate_candidate(name: str, args: dict, mesh_size: float, analyses: list) -> dict:
+    """
+    Generates, meshes and analyses a single sweep candidate. Runs in a worker process.
+
+    Args:
+        name: Name of the section generator in sectionproperties.pre.library.
+        args: The arguments of the generator.
+        mesh_size: Maximum element area in mm², if None it is derived from the section dimensions.
+        analyses: The analyses to run, any of "geometric", "plastic" and "warping".
+
+    Returns:
+        A dict with all scalar section properties that have been calculated.
+    """
+    from sectionproperties.pre import library
+    from sectionproperties.analysis import Section
+
+    geom = getattr(library, name)(**args)
+    if mesh_size is None:
+        mesh_size = characteristic_mesh_size(args, geom.calculate_area())
+    geom.create_mesh(mesh_sizes=mesh_size)
+    sec = Section(geometry=geom)
+    sec.calculate_geometric_properties()
+    if "plastic" in analyses:
+        sec.calculate_plastic_properties()
+    if "warping" in analyses:
+        sec.calculate_warping_properties()
+
+    properties = {}
+    for key in GEOMETRIC_PROPERTIES + PLASTIC_PROPERTIES + WARPING_PROPERTIES:
+        value = getattr(sec.section_props, key, None)
+        if isinstance(value, (int, float, np.floating)):
+            properties[key] = float(value)
+    return properties
+
+
+def build_grid(declaration: dict, ranges: list, fixed_args: list, max_candidates: int) -> list:
+    """
+    Builds the list of generator arguments of all grid points.
+
+    Args:
+        declaration: The declaration of the section generator from tool_declaration.json.
+        ranges: List of dicts with the parameter "name" and either a list of "values" or "start", "stop" and "step".
+        fixed_args: List of dicts with the "name" and "value" of parameters that are not varied.
+        max_candidates: Maximum number of grid points.
+
+    Returns:
+        A list of argument dicts, one per grid point.
+    """
+    parameters = {key: value for key, value in declaration["parameters"]["properties"].items() if key not in MESH_OPTIONS}
+    values = {}
+    for item in fixed_args or []:
+        values[item["name"]] = [item["value"]]
+    for item in ranges or []:
+        if "values" in item and item["values"]:
+            values[item["name"]] = list(item["values"])
+        else:
+            start, stop, step = float(item["start"]), float(item["stop"]), float(item.get("step") or 0)
+            if step <= 0:
+                raise ValueError(f"The step of parameter '{item['name']}' must be positive.")
+            # include the stop value if it lies on the grid
+            values[item["name"]] = list(np.arange(start, stop + step / 1e6, step))
+
+    unknown = [key for key in values if key not in parameters]
+    if unknown:
+        raise ValueError(f"Unknown parameters {unknown} for {declaration['name']}. Valid parameters are {list(parameters)}.")
+    missing = [key for key in declaration["parameters"].get("required", []) if key not in values]
+    if missing:
+        raise ValueError(f"Missing values for the required parameters {missing} of {declaration['name']}.")
+
+    n_candidates = int(np.prod([len(v) for v in values.values()]))
+    if n_candidates > max_candidates:
+        raise ValueError(f"The sweep has {n_candidates} candidates, the maximum is {max_candidates}. Please use coarser ranges.")
+
+    grid = []
+    for combination in itertools.product(*values.values()):
+        args = {}
+        for key, value in zip(values, combination):
+            args[key] = int(round(float(value))) if parameters[key]["type"] == "integer" else float(value)
+        grid.append(args)
+    return grid
+
+
+def check_constraints(properties: dict, constraints: list) -> bool:
+    for constraint in constraints:
+        value = properties.get(constraint["property"])
+        if value is None:
+            return False
+        if constraint.get("min") is not None and value < constraint["min"]:
+            return False
+        if constraint.get("max") is not None and value > constraint["max"]:
+            return False
+    return True
+
+
+def sweep(declaration: dict, ranges: list, fixed_args: list = None, objective: str = "area", goal: str = "minimise",
+          constraints: list = None, warping: bool = False, top_n: int = 5, mesh_size: float = None,
+          max_candidates: int = 500, on_result=None) -> dict:
+    """
+    Evaluates a grid of section generator parameters and ranks the candidates.
+
+    The candidates are evaluated in a process pool in two stages. First only the geometric
+    (and, if required, plastic) properties are calculated and every candidate violating a
+    constraint on these properties is pruned. The expensive warping analysis is only run if
+    warping properties are requested or constrained, and it is run in order of the objective
+    so that it can stop early once top_n candidates satisfy all constraints.
+
+    Args:
+        declaration: The declaration of the section generator from tool_declaration.json.
+        ranges: The varied parameters, see build_grid.
+        fixed_args: The parameters that are not varied, see build_grid.
+        objective: Name of the section property used for ranking.
+        goal: Either "minimise" or "maximise" the objective.
+        constraints: List of dicts with a "property" and an optional "min" and "max" value.
+        warping: If True, warping properties are calculated for the ranked candidates.
+        top_n: Number of candidates in the ranked table.
+        mesh_size: (Optional) Maximum element area in mm², by default it is derived from the dimensions of every candidate.
+        max_candidates: Maximum number of grid points.
+        on_result: (Optional) Callback on_result(args, properties, feasible) called as soon as a candidate has finished.
+
+    Returns:
+        A dict with the ranked table and statistics of the sweep.
+    """
+    constraints = constraints or []
+    properties_used = [objective] + [constraint["property"] for constraint in constraints]
+    valid_properties = GEOMETRIC_PROPERTIES + PLASTIC_PROPERTIES + WARPING_PROPERTIES
+    unknown = [prop for prop in properties_used if prop not in valid_properties]
+    if unknown:
+        raise ValueError(f"Unknown section properties {unknown}. Valid properties are {valid_properties}.")
+    if goal not in ["minimise", "maximise"]:
+        raise ValueError("The goal must be either 'minimise' or 'maximise'.")
+
+    grid = build_grid(declaration, ranges, fixed_args, max_candidates)
+    name = declaration["name"]
+    pool = get_pool()
+    failed = []
+    n_pruned = 0
+
+    # stage 1: geometric (and plastic) properties for all candidates, pruning on these constraints
+    stage_1_analyses = [a for a in required_analyses(properties_used) if a != "warping"]
+    stage_1_constraints = [c for c in constraints if c["property"] not in WARPING_PROPERTIES]
+    stage_2_constraints = [c for c in constraints if c["property"] in WARPING_PROPERTIES]
+    needs_warping = warping or "warping" in required_analyses(properties_used)
+
+    feasible = []
+    futures = {pool.submit(evaluate_candidate, name, args, mesh_size, stage_1_analyses): args for args in grid}
+    for future in as_completed(futures):
+        args = futures[future]
+        try:
+            properties = future.result()
+        except Exception as e:
+            failed.append({"args": args, "error": str(e)})
+            continue
+        is_feasible = check_constraints(properties, stage_1_constraints)
+        if is_feasible:
+            feasible.append((args, properties))
+        else:
+            n_pruned += 1
+        # feasible candidates of a warping sweep are reported once their warping analysis has finished
+        if on_result and not (is_feasible and needs_warping):
+            on_result(args, properties, is_feasible)
+
+    sign = 1 if goal == "minimise" else -1
+    n_warping = 0
+    n_skipped = 0
+
+    if needs_warping:
+        if objective in WARPING_PROPERTIES:
+            # the ranking depends on the warping analysis, so all feasible candidates need it.
+            # Without feasible candidates the range below is empty.
+            batch_size = max(1, len(feasible))
+        else:
+            feasible.sort(key=lambda item: sign * item[1][objective])
+            batch_size = max(top_n, get_worker_count())
+
+        # stage 2: warping analysis in batches in order of the objective, stop once top_n candidates are feasible
+        stage_2_analyses = required_analyses(properties_used + ["j"])
+        ranked_feasible = []
+        for batch_start in range(0, len(feasible), batch_size):
+            batch = feasible[batch_start:batch_start + batch_size]
+            futures = {pool.submit(evaluate_candidate, name, args, mesh_size, stage_2_analyses): i for i, (args, _) in enumerate(batch)}
+            n_warping += len(batch)
+            results = [None] * len(batch)
+            for future in as_completed(futures):
+                i = futures[future]
+                args = batch[i][0]
+                try:
+                    properties = future.result()
+                except Exception as e:
+                    failed.append({"args": args, "error": str(e)})
+                    continue
+                is_feasible = check_constraints(properties, stage_2_constraints)
+                if is_feasible:
+                    results[i] = (args, properties)
+                else:
+                    n_pruned += 1
+                if on_result:
+                    on_result(args, properties, is_feasible)
+            # keep the objective order of the batch
+            ranked_feasible.extend(result for result in results if result is not None)
+            if objective not in WARPING_PROPERTIES and len(ranked_feasible) >= top_n:
+                n_skipped = len(feasible) - n_warping
+                break
+        feasible = ranked_feasible
+
+    ranked = sorted(feasible, key=lambda item: sign * item[1][objective])[:top_n]
+    varied = [item["name"] for item in ranges or []]
+    reported = list(dict.fromkeys(properties_used + SUMMARY_PROPERTIES + (["j", "gamma"] if needs_warping else [])))
+    table = []
+    for rank, (args, properties) in enumerate(ranked, start=1):
+        size = properties.get("area", 0.0) ** 0.5
+        table.append({
+            "rank": rank,
+            "parameters": {key: args[key] for key in varied},
+            "properties": {key: round_property(key, properties[key], size) for key in reported if key in properties},
+        })
+
+    return {
+        "generator": name,
+        "objective": objective,
+        "goal": goal,
+        "ranked_candidates": table,
+        "n_candidates": len(grid),
+        "n_feasible": len(feasible),
+        "n_pruned": n_pruned,
+        "n_warping_analyses": n_warping,
+        "n_skipped_by_early_stop": n_skipped,
+        "n_failed": len(failed),
+        "failed_examples": failed[:3],
+    }
@@ -0,0 +1,227 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from profiling import span
+
+
+# jobs of a lower class are started first, cheap meshing and geometric analyses do not wait
+# behind the sparse solves of warping analyses. Speculative analyses only use otherwise idle workers.
+JOB_PRIORITIES = {"mesh": 0, "geometric": 0, "stress": 1, "warping": 2, "speculative": 3}
+
+# the session submitting jobs and the progress callback of the current tool call, both are
+# inherited by the tool worker threads through the copied context of the turn
+_session = contextvars.ContextVar("solver_session", default="default")
+_report_progress = contextvars.ContextVar("solver_report_progress", default=None)
+
+
+class SolverBusy(RuntimeError):
+    pass
+
+
+@contextmanager
+def solver_session(session_id: str):
+    """
+    Submits the solver jobs started in this context on behalf of the given session.
+    """
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def current_session() -> str:
+    """
+    Returns the id of the session the solver jobs of the current context are submitted for.
+    """
+    return _session.get()
+
+
+@contextmanager
+def queue_feedback(report_progress):
+    """
+    Reports the queue position of the solver jobs started in this context to report_progress(message).
+    """
+    token = _report_progress.set(report_progress)
+    try:
+        yield
+    finally:
+        _report_progress.reset(token)
+
+
+class SolverPool:
+    """
+    Process-wide pool of worker threads running the finite element solves of all sessions.
+
+    At most `workers` solves run at once, so concurrent sessions do not oversubscribe the CPU.
+    Waiting jobs are ordered by their priority class (see JOB_PRIORITIES) and, within a class,
+    by start-time fair queueing over the sessions: a session submitting many jobs does not hold
+    back the jobs of other sessions. If `max_queue` jobs are waiting, new jobs are rejected
+    with SolverBusy.
+    """
+
+    def __init__(self, workers: int, max_queue: int = 64):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = []
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._session_tags = {}
+        self._virtual_time = 0
+        self._threads = []
+        self._local = threading.local()
+        self.started = time.perf_counter()
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_time = 0.0
+        self._waits = {}
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"solver_{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, kind: str, fn, session: str = None) -> Future:
+        """
+        Queues fn() as a job of the given kind for a session and returns its Future.
+        """
+        session = session or _session.get()
+        future = Future()
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise SolverBusy(f"The solver is busy with {len(self._queue)} waiting jobs. Please try again in a moment.")
+            self._start_workers()
+            # a session's next job is tagged after its previous job, but never before the current
+            # virtual time, so idle sessions do not collect credit
+            tag = max(self._session_tags.get(session, 0), self._virtual_time) + 1
+            self._session_tags[session] = tag
+            heapq.heappush(self._queue, (JOB_PRIORITIES.get(kind, 1), tag, next(self._sequence), kind, fn, future, time.perf_counter()))
+            self.submitted += 1
+            self._condition.notify()
+        return future
+
+    def position(self, future: Future) -> int:
+        """
+        Returns the number of jobs that start before the given job, or None if it is not waiting.
+        """
+        with self._condition:
+            for position, job in enumerate(sorted(self._queue)):
+                if job[5] is future:
+                    return position
+        return None
+
+    def run(self, kind: str, fn, name: str = None, **attributes):
+        """
+        Runs fn() in the pool, blocks until it has finished and returns its result.
+
+        The job runs with the context of the caller, so it is recorded as span `name` (default:
+        kind) in the current turn with its queue wait as attribute. While the job waits, its
+        queue position is reported to the progress callback of queue_feedback. Jobs submitted
+        from a solver worker run inline to avoid waiting on the pool from inside the pool.
+        """
+        name = name or kind
+        if getattr(self._local, "worker", False) or self.workers <= 0:
+            with span(name, queue_wait=0.0, **attributes):
+                return fn()
+
+        submitted = time.perf_counter()
+        context = contextvars.copy_context()
+
+        def job():
+            with span(name, queue_wait=round(time.perf_counter() - submitted, 4), **attributes):
+                return fn()
+
+        future = self.submit(kind, lambda: context.run(job))
+        report_progress = _report_progress.get()
+        reported = None
+        while True:
+            try:
+                return future.result(timeout=0.25)
+            except TimeoutError:
+                position = self.position(future)
+                if report_progress and position is not None and position != reported:
+                    report_progress(f"waiting for the solver, {position} jobs ahead" if position else "next in the solver queue")
+                    reported = position
+
+    def _work(self):
+        self._local.worker = True
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                _, tag, _, kind, fn, future, submitted = heapq.heappop(self._queue)
+                # a job of a lower priority class may have a smaller tag, virtual time never moves back
+                if tag > self._virtual_time:
+                    self._virtual_time = tag
+                    # tags at or below the virtual time have no effect on the next tag of their session
+                    self._session_tags = {session: tag for session, tag in self._session_tags.items() if tag > self._virtual_time}
+                self.running += 1
+                waits = self._waits.setdefault(kind, {"jobs": 0, "total_wait": 0.0, "max_wait": 0.0})
+                wait = time.perf_counter() - submitted
+                waits["jobs"] += 1
+                waits["total_wait"] += wait
+                waits["max_wait"] = max(waits["max_wait"], wait)
+
+            start = time.perf_counter()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn())
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._condition:
+                self.running -= 1
+                self.completed += 1
+                self.busy_time += time.perf_counter() - start
+
+    def stats(self) -> dict:
+        with self._condition:
+            elapsed = time.perf_counter() - self.started
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                # share of the worker time spent solving since the pool was created
+                "utilisation": self.busy_time / (self.workers * elapsed) if self.workers > 0 and elapsed > 0 else 0.0,
+                "wait": {
+                    kind: {"jobs": waits["jobs"], "mean_wait": waits["total_wait"] / waits["jobs"], "max_wait": waits["max_wait"]}
+                    for kind, waits in self._waits.items()
+                },
+            }
+
+
+def solver_pool_from_env() -> SolverPool:
+    """
+    Creates a SolverPool configured through the SOLVER_WORKERS and SOLVER_QUEUE_SIZE environment variables.
+    """
+    workers = int(os.getenv("SOLVER_WORKERS", str(os.cpu_count() or 1)))
+    max_queue = int(os.getenv("SOLVER_QUEUE_SIZE", "64"))
+    return SolverPool(workers=workers, max_queue=max_queue)
+
+
+_default_solver_pool = None
+_default_solver_pool_lock = threading.Lock()
+
+
+def default_solver_pool() -> SolverPool:
+    """
+    Returns the process-wide SolverPool shared by all sessions and tool worker threads.
+    """
+    global _default_solver_pool
+    with _default_solver_pool_lock:
+        if _default_solver_pool is None:
+            _default_solver_pool = solver_pool_from_env()
+        return _default_solver_pool
@@ -0,0 +1,229 @@
+import os
+import copy
+import time
+import threading
+from collections import deque
+from functools import partial
+from concurrent.futures import Future
+
+from profiling import span
+from solver_pool import SolverBusy, current_session, default_solver_pool
+
+
+class Speculation:
+    """
+    The speculative analyses of one section of a session, one future per analysis stage.
+    """
+
+    def __init__(self, sec, content: str, session: str, stages: list):
+        self.sec = sec
+        self.content = content
+        self.session = session
+        self.stages = stages
+        self.futures = {stage: Future() for stage in stages}
+        # the copy of the section the stages are solved on, created by the first stage
+        self.analysed = None
+        self.cancelled = False
+
+
+class Speculator:
+    """
+    Runs the analyses a session most likely asks for next in the background.
+
+    After a section has been generated, the next tool calls are almost always its geometric
+    properties, then its warping properties and then stresses, which need both. start() queues
+    these analyses in the solver pool while the model is still writing its reply. They run with
+    the lowest priority ("speculative", see JOB_PRIORITIES) on a copy of the section, and their
+    futures are registered with the section cache, so a tool call waits for an analysis in
+    progress or takes its result from the cache instead of solving again (see SectionCache.analyse).
+
+    A new section of the same session cancels the analyses of the previous one that have not
+    started yet, a running solve cannot be interrupted and its result stays in the cache. An
+    analysis is only started while no other solver jobs are waiting and while the speculative
+    analyses have used less than cpu_share of the solver workers over the last `window` seconds.
+    Analyses that are cancelled or skipped are solved on demand by the tool call as before.
+
+    Args:
+        cache: The SectionCache the results are stored in.
+        pool: The SolverPool running the analyses.
+        stages: The analysis stages to run in advance, in the order of ANALYSIS_STAGES.
+        cpu_share: Share of the solver worker time speculative analyses may use.
+        window: Length of the time window the cpu_share is measured over in seconds.
+    """
+
+    def __init__(self, cache, pool, stages: list = ("geometric", "warping"), cpu_share: float = 0.5, window: float = 60.0):
+        from section_cache import ANALYSIS_STAGES
+
+        self.cache = cache
+        self.pool = pool
+        self.stages = sorted(stages, key=ANALYSIS_STAGES.index)
+        self.cpu_share = cpu_share
+        self.window = window
+        self._sessions = {}
+        # (end time, solver time) of the speculative analyses within the window
+        self._usage = deque()
+        self._lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.skipped = 0
+        self.failed = 0
+        self.solver_time = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        # the results are handed over through the cache, without it every analysis would be solved twice
+        return bool(self.stages) and self.cpu_share > 0 and self.pool.workers > 0 and self.cache.max_entries > 0
+
+    def start(self, sec, session: str = None) -> Speculation:
+        """
+        Starts the speculative analyses of the new section of a session, cancelling those of its previous section.
+
+        Args:
+            sec: The meshed Section object, it is not modified.
+            session: (Optional) The session id, by default the session of the current solver context.
+
+        Returns:
+            The Speculation, or None if all stages are cached or already running for another session.
+        """
+        from section_cache import section_hash
+
+        session = session or current_session()
+        self.cancel(session)
+        if not self.enabled:
+            return None
+        content = section_hash(sec)
+        stages = [stage for stage in self.stages if not self.cache.contains(self.cache.analysis_key(content, stage))]
+        speculation = Speculation(sec, content, session, stages)
+        # a section another session is already analysing is not analysed twice
+        if not stages or not self.cache.add_pending(self.cache.analysis_key(content, stages[0]), speculation.futures[stages[0]]):
+            return None
+        for stage in stages[1:]:
+            self.cache.add_pending(self.cache.analysis_key(content, stage), speculation.futures[stage])
+        with self._lock:
+            self._sessions[session] = speculation
+        self._submit(speculation, 0)
+        return speculation
+
+    def cancel(self, session: str = None):
+        """
+        Cancels the speculative analyses of a session that have not started yet.
+        """
+        with self._lock:
+            speculation = self._sessions.pop(session or current_session(), None)
+        if speculation is not None:
+            speculation.cancelled = True
+            cancelled = sum(future.cancel() for future in speculation.futures.values())
+            with self._lock:
+                self.cancelled += cancelled
+
+    def _within_budget(self) -> bool:
+        if self.pool.stats()["queued"]:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._usage and self._usage[0][0] < now - self.window:
+                self._usage.popleft()
+            return sum(used for _, used in self._usage) < self.cpu_share * self.pool.workers * self.window
+
+    def _stop(self, speculation: Speculation, index: int, skipped: bool):
+        stopped = sum(speculation.futures[stage].cancel() for stage in speculation.stages[index:])
+        with self._lock:
+            if skipped:
+                self.skipped += stopped
+            if self._sessions.get(speculation.session) is speculation:
+                del self._sessions[speculation.session]
+
+    def _submit(self, speculation: Speculation, index: int):
+        if index >= len(speculation.stages) or speculation.cancelled:
+            self._stop(speculation, index, skipped=False)
+            return
+        if not self._within_budget():
+            self._stop(speculation, index, skipped=True)
+            return
+        try:
+            self.pool.submit("speculative", partial(self._run, speculation, index), speculation.session)
+        except SolverBusy:
+            self._stop(speculation, index, skipped=True)
+
+    def _base_section(self, speculation: Speculation, stage: str):
+        from section_cache import ANALYSIS_STAGES
+
+        # the stages before the first speculative stage are taken from the cache if possible
+        for earlier in reversed(ANALYSIS_STAGES[:ANALYSIS_STAGES.index(stage)]):
+            cached = self.cache.get(self.cache.analysis_key(speculation.content, earlier), record_miss=False)
+            if cached is not None:
+                return cached
+        return copy.deepcopy(speculation.sec)
+
+    def _run(self, speculation: Speculation, index: int):
+        stage = speculation.stages[index]
+        future = speculation.futures[stage]
+        # the stage may have been cancelled or taken over by a tool call while it was queued
+        if not future.set_running_or_notify_cancel():
+            self._submit(speculation, len(speculation.stages))
+            return
+        with self._lock:
+            self.started += 1
+        start = time.perf_counter()
+        try:
+            if speculation.analysed is None:
+                speculation.analysed = self._base_section(speculation, stage)
+            sec = speculation.analysed
+            with span(f"speculative {stage} analysis", elements=len(sec.elements), session=speculation.session):
+                # a warping analysis needs the geometric properties of the section
+                if stage == "warping" and sec.section_props.cx is None:
+                    sec.calculate_geometric_properties()
+                getattr(sec, f"calculate_{stage}_properties")()
+            self.cache.put(self.cache.analysis_key(speculation.content, stage), sec)
+            future.set_result(True)
+            completed = True
+        except Exception as e:
+            future.set_exception(e)
+            completed = False
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._usage.append((time.monotonic(), elapsed))
+            self.solver_time += elapsed
+            self.completed += completed
+            self.failed += not completed
+        self._submit(speculation, index + 1 if completed else len(speculation.stages))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "solver_time": self.solver_time,
+            }
+
+
+def speculator_from_env() -> Speculator:
+    """
+    Creates a Speculator configured through the SPECULATIVE_ANALYSES and SPECULATION_CPU_SHARE environment variables.
+    """
+    from section_cache import ANALYSIS_STAGES, default_cache
+
+    stages = [stage.strip() for stage in os.getenv("SPECULATIVE_ANALYSES", ",".join(ANALYSIS_STAGES)).split(",") if stage.strip()]
+    for stage in stages:
+        if stage not in ANALYSIS_STAGES:
+            raise ValueError(f"Unknown analysis '{stage}' in SPECULATIVE_ANALYSES. Valid analyses are {ANALYSIS_STAGES}.")
+    return Speculator(default_cache(), default_solver_pool(), stages, cpu_share=float(os.getenv("SPECULATION_CPU_SHARE", "0.5")))
+
+
+_default_speculator = None
+_default_speculator_lock = threading.Lock()
+
+
+def default_speculator() -> Speculator:
+    """
+    Returns the process-wide Speculator shared by all sessions.
+    """
+    global _default_speculator
+    with _default_speculator_lock:
+        if _default_speculator is None:
+            _default_speculator = speculator_from_env()
+        return _default_speculator
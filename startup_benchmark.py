@@ -0,0 +1,94 @@
+# Measures the cold start of the app, run with "python startup_benchmark.py".
+#
+# Every measurement runs in a fresh Python process, so that nothing is served from modules that
+# have already been imported. The first model response is only measured if GEMINI_API_KEY is set.
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+
+MEASUREMENTS = {
+    # import of the CLI entry point
+    "import_main": """
+t = time.perf_counter()
+import main
+result["import"] = time.perf_counter() - t
+""",
+    # import of the Streamlit entry point and the first page render until the API key is requested
+    "first_page_render": """
+t = time.perf_counter()
+import main_streamlit
+result["import"] = time.perf_counter() - t
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("main_streamlit.py", default_timeout=120)
+t = time.perf_counter()
+at.run()
+result["render"] = time.perf_counter() - t
+""",
+    # first tool calls, including the lazy import of the analysis stack
+    "first_tool_call": """
+t = time.perf_counter()
+from tool_handlers import default_registry
+registry = default_registry()
+result["registry"] = time.perf_counter() - t
+state = {"sec": None, "geom": None, "stresses": None}
+for name, args in [("i_section", {"d": 310, "b": 165, "t_f": 9.7, "t_w": 6.1, "r": 11.4, "n_r": 8}), ("calculate_geometric_properties", {})]:
+    t = time.perf_counter()
+    tool_result, outputs = registry.dispatch(name, args, state)
+    result[name] = time.perf_counter() - t
+    assert tool_result["status"] == "success", tool_result
+    state.update({key: value for key, value in outputs.items() if key in state})
+""",
+    # time to the first chunk and to the end of a short streamed model response
+    "first_model_response": """
+t = time.perf_counter()
+from google import genai
+client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+result["client"] = time.perf_counter() - t
+t = time.perf_counter()
+for chunk in client.models.generate_content_stream(model=os.getenv("BENCHMARK_MODEL", "gemini-2.5-flash"), contents="Reply with OK."):
+    result.setdefault("first_chunk", time.perf_counter() - t)
+result["response"] = time.perf_counter() - t
+""",
+}
+
+
+def run_measurement(name: str) -> dict:
+    code = "import os, time, json\nresult = {}\n" + MEASUREMENTS[name] + "\nprint(json.dumps(result))\n"
+    env = dict(os.environ, MPLBACKEND="Agg")
+    process = subprocess.run(
+        [sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Measurement '{name}' failed:\n{process.stderr}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures import, first page render, first tool call and first model response latency.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of fresh processes per measurement (default: 3).")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    names = [name for name in MEASUREMENTS if name != "first_model_response" or os.getenv("GEMINI_API_KEY")]
+    results = {}
+    for name in names:
+        runs = [run_measurement(name) for _ in range(args.repeat)]
+        results[name] = {
+            stage: {"median": statistics.median(run[stage] for run in runs), "min": min(run[stage] for run in runs)}
+            for stage in runs[0]
+        }
+        for stage, timing in results[name].items():
+            print(f"{name:<22} {stage:<32} median {timing['median']:7.3f} s   min {timing['min']:7.3f} s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import copy
+import weakref
+import threading
+
+import numpy as np
+
+
+# design actions accepted by Section.calculate_stress
+ACTIONS = ["n", "vx", "vy", "mxx", "myy", "m11", "m22", "mzz"]
+# actions causing normal stresses and the matching unit stress fields of a StressResult
+NORMAL_ACTIONS = ["n", "mxx", "myy", "m11", "m22"]
+NORMAL_FIELDS = ["sig_zz_n", "sig_zz_mxx", "sig_zz_myy", "sig_zz_m11", "sig_zz_m22"]
+# actions causing shear stresses, these require a warping analysis
+SHEAR_ACTIONS = ["vx", "vy", "mzz"]
+SHEAR_X_FIELDS = ["sig_zx_vx", "sig_zx_vy", "sig_zx_mzz"]
+SHEAR_Y_FIELDS = ["sig_zy_vx", "sig_zy_vy", "sig_zy_mzz"]
+# stress fields of a StressResult caused by every action, they are proportional to the action
+ACTION_FIELDS = {
+    "n": ["sig_zz_n"], "mxx": ["sig_zz_mxx"], "myy": ["sig_zz_myy"], "m11": ["sig_zz_m11"], "m22": ["sig_zz_m22"],
+    "vx": ["sig_zx_vx", "sig_zy_vx"], "vy": ["sig_zx_vy", "sig_zy_vy"], "mzz": ["sig_zx_mzz", "sig_zy_mzz"],
+}
+# combined stress fields of a StressResult reduced by stress_extrema and their names in the tool results
+STRESS_FIELDS = {"sig_zz": "axial", "sig_zxy": "shear", "sig_vm": "von_mises", "sig_11": "major_principal", "sig_33": "minor_principal"}
+# stress fields and maximum number of nodes of the downsampled stress field
+SAMPLED_FIELDS = ["sig_zz", "sig_zxy", "sig_vm"]
+MAX_FIELD_POINTS = 500
+
+
+def group_node_ids(sec) -> list:
+    """
+    Returns the ids of the nodes of every material group of a section.
+
+    The groups are derived from the element attributes of the mesh in one vectorised pass
+    instead of looping over the element objects. As in sectionproperties, there is one group
+    per distinct material in the order of first occurrence.
+    """
+    materials, group_of_attribute = [], []
+    for material in sec.materials:
+        if material not in materials:
+            materials.append(material)
+        group_of_attribute.append(materials.index(material))
+    attributes = np.asarray(sec.mesh["triangle_attributes"]).T[0].astype(int)
+    element_groups = np.asarray(group_of_attribute)[attributes]
+    return [np.unique(sec.mesh_elements[element_groups == group]) for group in range(len(materials))]
+
+
+# unit stress results per Section object, they are dropped together with the section
+_unit_results = weakref.WeakKeyDictionary()
+_unit_locks = weakref.WeakKeyDictionary()
+_unit_locks_lock = threading.Lock()
+
+
+def unit_stress_results(sec) -> dict:
+    """
+    Returns the stress fields of a section for unit design actions, calculated once per section.
+
+    The stresses are linear in the design actions and sectionproperties keeps the contribution
+    of every action separate, so a single stress analysis with all actions set to 1 gives the
+    fields of all actions. They are kept as long as the Section object exists and calculated
+    again if a warping analysis has been added to the section since, because the shear and
+    torsion fields require it.
+
+    Args:
+        sec: The sectionproperties Section object with geometric (and optionally warping) properties.
+
+    Returns:
+        A dict with "warping" (True if the shear and torsion fields are included) and "groups",
+        a list with the fields of ACTION_FIELDS of every material group over all nodes.
+    """
+    from profiling import span
+
+    with _unit_locks_lock:
+        lock = _unit_locks.setdefault(sec, threading.Lock())
+    # concurrent load cases of the same section wait for one calculation of the unit fields
+    with lock:
+        warping = sec.section_props.omega is not None
+        unit = _unit_results.get(sec)
+        if unit is None or (warping and not unit["warping"]):
+            with span("unit stress fields", elements=len(sec.elements)):
+                stress_post = sec.calculate_stress(**{action: 1.0 for action in (ACTIONS if warping else NORMAL_ACTIONS)})
+            unit = {
+                "warping": warping,
+                "groups": [
+                    {field: getattr(group.stress_result, field) for fields in ACTION_FIELDS.values() for field in fields}
+                    for group in stress_post.material_groups
+                ],
+            }
+            _unit_results[sec] = unit
+        return unit
+
+
+def unit_stress_results_if_available(sec) -> dict:
+    """
+    Returns the unit stress results of a section if they have been calculated, see unit_stress_results.
+    """
+    return _unit_results.get(sec)
+
+
+def set_unit_stress_results(sec, unit: dict):
+    """
+    Registers unit stress results of a section, e.g. after reopening it from the section store.
+    """
+    _unit_results[sec] = unit
+
+
+def superpose_stresses(sec, **actions):
+    """
+    Calculates the stresses of a section like Section.calculate_stress as a linear combination
+    of its unit stress fields.
+
+    Only the first call for a section runs the element loop of sectionproperties, see
+    unit_stress_results. Further load cases of the same section only scale and add arrays.
+
+    Args:
+        sec: The sectionproperties Section object.
+        **actions: The design actions, see ACTIONS.
+
+    Returns:
+        A StressPost object as returned by Section.calculate_stress, with the design actions
+        as "actions" attribute.
+    """
+    from sectionproperties.post.stress_post import StressPost, StressResult
+
+    # the checks of Section.calculate_stress
+    if None in [sec.section_props.area, sec.section_props.ixx_c, sec.section_props.cx]:
+        raise RuntimeError("Perform a geometric analysis before carrying out a stress analysis.")
+    if any(actions.get(action, 0) != 0 for action in SHEAR_ACTIONS) and sec.section_props.omega is None:
+        raise RuntimeError("Perform a warping analysis before carrying out a stress analysis with non-zero shear forces or torsion moment.")
+
+    unit = unit_stress_results(sec)
+    # StressPost deep copies the material groups of the section including their elements, the
+    # combined result only needs new stress results
+    stress_post = StressPost.__new__(StressPost)
+    stress_post.section = sec
+    stress_post.material_groups = []
+    stress_post.actions = {action: float(actions.get(action, 0.0)) for action in ACTIONS}
+    for group, fields in zip(sec.material_groups, unit["groups"]):
+        group = copy.copy(group)
+        group.stress_result = StressResult(sec.num_nodes)
+        for action, names in ACTION_FIELDS.items():
+            value = float(actions.get(action, 0.0))
+            for name in names:
+                setattr(group.stress_result, name, fields[name] * value)
+        group.stress_result.calculate_combined_stresses()
+        stress_post.material_groups.append(group)
+    return stress_post
+
+
+def unit_stress_fields(sec) -> list:
+    """
+    Collects the unit stress fields of a section per material group as basis matrices.
+
+    The stresses of any load case are obtained by superposing these fields, see
+    unit_stress_results. Shear and torsion fields are only available if a warping analysis
+    has been performed.
+
+    Args:
+        sec: The sectionproperties Section object with geometric (and optionally warping) properties.
+
+    Returns:
+        A list with one dict per material group containing the material name, the ids of
+        the nodes of the group and the normal and shear basis matrices (one row per action).
+    """
+    unit = unit_stress_results(sec)
+
+    groups = []
+    for group, fields, node_ids in zip(sec.material_groups, unit["groups"], group_node_ids(sec)):
+        groups.append({
+            "material": group.material.name,
+            "node_ids": node_ids,
+            "normal": np.stack([fields[field][node_ids] for field in NORMAL_FIELDS]),
+            "shear_x": np.stack([fields[field][node_ids] for field in SHEAR_X_FIELDS]),
+            "shear_y": np.stack([fields[field][node_ids] for field in SHEAR_Y_FIELDS]),
+            "warping": unit["warping"],
+        })
+    return groups
+
+
+def combine_stresses(group: dict, actions: np.ndarray) -> tuple:
+    """
+    Superposes the unit stress fields of a material group for several load cases at once.
+
+    Args:
+        group: A material group as returned by unit_stress_fields.
+        actions: Array of shape (number of load cases, 8) with the actions in the order of ACTIONS.
+
+    Returns:
+        The axial, resultant shear and von Mises stresses, each of shape (number of load cases, number of nodes).
+    """
+    normal_actions = actions[:, [ACTIONS.index(action) for action in NORMAL_ACTIONS]]
+    shear_actions = actions[:, [ACTIONS.index(action) for action in SHEAR_ACTIONS]]
+    sig_zz = normal_actions @ group["normal"]
+    sig_zxy = np.hypot(shear_actions @ group["shear_x"], shear_actions @ group["shear_y"])
+    sig_vm = np.sqrt(sig_zz**2 + 3 * sig_zxy**2)
+    return sig_zz, sig_zxy, sig_vm
+
+
+def stress_envelope(sec, load_cases: list, precision: int = 4) -> dict:
+    """
+    Calculates the stress extrema of several load cases in one vectorised pass over the mesh.
+
+    Args:
+        sec: The sectionproperties Section object.
+        load_cases: List of dicts with an optional "name" and the design actions of each load case.
+        precision: Number of significant digits of the reported values.
+
+    Returns:
+        A dict with the extrema of every load case and the envelope over all load cases
+        including the governing load case of every extremum.
+    """
+    if not load_cases:
+        raise ValueError("At least one load case is required.")
+
+    names = []
+    actions = np.zeros((len(load_cases), len(ACTIONS)))
+    for i, load_case in enumerate(load_cases):
+        load_case = dict(load_case)
+        names.append(str(load_case.pop("name", f"LC{i + 1}")))
+        unknown = [key for key in load_case if key not in ACTIONS]
+        if unknown:
+            raise ValueError(f"Unknown actions {unknown} in load case '{names[-1]}'. Valid actions are {ACTIONS}.")
+        for key, value in load_case.items():
+            actions[i, ACTIONS.index(key)] = float(value)
+
+    groups = unit_stress_fields(sec)
+    if not groups[0]["warping"] and np.any(actions[:, [ACTIONS.index(action) for action in SHEAR_ACTIONS]]):
+        raise RuntimeError("Perform a warping analysis before carrying out a stress analysis with non-zero shear forces or torsion moment.")
+
+    # extrema over all material groups, shape (number of load cases,)
+    extrema = {}
+    for group in groups:
+        for stress, values in zip(["axial", "shear", "von_mises"], combine_stresses(group, actions)):
+            group_max, group_min = values.max(axis=1), values.min(axis=1)
+            if stress in extrema:
+                extrema[stress] = (np.maximum(extrema[stress][0], group_max), np.minimum(extrema[stress][1], group_min))
+            else:
+                extrema[stress] = (group_max, group_min)
+
+    from section_results import ZERO_TOLERANCE, round_value
+
+    # stresses much smaller than the peak stress of their load case are numerical noise, as in stress_summary
+    tolerances = ZERO_TOLERANCE * np.max([np.maximum(np.abs(max_values), np.abs(min_values)) for max_values, min_values in extrema.values()], axis=0)
+
+    def stress_value(values, i):
+        return round_value(values[i] if abs(values[i]) >= tolerances[i] else 0.0, precision)
+
+    load_case_results = []
+    for i, name in enumerate(names):
+        load_case_result = {"name": name}
+        for stress, (max_values, min_values) in extrema.items():
+            load_case_result[f"max_{stress}_stress"] = stress_value(max_values, i)
+            load_case_result[f"min_{stress}_stress"] = stress_value(min_values, i)
+        load_case_results.append(load_case_result)
+
+    envelope = {}
+    for stress, (max_values, min_values) in extrema.items():
+        i_max, i_min = int(max_values.argmax()), int(min_values.argmin())
+        envelope[f"max_{stress}_stress"] = {"value": stress_value(max_values, i_max), "load_case": names[i_max]}
+        envelope[f"min_{stress}_stress"] = {"value": stress_value(min_values, i_min), "load_case": names[i_min]}
+
+    return {"load_cases": load_case_results, "envelope": envelope}
+
+
+def stress_extrema(sec, stresses) -> list:
+    """
+    Reduces the combined stress fields of every material group in one vectorised pass.
+
+    Nodes of other material groups are excluded, their stresses are zero in the stress result
+    of a group.
+
+    Args:
+        sec: The sectionproperties Section object the stresses were calculated for.
+        stresses: The StressPost object returned by calculate_stress.
+
+    Returns:
+        A list with one dict per material group containing the material name and, for every
+        field of STRESS_FIELDS, the maximum and minimum value and the ids of their nodes.
+    """
+    rows = np.arange(len(STRESS_FIELDS))
+    groups = []
+    for group, node_ids in zip(stresses.material_groups, group_node_ids(sec)):
+        sr = group.stress_result
+        # shape (number of fields, number of nodes of the group)
+        values = np.stack([getattr(sr, field)[node_ids] for field in STRESS_FIELDS])
+        i_max, i_min = values.argmax(axis=1), values.argmin(axis=1)
+        groups.append({
+            "material": group.material.name,
+            "max": values[rows, i_max],
+            "min": values[rows, i_min],
+            "max_nodes": node_ids[i_max],
+            "min_nodes": node_ids[i_min],
+        })
+    return groups
+
+
+def sample_stress_field(sec, stresses, n_points: int, groups: list = None) -> dict:
+    """
+    Downsamples the stress field of a section to about n_points nodes, e.g. for plotting.
+
+    The nodes are spread evenly over the material groups in proportion to their size and the
+    nodes of the von Mises stress extrema are always included.
+
+    Args:
+        sec: The sectionproperties Section object the stresses were calculated for.
+        stresses: The StressPost object returned by calculate_stress.
+        n_points: The number of sampled nodes, at most MAX_FIELD_POINTS.
+        groups: (Optional) The result of stress_extrema, calculated if not given.
+
+    Returns:
+        A dict with the x and y coordinates, the material and the SAMPLED_FIELDS of every sampled node.
+    """
+    n_points = max(1, min(int(n_points), MAX_FIELD_POINTS))
+    groups = groups or stress_extrema(sec, stresses)
+    all_node_ids = group_node_ids(sec)
+    n_nodes = sum(len(node_ids) for node_ids in all_node_ids)
+    vm = list(STRESS_FIELDS).index("sig_vm")
+
+    sample = {"x": [], "y": [], "material": []} | {field: [] for field in SAMPLED_FIELDS}
+    for group, node_ids, extrema in zip(stresses.material_groups, all_node_ids, groups):
+        n_group = max(1, round(n_points * len(node_ids) / n_nodes))
+        picked = node_ids[np.linspace(0, len(node_ids) - 1, min(n_group, len(node_ids))).astype(int)]
+        picked = np.unique(np.concatenate([picked, [extrema["max_nodes"][vm], extrema["min_nodes"][vm]]]))
+        sample["x"].extend(sec.mesh_nodes[picked, 0].tolist())
+        sample["y"].extend(sec.mesh_nodes[picked, 1].tolist())
+        sample["material"].extend([group.material.name] * len(picked))
+        for field in SAMPLED_FIELDS:
+            sample[field].extend(getattr(group.stress_result, field)[picked].tolist())
+    return sample
+
+
+def stress_summary(sec, stresses, field_points: int = None, precision: int = 4) -> dict:
+    """
+    Creates the compact stress results of a tool response.
+
+    Args:
+        sec: The sectionproperties Section object the stresses were calculated for.
+        stresses: The StressPost object returned by calculate_stress.
+        field_points: (Optional) Number of nodes of a downsampled stress field added to the result.
+        precision: Number of significant digits of the reported values.
+
+    Returns:
+        A dict with the extremum and its location of every field of STRESS_FIELDS over all
+        material groups, the extrema of every material group of composite sections and the
+        optional downsampled stress field.
+    """
+    from section_results import ZERO_TOLERANCE, round_value
+
+    groups = stress_extrema(sec, stresses)
+    composite = len(groups) > 1
+    # stresses much smaller than the peak stress are numerical noise, e.g. shear stresses at free edges
+    tolerance = ZERO_TOLERANCE * max(max(np.abs(group["max"]).max(), np.abs(group["min"]).max()) for group in groups)
+
+    def stress_value(value):
+        return round_value(value if abs(value) >= tolerance else 0.0, precision)
+
+    def location(group, extremum, i):
+        node = group[f"{extremum}_nodes"][i]
+        result = {
+            "value": stress_value(group[extremum][i]),
+            "x": round_value(sec.mesh_nodes[node, 0], precision),
+            "y": round_value(sec.mesh_nodes[node, 1], precision),
+        }
+        if composite:
+            result["material"] = group["material"]
+        return result
+
+    extrema = {}
+    for i, name in enumerate(STRESS_FIELDS.values()):
+        max_group = max(groups, key=lambda group: group["max"][i])
+        min_group = min(groups, key=lambda group: group["min"][i])
+        extrema[name] = {"max": location(max_group, "max", i), "min": location(min_group, "min", i)}
+
+    summary = {"unit": "N/mm2", "extrema": extrema}
+    if composite:
+        summary["material_groups"] = [
+            {"material": group["material"]} | {
+                f"{extremum}_{name}": stress_value(group[extremum][i])
+                for i, name in enumerate(STRESS_FIELDS.values()) for extremum in ["max", "min"]
+            }
+            for group in groups
+        ]
+    if field_points:
+        sample = sample_stress_field(sec, stresses, field_points, groups)
+        summary["stress_field"] = {key: [round_value(value, precision) if not isinstance(value, str) else value for value in values] for key, values in sample.items()}
+    return summary
@@ -0,0 +1,189 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from solver_pool import queue_feedback
+
+
+# tools that replace the current section like a section generator
+SECTION_OPENERS = ["open_section"]
+# tools that mutate the current section in place (analysis results are stored on the Section)
+SECTION_WRITERS = ["calculate_geometric_properties", "calculate_warping_properties"]
+# tools that only read the current section
+SECTION_READERS = ["calculate_stress", "calculate_stress_envelope"]
+# tools that create new stress results
+STRESS_WRITERS = ["calculate_stress"]
+# tools that only read the current stress results
+STRESS_READERS = ["plot_stress"]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide thread pool used to execute tool calls.
+
+    The number of workers can be set with the TOOL_WORKERS environment variable. The finite
+    element solves of the tools are limited by the solver pool, so tool workers mostly wait
+    and there can be more of them than CPUs.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            max_workers = int(os.getenv("TOOL_WORKERS", "16"))
+            _pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        return _pool
+
+
+def plan_dependencies(function_calls, is_generator) -> list:
+    """
+    Determines which earlier tool calls of a turn each tool call has to wait for.
+
+    The calls are executed as if they ran one after another in the given order: a section
+    generator or a reopened section starts a new section, geometric and warping analyses modify the current
+    section, stress analyses read the current section and stress plots read the latest
+    stress results. Calls only wait for the calls whose results they depend on, e.g.
+    several stress analyses of the same section or several section generators run
+    concurrently.
+
+    Args:
+        function_calls: The function calls of one model response.
+        is_generator: Callable returning True if a tool name is a section generator.
+
+    Returns:
+        A list with a list of the indices of the prerequisite calls for every call.
+    """
+    dependencies = []
+    section_writer = None  # last call that created or modified the current section
+    section_readers = []  # calls reading the current section since the last modification
+    stress_writer = None  # last call that created stress results
+
+    for i, function_call in enumerate(function_calls):
+        deps = []
+        if is_generator(function_call.name) or function_call.name in SECTION_OPENERS:
+            section_writer = i
+            section_readers = []
+        elif function_call.name in SECTION_WRITERS:
+            if section_writer is not None:
+                deps.append(section_writer)
+            # wait for everything still reading the section before modifying it
+            deps.extend(section_readers)
+            section_writer = i
+            section_readers = []
+        elif function_call.name in SECTION_READERS:
+            if section_writer is not None:
+                deps.append(section_writer)
+            section_readers.append(i)
+            if function_call.name in STRESS_WRITERS:
+                stress_writer = i
+        elif function_call.name in STRESS_READERS:
+            if stress_writer is not None:
+                deps.append(stress_writer)
+        dependencies.append(deps)
+
+    return dependencies
+
+
+def execute_tool_calls(function_calls, run_tool, state: dict, is_generator, on_complete=None, on_progress=None) -> tuple:
+    """
+    Executes the tool calls of one model response, see execute_tool_calls_async.
+
+    This blocking variant is used by callers that do not run an event loop.
+    """
+    return asyncio.run(execute_tool_calls_async(function_calls, run_tool, state, is_generator, on_complete, on_progress))
+
+
+async def execute_tool_calls_async(function_calls, run_tool, state: dict, is_generator, on_complete=None, on_progress=None) -> tuple:
+    """
+    Executes the tool calls of one model response in the shared thread pool.
+
+    Independent calls run concurrently, dependent calls start as soon as their
+    prerequisites have finished and receive the section and stresses produced by them.
+    The event loop is not blocked while the tools run, so the caller can keep updating the UI.
+
+    Args:
+        function_calls: The function calls of one model response.
+        run_tool: Callable run_tool(name, args, inputs) returning the tool result and a dict
+                  with the outputs of the call ("sec", "geom", "stresses" and "figures").
+        state: The session state before the calls with the keys "sec", "geom" and "stresses".
+        is_generator: Callable returning True if a tool name is a section generator.
+        on_complete: (Optional) Callback on_complete(index, tool_result, elapsed) that is
+                     called from the event loop whenever a tool call has finished.
+        on_progress: (Optional) Callback on_progress(index, message) that is called from the
+                     event loop for progress messages of long-running tools. Tools report
+                     progress through the "report_progress" function passed in their inputs.
+
+    Returns:
+        A list of (tool_result, elapsed) tuples in call order and the session state after all
+        calls, including the figures of all calls in call order under the "figures" key.
+    """
+    dependencies = plan_dependencies(function_calls, is_generator)
+    outputs = [None] * len(function_calls)
+    results = [None] * len(function_calls)
+    progress_messages = queue.Queue()
+
+    def inputs_for(i):
+        # the latest state produced by the prerequisites, falling back to the session state
+        inputs = dict(state)
+        for dep in sorted(dependencies[i]):
+            for key in ["sec", "geom", "stresses"]:
+                if key in outputs[dep]:
+                    inputs[key] = outputs[dep][key]
+        inputs["report_progress"] = lambda message: progress_messages.put((i, message))
+        return inputs
+
+    def timed_call(i, inputs):
+        start = time.perf_counter()
+        # the positions of the solver jobs of the call in the shared queue are shown as progress
+        with queue_feedback(inputs["report_progress"]):
+            tool_result, call_outputs = run_tool(function_calls[i].name, function_calls[i].args or {}, inputs)
+        return tool_result, call_outputs, time.perf_counter() - start
+
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    pending = {}
+    started = set()
+    finished = set()
+
+    while len(finished) < len(function_calls):
+        for i in range(len(function_calls)):
+            if i not in started and all(dep in finished for dep in dependencies[i]):
+                # the tool runs with a copy of the caller's context, so its profiling spans nest in the current turn
+                pending[loop.run_in_executor(pool, contextvars.copy_context().run, timed_call, i, inputs_for(i))] = i
+                started.add(i)
+
+        # wake up regularly to forward progress messages if there is a progress callback
+        done, _ = await asyncio.wait(pending, timeout=0.25 if on_progress else None, return_when=asyncio.FIRST_COMPLETED)
+        while on_progress and not progress_messages.empty():
+            on_progress(*progress_messages.get_nowait())
+        for future in done:
+            i = pending.pop(future)
+            try:
+                tool_result, call_outputs, elapsed = future.result()
+            except Exception as e:
+                tool_result = {
+                    "status": "error",
+                    "message": f"Error calling {function_calls[i].name}: {str(e)}"
+                }
+                call_outputs, elapsed = {}, 0.0
+            outputs[i] = call_outputs
+            results[i] = (tool_result, elapsed)
+            finished.add(i)
+            if on_complete:
+                on_complete(i, tool_result, elapsed)
+
+    # apply the outputs in call order so that the final state matches a sequential execution
+    new_state = dict(state)
+    new_state["figures"] = []
+    for call_outputs in outputs:
+        for key in ["sec", "geom", "stresses"]:
+            if key in call_outputs:
+                new_state[key] = call_outputs[key]
+        new_state["figures"].extend(call_outputs.get("figures", []))
+
+    return results, new_state
@@ -0,0 +1,353 @@
+import os
+import json
+import threading
+from functools import partial
+
+from tool_registry import ToolRegistry
+
+# The analysis stack (sectionproperties, matplotlib and the analysis modules of this app) is
+# imported inside the handlers, so that it is only loaded on the first tool call and not when
+# the app starts.
+
+
+TOOL_DECLARATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tool_declaration.json")
+
+
+def plot_figure(inputs: dict, key: tuple, draw, n_elements: int):
+    """
+    Draws a plot and returns it as a figure output of a tool.
+
+    By default the plot is rendered once to image bytes in the worker thread of the tool call
+    and cached by key, so that sessions only keep the bytes and not the matplotlib figure. The
+    CLI passes a "new_axes" factory in the inputs to draw into pyplot windows instead.
+
+    Args:
+        inputs: The inputs of the tool call.
+        key: The parts of the render cache key identifying the plot.
+        draw: Callable draw(ax) drawing the plot on the given axes.
+        n_elements: The number of elements of the plotted mesh.
+    """
+    if inputs.get("new_axes"):
+        ax = inputs["new_axes"]()
+        draw(ax)
+        return ax.get_figure()
+    from section_cache import SectionCache
+    from figure_renderer import default_render_cache
+    return default_render_cache().render(SectionCache.make_key(*key), draw, n_elements)
+
+
+def current_section(inputs: dict) -> tuple:
+    """
+    Returns the meshed section of the session and, if it has just been meshed, its estimate.
+
+    A section generated in estimate mode is only meshed, with the mesh size of the generator
+    call, and analysed geometrically by the first tool call that needs the finite element
+    analysis. The estimate is returned so that the tool can report the agreement.
+    """
+    deferred = getattr(inputs["geom"], "deferred_section", None)
+    if inputs["sec"] is None and deferred:
+        from sectionproperties.pre.library import steel_sections
+        from section_cache import default_cache
+        from mesh_sizing import mesh_section
+
+        cache = default_cache()
+        sec, _ = mesh_section(deferred["name"], getattr(steel_sections, deferred["name"]), deferred["args"], cache, deferred["mesh_size"])
+        return cache.analyse(sec, "geometric"), deferred["estimate"]
+    if inputs["sec"] is None:
+        raise RuntimeError("No section has been generated yet. Please generate a section first.")
+    return inputs["sec"], None
+
+
+def estimate_section(name: str, generator_args: dict, mesh_size: float) -> tuple:
+    from sectionproperties.pre.library import steel_sections
+    from section_results import properties_result
+    from section_estimates import estimate_properties
+
+    geom = getattr(steel_sections, name)(**generator_args)
+    estimate = estimate_properties(name, generator_args, geom)
+    # the section is meshed by the first tool call that needs it, see current_section
+    geom.deferred_section = {"name": name, "args": generator_args, "mesh_size": mesh_size, "estimate": estimate}
+
+    torsion = "and the torsion constant of thin-walled theory" if "j" in estimate else "(no torsion constant estimate is available for this section)"
+    tool_result = {
+        "status": "success",
+        "message": f"Section properties have been estimated from the dimensions without meshing: the area, centroid, moments of area and section moduli of the section outline {torsion}. The section will be meshed once verified values, warping properties or stresses are calculated.",
+        "estimate": True,
+        **properties_result(estimate),
+        "next_steps_suggestion": "Would you like to verify these values with a finite element analysis, calculate warping properties or perform a stress analysis?",
+    }
+    return tool_result, {"sec": None, "geom": geom}
+
+
+def generate_section(name: str, args: dict, inputs: dict) -> tuple:
+    from sectionproperties.pre.library import steel_sections
+    from section_cache import default_cache, section_hash
+    from section_store import SHORT_ID_LENGTH, default_section_store
+    from mesh_sizing import MESH_OPTIONS, mesh_section
+    from speculation import default_speculator
+
+    generator_args = {key: value for key, value in args.items() if key not in MESH_OPTIONS}
+    if args.get("estimate"):
+        default_speculator().cancel()
+        return estimate_section(name, generator_args, args.get("mesh_size"))
+    sec, mesh = mesh_section(
+        name, getattr(steel_sections, name), generator_args, default_cache(), args.get("mesh_size"), args.get("mesh_convergence", False)
+    )
+
+    figure = plot_figure(
+        inputs, ("mesh", section_hash(sec)), lambda ax: sec.plot_mesh(materials=False, pause=False, ax=ax), mesh["n_elements"]
+    )
+
+    tool_result = {
+        "status": "success",
+        "message": f"Geometry of the section generated and meshed successfully. A maximum element area of {mesh['mesh_size']} mm² was used ({mesh['mode']} mesh size) resulting in {mesh['n_elements']} elements. A plot was generated showing the section mesh.",
+        "mesh": mesh,
+        "next_steps_suggestion": "Would you like to evaluate the section properties or perform a stress analysis?",
+    }
+    store = default_section_store()
+    if store:
+        # the section and its later analysis results can be reopened by this id
+        tool_result["section_id"] = store.save(sec, {"generator": name, "args": generator_args})[:SHORT_ID_LENGTH]
+    # the analyses the model most likely asks for next run in the background while it writes its reply
+    default_speculator().start(sec)
+    return tool_result, {"sec": sec, "geom": sec.geometry, "figures": [figure]}
+
+
+def open_section(args: dict, inputs: dict) -> tuple:
+    from section_cache import section_hash
+    from section_store import current_stored_session, default_section_store
+    from speculation import default_speculator
+
+    store = default_section_store()
+    if store is None:
+        raise RuntimeError("Sections are not saved on this server, please generate the section again.")
+    if not args.get("section_id"):
+        # a session only lists its own sections, not those of other users of the server
+        session = current_stored_session()
+        tool_result = {
+            "status": "success",
+            "message": "These are the most recently saved sections of this session.",
+            "sections": store.recent(section_ids=list(session.section_ids) if session is not None else None),
+            "next_steps_suggestion": "Would you like to reopen one of these sections?",
+        }
+        return tool_result, {}
+
+    sec = store.load(args["section_id"])
+    # the reopened section has its saved analysis results, the previous section is not analysed any further
+    default_speculator().cancel()
+    meta = store.meta(store.resolve(args["section_id"]))
+    figure = plot_figure(
+        inputs, ("mesh", section_hash(sec)), lambda ax: sec.plot_mesh(materials=False, pause=False, ax=ax), len(sec.elements)
+    )
+
+    tool_result = {
+        "status": "success",
+        "message": f"The saved section has been reopened with {len(sec.elements)} elements and its {' and '.join(meta['analyses']) or 'no'} analysis results. A plot was generated showing the section mesh.",
+        **meta.get("source", {}),
+        "analyses": meta["analyses"],
+        "next_steps_suggestion": "Would you like to calculate further properties or perform a stress analysis?",
+    }
+    return tool_result, {"sec": sec, "geom": sec.geometry, "figures": [figure]}
+
+
+def sweep_section_parameters(registry: ToolRegistry, args: dict, inputs: dict) -> tuple:
+    from section_sweep import sweep
+
+    if not registry.is_generator(args["generator"]):
+        raise ValueError(f"'{args['generator']}' is not one of the available section generators.")
+    declaration = registry.declaration(args["generator"])
+
+    objective, goal = args.get("objective", "area"), args.get("goal", "minimise")
+    progress = {"evaluated": 0, "best": None}
+
+    def on_result(candidate_args, properties, feasible):
+        # stream the best feasible candidate found so far into the tool log
+        progress["evaluated"] += 1
+        if feasible and objective in properties:
+            value = properties[objective]
+            if progress["best"] is None or (value < progress["best"] if goal == "minimise" else value > progress["best"]):
+                progress["best"] = value
+        if inputs.get("report_progress"):
+            best = f", best {objective} so far: {progress['best']:.4g}" if progress["best"] is not None else ""
+            inputs["report_progress"](f"{progress['evaluated']} candidates evaluated{best}")
+
+    sweep_result = sweep(
+        declaration, args.get("ranges"), args.get("fixed_args"), objective, goal, args.get("constraints"),
+        args.get("warping", False), args.get("top_n", 5), on_result=on_result,
+    )
+
+    tool_result = {
+        "status": "success",
+        "message": f"{sweep_result['n_candidates']} candidates of the {declaration['name']} have been evaluated, {sweep_result['n_feasible']} satisfy all constraints.",
+        **sweep_result,
+        "next_steps_suggestion": "Would you like to generate one of the ranked candidates for a detailed analysis?",
+    }
+    return tool_result, {}
+
+
+def find_standard_section(args: dict, inputs: dict) -> tuple:
+    from section_catalogue import default_catalogue
+    from section_results import DEFAULT_VERBOSITY
+
+    catalogue = default_catalogue()
+    if args.get("designation"):
+        section = catalogue.lookup(args["designation"], args.get("properties"), args.get("verbosity", DEFAULT_VERBOSITY))
+        tool_result = {
+            "status": "success",
+            "message": f"{section['designation']} was found in the section catalogue. Its properties were calculated in advance, no section has been generated.",
+            **section,
+            "next_steps_suggestion": f"Would you like to generate the {section['designation']} with the {section['generator']} for a stress analysis?",
+        }
+        return tool_result, {}
+
+    query = catalogue.query(
+        args.get("families"), args.get("constraints"), args.get("sort_by", "mass"), args.get("goal", "minimise"),
+        args.get("limit", 10), args.get("properties"),
+    )
+    tool_result = {
+        "status": "success",
+        "message": f"{query['n_matches']} of the {len(catalogue)} catalogue sections satisfy all constraints, the first {len(query['sections'])} sorted by {args.get('sort_by', 'mass')} are listed.",
+        **query,
+        "next_steps_suggestion": "Would you like to generate one of these sections for a detailed analysis?",
+    }
+    return tool_result, {}
+
+
+def calculate_properties(analysis: str, args: dict, inputs: dict) -> tuple:
+    from section_cache import default_cache
+    from section_results import RESULT_OPTIONS, section_properties_result
+    from section_estimates import estimate_agreement
+
+    sec, estimate = current_section(inputs)
+    options = {key: value for key, value in args.items() if key in RESULT_OPTIONS}
+    sec = default_cache().analyse(sec, analysis, **{key: value for key, value in args.items() if key not in RESULT_OPTIONS})
+
+    if analysis == "geometric":
+        message = "Geometric section properties have been calculated successfully."
+        next_steps = "Would you like to calculate warping properties or perform a stress analysis?"
+    else:
+        message = "Warping properties of the section have been calculated successfully."
+        next_steps = "Would you like to continue with a stress analysis?"
+
+    tool_result = {
+        "status": "success",
+        "message": message,
+        **section_properties_result(sec, **options),
+        "next_steps_suggestion": next_steps,
+    }
+    if estimate:
+        tool_result["estimate_agreement"] = estimate_agreement(estimate, sec)
+    return tool_result, {"sec": sec, "geom": sec.geometry}
+
+
+def calculate_stress(args: dict, inputs: dict) -> tuple:
+    from solver_pool import default_solver_pool
+    from stress_analysis import ACTIONS, stress_summary, superpose_stresses
+    from section_estimates import estimate_agreement
+
+    sec, estimate = current_section(inputs)
+    # the unit stress fields of the section are calculated once, further load cases are superposed
+    stresses = default_solver_pool().run(
+        "stress", lambda: superpose_stresses(sec, **{key: value for key, value in args.items() if key in ACTIONS}), "stress analysis", elements=len(sec.elements)
+    )
+
+    tool_result = {
+        "status": "success",
+        "message": "Section stresses have been calculated successfully. The extrema of all material groups and their locations are reported.",
+        **stress_summary(sec, stresses, args.get("field_points")),
+        "next_steps_suggestion": "Would you like to view the stress results? I could plot the Axial, Shear or von Mises stresses for you.",
+    }
+    if estimate:
+        tool_result["estimate_agreement"] = estimate_agreement(estimate, sec)
+        return tool_result, {"sec": sec, "geom": sec.geometry, "stresses": stresses}
+    return tool_result, {"stresses": stresses}
+
+
+def calculate_stress_envelope(args: dict, inputs: dict) -> tuple:
+    from solver_pool import default_solver_pool
+    from stress_analysis import stress_envelope
+    from section_estimates import estimate_agreement
+
+    sec, estimate = current_section(inputs)
+    envelope = default_solver_pool().run(
+        "stress", lambda: stress_envelope(sec, args.get("load_cases", [])), "stress envelope", elements=len(sec.elements)
+    )
+
+    tool_result = {
+        "status": "success",
+        "message": f"Section stresses have been calculated successfully for {len(envelope['load_cases'])} load cases.",
+        "load_cases": envelope["load_cases"],
+        "envelope": envelope["envelope"],
+        "next_steps_suggestion": "Would you like to plot the stresses of the governing load case? I could calculate them for you.",
+    }
+    if estimate:
+        tool_result["estimate_agreement"] = estimate_agreement(estimate, sec)
+        return tool_result, {"sec": sec, "geom": sec.geometry}
+    return tool_result, {}
+
+
+def plot_stress(args: dict, inputs: dict) -> tuple:
+    if not inputs["stresses"]:
+        tool_result = {
+            "status": "error",
+            "message": "Stresses have not been calculated yet. Please calculate stresses before plotting."
+        }
+        return tool_result, {}
+
+    from section_cache import section_hash
+    from figure_renderer import stress_digest
+
+    stresses = inputs["stresses"]
+    args = {"normalize": False, **args}
+    figure = plot_figure(
+        inputs, ("stress", section_hash(stresses.section), stress_digest(stresses), args.get("stress"), args["normalize"]),
+        lambda ax: stresses.plot_stress(**args, pause=False, ax=ax), len(stresses.section.mesh["triangles"]),
+    )
+
+    tool_result = {
+        "status": "success",
+        "message": f"Plot of {args.get('stress')} stresses generated.",
+        "plot_description": "A plot of the stresses over the section.",
+        "caption_suggestion": "Here's the section stress plot.",
+    }
+    return tool_result, {"figures": [figure]}
+
+
+def create_registry(declarations: list) -> ToolRegistry:
+    """
+    Creates the tool registry and binds every declared tool to its handler.
+
+    All declared tools without a handler of their own are section generators named after a
+    function of the sectionproperties steel section library. The library is only imported on
+    the first generator call.
+    """
+    registry = ToolRegistry(declarations)
+    registry.register("sweep_section_parameters", partial(sweep_section_parameters, registry))
+    registry.register("calculate_geometric_properties", partial(calculate_properties, "geometric"))
+    registry.register("calculate_warping_properties", partial(calculate_properties, "warping"))
+    registry.register("calculate_stress", calculate_stress)
+    registry.register("calculate_stress_envelope", calculate_stress_envelope)
+    registry.register("plot_stress", plot_stress)
+    registry.register("open_section", open_section)
+    registry.register("find_standard_section", find_standard_section)
+
+    for declaration in declarations:
+        if not registry.is_registered(declaration["name"]):
+            registry.register(declaration["name"], partial(generate_section, declaration["name"]), generator=True)
+    return registry
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def default_registry() -> ToolRegistry:
+    """
+    Returns the process-wide tool registry built from tool_declaration.json.
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            with open(TOOL_DECLARATION_FILE, 'r') as f:
+                _default_registry = create_registry(json.load(f))
+        return _default_registry
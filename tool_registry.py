@@ -0,0 +1,163 @@
+import time
+import threading
+
+from profiling import span
+
+
+# JSON schema types of the tool declarations and the Python types accepted for them
+SCHEMA_TYPES = {
+    "number": (int, float),
+    "integer": (int, float),
+    "boolean": (bool,),
+    "string": (str,),
+    "array": (list, tuple),
+    "object": (dict,),
+}
+
+
+class ToolArgumentError(ValueError):
+    """
+    Raised if the arguments of a tool call do not match the declaration of the tool.
+    """
+
+
+def coerce_value(schema: dict, value, path: str):
+    """
+    Validates a value against a declared parameter schema and converts it to the declared type.
+
+    Numbers are converted to float and integers to int, because the model sends all numbers as
+    floats. Strings holding numbers or booleans are converted as well.
+
+    Args:
+        schema: The parameter schema from tool_declaration.json.
+        value: The value sent by the model.
+        path: The name of the parameter used in error messages, e.g. "load_cases[0].mxx".
+
+    Returns:
+        The converted value.
+    """
+    schema_type = schema.get("type", "string")
+    if schema_type in ["number", "integer"] and isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            raise ToolArgumentError(f"'{path}' must be a number, got '{value}'.")
+    if schema_type == "boolean" and isinstance(value, str) and value.lower() in ["true", "false"]:
+        value = value.lower() == "true"
+    # bool is a subclass of int but is not a valid number
+    if not isinstance(value, SCHEMA_TYPES[schema_type]) or (schema_type in ["number", "integer"] and isinstance(value, bool)):
+        raise ToolArgumentError(f"'{path}' must be of type {schema_type}, got {type(value).__name__}.")
+
+    if schema_type == "number":
+        return float(value)
+    if schema_type == "integer":
+        if float(value) != int(value):
+            raise ToolArgumentError(f"'{path}' must be an integer, got {value}.")
+        return int(value)
+    if schema_type == "string" and "enum" in schema and value not in schema["enum"]:
+        raise ToolArgumentError(f"'{path}' must be one of {schema['enum']}, got '{value}'.")
+    if schema_type == "array":
+        return [coerce_value(schema.get("items", {}), item, f"{path}[{i}]") for i, item in enumerate(value)]
+    if schema_type == "object":
+        return coerce_object(schema, value, path)
+    return value
+
+
+def coerce_object(schema: dict, values: dict, path: str = "") -> dict:
+    """
+    Validates the properties of an object against its schema, see coerce_value.
+    """
+    properties = schema.get("properties", {})
+    prefix = f"{path}." if path else ""
+    unknown = [key for key in values if key not in properties]
+    if unknown:
+        raise ToolArgumentError(f"Unknown arguments {[prefix + key for key in unknown]}. Valid arguments are {[prefix + key for key in properties]}.")
+    missing = [key for key in schema.get("required", []) if values.get(key) is None]
+    if missing:
+        raise ToolArgumentError(f"Missing required arguments {[prefix + key for key in missing]}.")
+    # arguments explicitly set to null are treated as omitted
+    return {key: coerce_value(properties[key], value, prefix + key) for key, value in values.items() if value is not None}
+
+
+class ToolRegistry:
+    """
+    Binds the tools declared in tool_declaration.json to their handlers.
+
+    Every handler is called as handler(args, inputs) with the validated and converted arguments
+    of the call and the state the tool works on, and returns the tool result for the model and
+    a dict with the outputs of the call. Dispatching is a single dict lookup, arguments are
+    checked against the declared schema before the handler runs, and errors and the wall time
+    of every call are handled in one place.
+    """
+
+    def __init__(self, declarations: list):
+        self.declarations = declarations
+        self._declarations = {declaration["name"]: declaration for declaration in declarations}
+        self._handlers = {}
+        self._generators = set()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def register(self, name: str, handler, generator: bool = False):
+        """
+        Registers the handler of a declared tool.
+
+        Args:
+            name: The name of the tool in tool_declaration.json.
+            handler: Callable handler(args, inputs) returning the tool result and the outputs.
+            generator: True if the tool generates a new section.
+        """
+        if name not in self._declarations:
+            raise KeyError(f"Tool '{name}' is not declared in tool_declaration.json.")
+        self._handlers[name] = handler
+        if generator:
+            self._generators.add(name)
+
+    def is_registered(self, name: str) -> bool:
+        return name in self._handlers
+
+    def declaration(self, name: str) -> dict:
+        return self._declarations.get(name)
+
+    def is_generator(self, name: str) -> bool:
+        return name in self._generators
+
+    def validate(self, name: str, args: dict) -> dict:
+        return coerce_object(self._declarations[name]["parameters"], dict(args or {}))
+
+    def dispatch(self, name: str, args: dict, inputs: dict) -> tuple:
+        """
+        Validates the arguments of a tool call and runs the handler of the tool.
+
+        Args:
+            name: The name of the called tool.
+            args: The arguments of the call as sent by the model.
+            inputs: The state the tool works on with the keys "sec", "geom" and "stresses".
+
+        Returns:
+            The tool result for the model and a dict with the outputs of the call, i.e. the new
+            "sec", "geom" and "stresses" and the generated "figures".
+        """
+        handler = self._handlers.get(name)
+        if handler is None:
+            return {"status": "error", "message": f"Tool '{name}' is not implemented or not available."}, {}
+
+        start = time.perf_counter()
+        with span(f"tool {name}") as tool_span:
+            try:
+                tool_result, outputs = handler(self.validate(name, args), inputs)
+            except Exception as e:
+                tool_result, outputs = {"status": "error", "message": f"Error calling {name}: {str(e)}"}, {}
+            tool_span.set(status=tool_result.get("status"))
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            stats = self._stats.setdefault(name, {"calls": 0, "errors": 0, "total_time": 0.0})
+            stats["calls"] += 1
+            stats["errors"] += tool_result.get("status") == "error"
+            stats["total_time"] += elapsed
+        return tool_result, outputs
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import threading
+
+from history_manager import CHARS_PER_TOKEN
+
+
+# "auto" sends the tools relevant to the session state and the prompt, "all" every declared tool
+TOOL_SELECTION_MODES = ["auto", "all"]
+# tools that analyse and plot the current section, sent whenever a section exists
+ANALYSIS_TOOLS = [
+    "calculate_geometric_properties", "calculate_warping_properties", "calculate_stress", "calculate_stress_envelope", "plot_stress",
+]
+# tools sent with every selection
+COMMON_TOOLS = ["open_section"]
+# abbreviations of section generators used in prompts
+GENERATOR_ALIASES = {
+    "chs": "circular_hollow_section",
+    "ehs": "elliptical_hollow_section",
+    "rhs": "rectangular_hollow_section",
+    "shs": "rectangular_hollow_section",
+}
+# beginnings of words of prompts asking for a section other than the current one, all generators are sent
+NEW_SECTION_WORDS = ["generat", "creat", "new", "another", "other", "different", "compar", "instead", "replace"]
+# beginnings of words of prompts asking for the search tools
+SEARCH_WORDS = {
+    "find_standard_section": ["standard", "catalog", "designation", "ipe", "hea", "heb", "upe", "lightest", "heaviest", "kg/m", "mass"],
+    "sweep_section_parameters": ["sweep", "optimi", "best", "minimi", "maximi", "range", "vary", "varies", "candidate"],
+}
+# finish reason of a response calling a tool that was not sent, the response is requested again with all tools
+MALFORMED_FUNCTION_CALL = "MALFORMED_FUNCTION_CALL"
+
+
+def is_selection_error(error: Exception) -> bool:
+    """
+    Returns True if a failed request may have been rejected because of the pruned tools.
+
+    Only invalid requests (400) qualify, e.g. a history calling a tool that was not sent. Errors
+    such as an invalid API key or an exhausted quota fail the same way with all tools.
+    """
+    from google.genai import errors
+
+    return isinstance(error, errors.ClientError) and error.code == 400
+
+
+def declaration_tokens(declaration: dict) -> int:
+    """
+    Estimates the number of prompt tokens of one tool declaration.
+    """
+    return len(json.dumps(declaration)) // CHARS_PER_TOKEN + 1
+
+
+def mentions(text: str, words: list) -> bool:
+    return any(re.search(rf"\b{re.escape(word)}", text) for word in words)
+
+
+def mentioned_generators(text: str, generators: list) -> list:
+    """
+    Returns the generators named in a prompt, e.g. "channel" or "RHS".
+    """
+    names = []
+    for name in generators:
+        phrase = name.replace("_", " ")
+        short = phrase.removesuffix(" section")
+        if re.search(rf"\b{re.escape(phrase)}\b", text) or (len(short) > 2 and re.search(rf"\b{re.escape(short)}\b", text)):
+            names.append(name)
+    names.extend(name for alias, name in GENERATOR_ALIASES.items() if re.search(rf"\b{alias}\b", text) and name not in names)
+    return names
+
+
+def latest_generator(history: list, is_generator) -> str:
+    """
+    Returns the name of the generator of the latest section generated in the conversation, or None.
+    """
+    for content in reversed(history):
+        for part in content.parts or []:
+            if part.function_call and is_generator(part.function_call.name):
+                return part.function_call.name
+    return None
+
+
+class ToolSelector:
+    """
+    Selects the tool declarations sent with a model request.
+
+    All declarations together are about 8k tokens, most of them the parameter descriptions of
+    the section generators, which are not needed once a section is being analysed. In "auto"
+    mode a request carries:
+
+    - before a section exists: all tools, unless the prompt names generators or asks for the
+      search tools, then only those with the analysis tools;
+    - once a section exists: the analysis and plot tools, the generator of the current section
+      (for changes such as "make it deeper"), the generators named in the prompt, all generators
+      if the prompt asks for a new or different section, and the search tools if asked for;
+    - tools named in the prompt by their declared name, and open_section.
+
+    The full set is sent in "all" mode. A pruned request is sent again with the full set if the
+    model tries to call a tool that was not sent (MALFORMED_FUNCTION_CALL) or the request is
+    rejected as invalid (see is_selection_error), as long as no text has been shown yet.
+
+    Args:
+        registry: The ToolRegistry with the declarations.
+        mode: One of TOOL_SELECTION_MODES.
+    """
+
+    def __init__(self, registry, mode: str = "auto"):
+        if mode not in TOOL_SELECTION_MODES:
+            raise ValueError(f"Unknown TOOL_SELECTION '{mode}'. Valid modes are {TOOL_SELECTION_MODES}.")
+        self.registry = registry
+        self.mode = mode
+        self.names = [declaration["name"] for declaration in registry.declarations]
+        self.generators = [name for name in self.names if registry.is_generator(name)]
+        self.tokens = {declaration["name"]: declaration_tokens(declaration) for declaration in registry.declarations}
+        self._configs = {}
+        self._lock = threading.Lock()
+
+    def select(self, prompt: str, history: list, has_section: bool) -> dict:
+        """
+        Selects the tools for a model request of a turn.
+
+        Args:
+            prompt: The user prompt of the turn.
+            history: The conversation history.
+            has_section: True if the session has a section (meshed or estimated).
+
+        Returns:
+            A dict with the selected tool "names" in declaration order, the "reason" of the
+            selection, the estimated "tool_tokens" of the selected declarations and the
+            "saved_tokens" compared to sending all of them.
+        """
+        text = (prompt or "").lower()
+        searches = [name for name, words in SEARCH_WORDS.items() if mentions(text, words)]
+        generators = mentioned_generators(text, self.generators)
+        named = [name for name in self.names if name in text]
+
+        if self.mode == "all":
+            return self.selection(self.names, "all tools")
+        if not has_section and not generators and not searches:
+            return self.selection(self.names, "no section yet")
+
+        selected = set(COMMON_TOOLS + ANALYSIS_TOOLS + searches + generators + named)
+        if has_section:
+            current = latest_generator(history, self.registry.is_generator)
+            if current:
+                selected.add(current)
+            if mentions(text, NEW_SECTION_WORDS):
+                selected.update(self.generators)
+        reason = "section analysis" if has_section else "tools named in the prompt"
+        return self.selection([name for name in self.names if name in selected], reason)
+
+    def fallback(self, reason: str = "fallback") -> dict:
+        return self.selection(self.names, reason)
+
+    def selection(self, names: list, reason: str) -> dict:
+        tool_tokens = sum(self.tokens[name] for name in names)
+        return {
+            "names": names,
+            "reason": reason,
+            "pruned": len(names) < len(self.names),
+            "tool_tokens": tool_tokens,
+            "saved_tokens": sum(self.tokens.values()) - tool_tokens,
+        }
+
+    def config(self, base_config, selection: dict):
+        """
+        Returns a copy of the GenerateContentConfig with the selected tools, cached per selection.
+        """
+        from google.genai import types
+
+        if not selection["pruned"]:
+            return base_config
+        key = (id(base_config), tuple(selection["names"]))
+        with self._lock:
+            base, config = self._configs.get(key, (None, None))
+            if base is not base_config:
+                tool = types.Tool.model_validate({"function_declarations": [self.registry.declaration(name) for name in selection["names"]]})
+                config = base_config.model_copy(update={"tools": [tool]})
+                self._configs[key] = (base_config, config)
+            return config
+
+
+def tool_selector_from_env(registry) -> ToolSelector:
+    """
+    Creates a ToolSelector configured through the TOOL_SELECTION environment variable.
+    """
+    return ToolSelector(registry, os.getenv("TOOL_SELECTION", "auto"))
+
+
+_default_tool_selector = None
+_default_tool_selector_lock = threading.Lock()
+
+
+def default_tool_selector() -> ToolSelector:
+    """
+    Returns the process-wide ToolSelector of the default tool registry.
+    """
+    from tool_handlers import default_registry
+
+    global _default_tool_selector
+    with _default_tool_selector_lock:
+        if _default_tool_selector is None:
+            _default_tool_selector = tool_selector_from_env(default_registry())
+        return _default_tool_selector